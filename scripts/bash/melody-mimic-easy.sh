@@ -282,7 +282,8 @@ if [ "$needs_conversion" = true ] || [ "$FORCE_CONVERT" = true ]; then
       ],
       \"message\": \"准备将 MP3 转换为 MIDI\",
       \"confirm_prompt\": \"预计耗时 $estimated_time，是否开始转换?\",
-      \"python_command\": \"$PYTHON_CMD $SKILLS_SCRIPTS_DIR/audio_to_midi.py '$MP3_FILE' '$SONG_DIR'\"
+      \"python_command\": \"$PYTHON_CMD $SKILLS_SCRIPTS_DIR/audio_to_midi.py '$MP3_FILE' '$SONG_DIR'\",
+      \"queue_command\": \"$PYTHON_CMD $SKILLS_SCRIPTS_DIR/job_queue.py submit '$MP3_FILE' '$SONG_DIR'\"
     }"
     exit 0
 fi
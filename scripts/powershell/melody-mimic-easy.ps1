@@ -281,6 +281,7 @@ if ($needsConversion -or $forceConvert) {
         message = "准备将 MP3 转换为 MIDI"
         confirm_prompt = "预计耗时 $estimatedTime，是否开始转换?"
         python_command = "$pythonCmd `"$audioToMidiScript`" `"$mp3File`" `"$songDir`""
+        queue_command = "$pythonCmd `"$(Join-Path $skillsScriptsDir "job_queue.py")`" submit `"$mp3File`" `"$songDir`""
     }
     Write-Output ($result | ConvertTo-Json -Depth 10 -Compress)
     exit 0
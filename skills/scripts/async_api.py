@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+异步 API - 在 asyncio 应用中调用 MIDI 分析和 MP3 转 MIDI 流程
+
+- process_audio_async: 以 asyncio 子进程运行 audio_to_midi.py --progress，
+  实时读取 stderr 中的 JSON Lines 进度事件；支持取消和超时（整个进程组一并终止），
+  断点续跑、资源规划和共享 PCM 等逻辑与命令行完全一致
+- analyze_midi_file_async: 将 CPU 密集的 MIDI 分析放到进程池执行，不阻塞事件循环
+- analyze_batch_async: 限制并发的批量分析，结果顺序与输入一致
+
+用法:
+    python async_api.py <midi_file> [...] [--concurrency N]
+"""
+
+import os
+import re
+import sys
+import json
+import codecs
+import signal
+import asyncio
+import inspect
+import argparse
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from audio_to_midi import DEFAULT_TRANSCRIBER
+
+AUDIO_TO_MIDI_SCRIPT = Path(__file__).resolve().parent / "audio_to_midi.py"
+
+# 单行进度事件的上限，防止异常输出撑爆内存
+_STREAM_LIMIT = 1 << 20
+_READ_CHUNK = 4096
+
+_default_executor: Optional[ProcessPoolExecutor] = None
+
+ProgressCallback = Callable[[Dict[str, Any]], Any]
+
+
+def _get_default_executor() -> ProcessPoolExecutor:
+    """惰性创建共享进程池（分析器依赖 music21，导入较慢，进程复用能摊薄开销）"""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _default_executor
+
+
+def shutdown_executor():
+    """关闭默认进程池"""
+    global _default_executor
+    if _default_executor is not None:
+        _default_executor.shutdown(wait=True)
+        _default_executor = None
+
+
+def _analyze_in_worker(midi_path: str, lyrics_path: Optional[str]) -> Dict[str, Any]:
+    """进程池中执行的分析函数（模块级函数才能被 pickle）"""
+    from midi_analyzer import ProfessionalMidiAnalyzer
+    return ProfessionalMidiAnalyzer().analyze_midi_file(midi_path, lyrics_path)
+
+
+async def analyze_midi_file_async(midi_path: str,
+                                  lyrics_path: Optional[str] = None,
+                                  executor: Optional[Executor] = None) -> Dict[str, Any]:
+    """
+    异步分析 MIDI 文件
+
+    Args:
+        midi_path: MIDI 文件路径
+        lyrics_path: 歌词文件路径（可选）
+        executor: 自定义执行器（默认使用共享进程池）
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor or _get_default_executor(),
+                                      _analyze_in_worker, str(midi_path),
+                                      str(lyrics_path) if lyrics_path else None)
+
+
+async def analyze_batch_async(items: Iterable[Union[str, Tuple[str, Optional[str]]]],
+                              concurrency: Optional[int] = None,
+                              executor: Optional[Executor] = None) -> List[Dict[str, Any]]:
+    """
+    批量异步分析，单个文件失败不影响其他文件
+
+    Args:
+        items: MIDI 路径或 (MIDI 路径, 歌词路径) 元组
+        concurrency: 同时进行的分析数（默认 CPU 核心数）
+        executor: 自定义执行器
+    """
+    semaphore = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+
+    async def run_one(item):
+        midi_path, lyrics_path = (item, None) if isinstance(item, (str, Path)) else item
+        async with semaphore:
+            try:
+                return await analyze_midi_file_async(midi_path, lyrics_path, executor)
+            except Exception as e:
+                return {
+                    "status": "error",
+                    "error_type": type(e).__name__,
+                    "message": str(e),
+                    "midi_file": str(midi_path)
+                }
+
+    return await asyncio.gather(*(run_one(item) for item in items))
+
+
+async def _notify(on_progress: Optional[ProgressCallback], event: Dict[str, Any]):
+    if on_progress is None:
+        return
+    outcome = on_progress(event)
+    if inspect.isawaitable(outcome):
+        await outcome
+
+
+async def _pump_progress(stream: asyncio.StreamReader,
+                         on_progress: Optional[ProgressCallback],
+                         tail: List[str]):
+    """
+    逐行读取子进程 stderr；非 JSON 行（如 tqdm 进度条）作为 log 事件转发
+
+    与 run_tool 一样按 \\r 或 \\n 切分：进程内 Demucs 的 tqdm 进度条只用 \\r 刷新，
+    按 \n 读行会一直攒到进度条结束才有输出，还可能超过单行上限
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    while True:
+        chunk = await stream.read(_READ_CHUNK)
+        pending += decoder.decode(chunk, final=not chunk)
+        lines = re.split(r"[\r\n]", pending)
+        pending = lines.pop() if chunk else ""
+        if len(pending) > _STREAM_LIMIT:
+            lines.append(pending)
+            pending = ""
+        for line in lines:
+            text = line.strip()
+            if not text:
+                continue
+            try:
+                event = json.loads(text)
+            except ValueError:
+                event = None
+            if not isinstance(event, dict):
+                event = {"event": "log", "line": text}
+                tail.append(text)
+                del tail[:-20]
+            await _notify(on_progress, event)
+        if not chunk:
+            return
+
+
+def _terminate(proc: asyncio.subprocess.Process):
+    """终止子进程及其派生的 Demucs / Basic Pitch 进程"""
+    if proc.returncode is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def process_audio_async(input_mp3: str,
+                              output_dir: Optional[str] = None,
+                              transcriber: str = DEFAULT_TRANSCRIBER,
+                              on_progress: Optional[ProgressCallback] = None,
+                              timeout: Optional[float] = None,
+                              shared_pcm: bool = True,
+                              resume: bool = True,
+                              concurrent_jobs: Optional[int] = None,
+                              memory_budget_mb: Optional[int] = None,
+                              analyze: bool = False,
+                              lyrics_path: Optional[str] = None,
+                              export_midi: bool = True,
+                              dedup: bool = True,
+                              vad: bool = True) -> Dict[str, Any]:
+    """
+    异步执行 MP3 转 MIDI 完整流程
+
+    其余参数与 process_audio 相同，转换为对应的命令行选项
+
+    Args:
+        on_progress: 进度回调（普通函数或协程），参数为事件字典：
+            {"event": "step", "step": 1, "name": ..., "status": ...}
+            {"event": "tool_output", "tool": "Demucs", "line": ...}
+            {"event": "log", "line": ...}
+        timeout: 整体超时秒数，超时后终止子进程并返回错误结果
+
+    Returns:
+        与 process_audio 相同的结果字典；任务被取消时终止子进程并重新抛出 CancelledError
+    """
+    cmd = [sys.executable, str(AUDIO_TO_MIDI_SCRIPT), str(input_mp3)]
+    if output_dir:
+        cmd.append(str(output_dir))
+    cmd += ["--transcriber", transcriber, "--progress"]
+    if not shared_pcm:
+        cmd.append("--no-shared-pcm")
+    if not resume:
+        cmd.append("--no-resume")
+    if concurrent_jobs:
+        cmd += ["--concurrent-jobs", str(concurrent_jobs)]
+    if memory_budget_mb:
+        cmd += ["--memory-budget", str(memory_budget_mb)]
+    if analyze:
+        cmd.append("--analyze")
+    if lyrics_path:
+        cmd += ["--lyrics", str(lyrics_path)]
+    if not export_midi:
+        cmd.append("--no-midi")
+    if not dedup:
+        cmd.append("--no-dedup")
+    if not vad:
+        cmd.append("--no-vad")
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=_STREAM_LIMIT,
+        start_new_session=True  # 独立进程组，便于整组终止
+    )
+
+    stderr_tail: List[str] = []
+
+    async def run():
+        pump = asyncio.create_task(_pump_progress(proc.stderr, on_progress, stderr_tail))
+        stdout = await proc.stdout.read()
+        await pump
+        await proc.wait()
+        return stdout
+
+    try:
+        stdout = await asyncio.wait_for(run(), timeout)
+    except asyncio.TimeoutError:
+        _terminate(proc)
+        await proc.wait()
+        return {
+            "status": "error",
+            "error": f"处理超时 (超过 {timeout} 秒)",
+            "input_file": str(input_mp3)
+        }
+    except BaseException:
+        # 包括 CancelledError：不留下孤儿进程
+        _terminate(proc)
+        await asyncio.shield(proc.wait())
+        raise
+
+    try:
+        return json.loads(stdout.decode("utf-8"))
+    except ValueError:
+        return {
+            "status": "error",
+            "error": f"无法解析处理结果 (退出码 {proc.returncode})",
+            "stderr": "\n".join(stderr_tail),
+            "input_file": str(input_mp3)
+        }
+
+
+def main():
+    """命令行入口：并发分析多个 MIDI 文件"""
+    parser = argparse.ArgumentParser(description="异步批量 MIDI 分析")
+    parser.add_argument("midi_files", nargs="+", help="MIDI 文件路径")
+    parser.add_argument("--concurrency", type=int, help="同时进行的分析数（默认 CPU 核心数）")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(analyze_batch_async(args.midi_files, args.concurrency))
+    finally:
+        shutdown_executor()
+
+    print(json.dumps({
+        "status": "success",
+        "file_count": len(results),
+        "results": results
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
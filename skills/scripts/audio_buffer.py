@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+共享 PCM 缓冲区 - 音频只解码一次，各处理阶段零拷贝读取
+
+ffmpeg 单次解码输入文件，同时输出多个 (采样率, 声道) 布局的 float32 裸 PCM，
+每个缓冲区旁边有一个 JSON 描述文件。后续阶段（人声分离、音高追踪、分析）
+通过 numpy.memmap 直接映射读取，不再各自解码和重采样。
+
+解码得到的输入缓冲区只是单次运行的中间产物（每首歌约 85 MB），由调用方在
+用完后通过 remove_buffer() 删除。缓冲区文件名包含输入内容的 SHA-256 前缀，
+同名的不同输入不会互相复用；写入先落到带进程号的临时文件再原子替换，并发任务互不干扰。
+
+用法:
+    python audio_buffer.py <input_audio> <cache_dir>
+"""
+
+import os
+import sys
+import json
+import uuid
+import wave
+import shutil
+import subprocess
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from checkpoint import file_digest
+
+# Demucs (htdemucs) 的输入布局
+SEPARATION_LAYOUT = (44100, 2)
+
+# 每次写出 WAV 的帧数，避免一次性生成整段 int16 副本
+_WAV_CHUNK_FRAMES = 1 << 18
+
+
+@dataclass
+class PcmBuffer:
+    """磁盘上的 float32 交错 PCM 缓冲区"""
+    path: str
+    sample_rate: int
+    channels: int
+    frames: int
+
+    def array(self, writable: bool = False) -> np.ndarray:
+        """
+        以 (frames, channels) 形状映射缓冲区
+
+        Args:
+            writable: 为 True 时使用写时复制映射（供要求可写数组的库使用，不会改动磁盘文件）
+        """
+        return np.memmap(self.path, dtype=np.float32, mode='c' if writable else 'r',
+                         shape=(self.frames, self.channels))
+
+    def mono(self) -> np.ndarray:
+        """单声道采样；单声道缓冲区直接返回映射视图"""
+        data = self.array()
+        if self.channels == 1:
+            return data[:, 0]
+        return data.mean(axis=1, dtype=np.float32)
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+    def to_dict(self) -> Dict:
+        result = asdict(self)
+        result["duration_seconds"] = round(self.duration, 3)
+        return result
+
+
+def buffer_path(cache_dir: Path, stem: str, layout: Tuple[int, int]) -> Path:
+    """缓冲区文件命名: <stem>.<sr>hz.<ch>ch.f32（解码缓冲区的 stem 含输入内容摘要）"""
+    sample_rate, channels = layout
+    return Path(cache_dir) / f"{stem}.{sample_rate}hz.{channels}ch.f32"
+
+
+def meta_path(path: Path) -> Path:
+    """缓冲区描述文件路径: <缓冲区>.json"""
+    return Path(str(path) + ".json")
+
+
+def _part_path(path: Path) -> Path:
+    """写入中的临时文件：带进程号和随机后缀，同一目标的并发写入互不覆盖"""
+    return path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.part")
+
+
+def open_buffer(path) -> Optional[PcmBuffer]:
+    """根据描述文件打开已有缓冲区，文件不完整时返回 None"""
+    path = Path(path)
+    meta_file = meta_path(path)
+    if not path.exists() or not meta_file.exists():
+        return None
+
+    try:
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    expected = meta["frames"] * meta["channels"] * 4
+    if path.stat().st_size != expected:
+        return None
+
+    return PcmBuffer(str(path), meta["sample_rate"], meta["channels"], meta["frames"])
+
+
+def _write_meta(path: Path, sample_rate: int, channels: int) -> PcmBuffer:
+    frames = path.stat().st_size // (4 * channels)
+    meta = {"sample_rate": sample_rate, "channels": channels, "frames": frames, "dtype": "float32"}
+    part = _part_path(meta_path(path))
+    with open(part, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    part.replace(meta_path(path))
+    return PcmBuffer(str(path), sample_rate, channels, frames)
+
+
+def decode_audio(input_path,
+                 cache_dir,
+                 layouts: List[Tuple[int, int]] = (SEPARATION_LAYOUT,),
+                 input_digest: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    使用 ffmpeg 单次解码，输出所需的全部 PCM 布局
+
+    Args:
+        input_path: 输入音频文件
+        cache_dir: 缓冲区目录
+        layouts: [(采样率, 声道数), ...]
+        input_digest: 输入文件的 SHA-256（调用方已计算时传入，否则在此计算）
+
+    Returns:
+        ({layout: PcmBuffer}, error)
+    """
+    input_path = Path(input_path)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # 按输入内容命名：内容相同才复用，同名的不同文件各自解码
+    stem = f"{input_path.stem}.{(input_digest or file_digest(input_path))[:16]}"
+    buffers = {}
+    pending = []
+    for layout in dict.fromkeys(layouts):
+        path = buffer_path(cache_dir, stem, layout)
+        existing = open_buffer(path)
+        if existing:
+            buffers[layout] = existing
+        else:
+            pending.append((layout, path, _part_path(path)))
+
+    if not pending:
+        return buffers, None
+
+    if shutil.which("ffmpeg") is None:
+        return None, "未找到 ffmpeg，无法解码音频"
+
+    # 一个输入，多个输出：解码只发生一次
+    cmd = ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", str(input_path)]
+    for (sample_rate, channels), path, part in pending:
+        cmd += ["-map", "0:a:0", "-ac", str(channels), "-ar", str(sample_rate),
+                "-f", "f32le", str(part)]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        error = None if result.returncode == 0 else f"ffmpeg 解码失败: {result.stderr.strip()}"
+    except subprocess.TimeoutExpired:
+        error = "ffmpeg 解码超时 (超过 10 分钟)"
+    except Exception as e:
+        error = f"ffmpeg 执行异常: {str(e)}"
+
+    if error:
+        for _, _, part in pending:
+            part.unlink(missing_ok=True)
+        return None, error
+
+    for (sample_rate, channels), path, part in pending:
+        part.replace(path)
+        buffers[(sample_rate, channels)] = _write_meta(path, sample_rate, channels)
+
+    return buffers, None
+
+
+def write_buffer(path, samples: np.ndarray, sample_rate: int) -> PcmBuffer:
+    """将 (frames, channels) 采样写为 PCM 缓冲区（先写临时文件再原子替换）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim == 1:
+        samples = samples[:, None]
+
+    part = _part_path(path)
+    out = np.memmap(part, dtype=np.float32, mode='w+', shape=samples.shape)
+    out[:] = samples
+    out.flush()
+    del out
+    part.replace(path)
+
+    return _write_meta(path, sample_rate, samples.shape[1])
+
+
+def remove_buffer(path):
+    """删除缓冲区及其描述文件（不存在时忽略）"""
+    for target in (Path(path), meta_path(Path(path))):
+        target.unlink(missing_ok=True)
+
+
+def export_wav(pcm: PcmBuffer, wav_path, mono: bool = False) -> str:
+    """将缓冲区分块导出为 16-bit PCM WAV（供只接受文件路径的外部工具使用）"""
+    data = pcm.array()
+    channels = 1 if mono else pcm.channels
+
+    with wave.open(str(wav_path), 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(pcm.sample_rate)
+        for start in range(0, pcm.frames, _WAV_CHUNK_FRAMES):
+            chunk = data[start:start + _WAV_CHUNK_FRAMES]
+            if mono and pcm.channels > 1:
+                chunk = chunk.mean(axis=1, keepdims=True)
+            pcm16 = np.clip(np.rint(chunk * 32767.0), -32768, 32767).astype('<i2')
+            wav.writeframes(pcm16.tobytes())
+
+    return str(wav_path)
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 3:
+        print(json.dumps({
+            "status": "error",
+            "error": "缺少参数",
+            "usage": "python audio_buffer.py <input_audio> <cache_dir>"
+        }, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    buffers, error = decode_audio(sys.argv[1], sys.argv[2])
+    if error:
+        print(json.dumps({"status": "error", "error": error}, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    print(json.dumps({
+        "status": "success",
+        "buffers": [pcm.to_dict() for pcm in buffers.values()]
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
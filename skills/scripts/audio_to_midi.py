@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """
 MP3 转 MIDI 工具
-使用 Demucs 分离人声 + Basic Pitch 转换 MIDI
+使用 Demucs 分离人声 + Basic Pitch (或内置 YIN 音高追踪) 转换 MIDI
 
 用法:
     python audio_to_midi.py <input_mp3> [output_dir]
+    python audio_to_midi.py <input_mp3> [output_dir] --transcriber yin
     python audio_to_midi.py --check  # 检查依赖和硬件
 
 输出:
@@ -13,18 +14,123 @@ MP3 转 MIDI 工具
 
 import sys
 import os
+import re
 import json
+import codecs
+import contextlib
+import itertools
+import threading
 import subprocess
 import shutil
+import argparse
 from pathlib import Path
 from datetime import datetime
 
+from checkpoint import StepManifest, params_key
+
+# 可选的 MIDI 转写器: 名称 -> (显示名, 所需依赖)
+TRANSCRIBERS = {
+    "basic_pitch": ("Basic Pitch", "basic_pitch"),
+    "yin": ("YIN 音高追踪 (内置)", "numpy"),
+}
+DEFAULT_TRANSCRIBER = "basic_pitch"
+
+# Demucs 默认模型（输出目录名同模型名）
+DEMUCS_MODEL = "htdemucs"
+
+# htdemucs 训练片段约 7.8 秒，--segment 只能取不超过它的整数
+DEMUCS_MAX_SEGMENT = 7
+DEMUCS_MIN_SEGMENT = 2
+
+# CPU 分离的内存估算 (MB)：进程基础占用 + 每个并行分块按片段秒数线性增长
+DEMUCS_BASE_MEMORY_MB = 1000
+DEMUCS_MEMORY_PER_SEGMENT_SECOND_MB = 180
+
+# 单个分块的卷积超过该线程数后扩展性明显下降，多余核心改用并行分块。
+# Demucs 的并行分块（-j / num_workers）是同一进程内的线程，共用一个 torch 线程池，
+# 因此线程池大小取本任务的全部核数，而不是按分块数均分
+THREADS_PER_DEMUCS_WORKER = 4
+
+# Basic Pitch 转写超时（秒）；演唱区段并行时的线程数（推理本身使用共享线程池）
+TRANSCRIBE_TIMEOUT = 300
+BASIC_PITCH_REGION_WORKERS = 2
+
+# 是否向 stderr 输出 JSON Lines 进度事件（--progress，供 async_api 等调用方实时读取）
+_PROGRESS = False
+
 
 def output_json(data):
     """输出 JSON 格式结果"""
     print(json.dumps(data, ensure_ascii=False, indent=2))
 
 
+def enable_progress(enabled=True):
+    """开启/关闭 stderr 进度事件输出"""
+    global _PROGRESS
+    _PROGRESS = enabled
+
+
+def emit_progress(event):
+    """输出一行 JSON 进度事件到 stderr"""
+    if _PROGRESS:
+        sys.stderr.write(json.dumps(event, ensure_ascii=False) + "\n")
+        sys.stderr.flush()
+
+
+def run_tool(cmd, timeout, tool, env=None):
+    """
+    执行外部工具，返回 CompletedProcess（文本输出）
+
+    开启进度输出时逐行转发工具的 stderr（按 \\r 或 \\n 切分，兼容 tqdm 进度条）
+    """
+    if not _PROGRESS:
+        return subprocess.run(cmd, capture_output=True, text=True, env=env, timeout=timeout)
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    stdout_chunks = []
+    stderr_lines = []
+
+    def pump_stderr():
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        while True:
+            chunk = os.read(proc.stderr.fileno(), 4096)
+            pending += decoder.decode(chunk, final=not chunk)
+            parts = re.split(r"[\r\n]", pending)
+            pending = parts.pop() if chunk else ""
+            for line in parts:
+                if line.strip():
+                    stderr_lines.append(line)
+                    emit_progress({"event": "tool_output", "tool": tool, "line": line})
+            if not chunk:
+                return
+
+    readers = [
+        threading.Thread(target=pump_stderr, daemon=True),
+        threading.Thread(target=lambda: stdout_chunks.append(proc.stdout.read()), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+
+    stdout = b"".join(stdout_chunks).decode("utf-8", errors="replace")
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, "\n".join(stderr_lines))
+
+
+def _emit_step(step):
+    """输出步骤状态变化事件"""
+    emit_progress(dict(step, event="step"))
+
+
 def detect_hardware():
     """检测可用硬件加速"""
     try:
@@ -55,12 +161,124 @@ def detect_hardware():
     }
 
 
+def detect_resources():
+    """检测可用 CPU 核数、总内存和可用内存 (MB)"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    total_mb = available_mb = None
+    try:
+        import psutil
+        memory = psutil.virtual_memory()
+        total_mb = memory.total // (1024 * 1024)
+        available_mb = memory.available // (1024 * 1024)
+    except ImportError:
+        try:
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    if line.startswith("MemTotal:"):
+                        total_mb = int(line.split()[1]) // 1024
+                    elif line.startswith("MemAvailable:"):
+                        available_mb = int(line.split()[1]) // 1024
+        except OSError:
+            pass
+
+    return {"cores": cores, "total_memory_mb": total_mb, "available_memory_mb": available_mb}
+
+
+def _env_concurrent_jobs():
+    """读取 MUSICIFY_CONCURRENT_JOBS；未设置或取值无效时按单任务处理"""
+    try:
+        return max(1, int(os.environ.get("MUSICIFY_CONCURRENT_JOBS", "1")))
+    except ValueError:
+        return 1
+
+
+def plan_resources(hardware, concurrent_jobs=None, memory_budget_mb=None):
+    """
+    根据核数、可用内存和同机并发任务数规划 Demucs 参数
+
+    Args:
+        hardware: detect_hardware() 结果
+        concurrent_jobs: 同一机器上同时运行的转换任务数（默认读取 MUSICIFY_CONCURRENT_JOBS）
+        memory_budget_mb: 单个任务的内存预算（默认为总内存的 80% 按任务均分，且不超过当前可用内存的 80%）
+
+    Returns:
+        规划结果字典（threads / demucs_jobs / segment / shifts 等）
+    """
+    resources = detect_resources()
+    if concurrent_jobs is None:
+        concurrent_jobs = _env_concurrent_jobs()
+    concurrent_jobs = max(1, concurrent_jobs)
+
+    cores_per_job = max(1, resources["cores"] // concurrent_jobs)
+    if memory_budget_mb is None:
+        # 可用内存已经扣除了其他运行中任务的占用，不能再按任务数均分；
+        # 均分的是总内存，再以当前可用内存封顶
+        budgets = []
+        if resources["total_memory_mb"]:
+            budgets.append(resources["total_memory_mb"] * 0.8 / concurrent_jobs)
+        if resources["available_memory_mb"]:
+            budgets.append(resources["available_memory_mb"] * 0.8)
+        memory_budget_mb = int(min(budgets)) if budgets else None
+
+    plan = {
+        "cores": resources["cores"],
+        "total_memory_mb": resources["total_memory_mb"],
+        "available_memory_mb": resources["available_memory_mb"],
+        "concurrent_jobs": concurrent_jobs,
+        "memory_budget_mb": memory_budget_mb,
+        "threads": cores_per_job,
+        "demucs_jobs": 0,
+        "segment": None,
+        "shifts": 1,
+    }
+
+    # GPU 上显存是瓶颈，沿用 Demucs 默认分块
+    if hardware["device"] != "cpu":
+        plan["threads"] = min(cores_per_job, THREADS_PER_DEMUCS_WORKER)
+        return plan
+
+    # 先按核数决定并行分块数，再在内存预算内选取最大片段，放不下时减少分块
+    workers = max(1, cores_per_job // THREADS_PER_DEMUCS_WORKER)
+    segment = DEMUCS_MAX_SEGMENT
+    if memory_budget_mb:
+        def fits(w, seg):
+            return DEMUCS_BASE_MEMORY_MB + w * seg * DEMUCS_MEMORY_PER_SEGMENT_SECOND_MB <= memory_budget_mb
+
+        while workers > 1 and not fits(workers, segment):
+            workers -= 1
+        while segment > DEMUCS_MIN_SEGMENT and not fits(workers, segment):
+            segment -= 1
+
+    estimated_mb = DEMUCS_BASE_MEMORY_MB + workers * segment * DEMUCS_MEMORY_PER_SEGMENT_SECOND_MB
+    plan.update({
+        "threads": cores_per_job,
+        "demucs_jobs": workers if workers > 1 else 0,
+        "segment": segment,
+        "estimated_peak_memory_mb": estimated_mb,
+        "within_budget": memory_budget_mb is None or estimated_mb <= memory_budget_mb,
+    })
+    return plan
+
+
+def _thread_env(threads):
+    """限制子进程数学库线程数的环境变量"""
+    env = os.environ.copy()
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        env[name] = str(threads)
+    return env
+
+
 def check_dependencies():
     """检查依赖是否安装"""
     dependencies = {
         "demucs": {"installed": False, "version": None},
         "basic_pitch": {"installed": False, "version": None},
         "torch": {"installed": False, "version": None},
+        "numpy": {"installed": False, "version": None},
     }
 
     try:
@@ -84,15 +302,27 @@ def check_dependencies():
     except ImportError:
         pass
 
+    try:
+        import numpy
+        dependencies["numpy"]["installed"] = True
+        dependencies["numpy"]["version"] = numpy.__version__
+    except ImportError:
+        pass
+
     return dependencies
 
 
+def required_dependencies(transcriber=DEFAULT_TRANSCRIBER):
+    """返回指定转写器所需的依赖列表"""
+    return ["demucs", TRANSCRIBERS[transcriber][1]]
+
+
 def check_command_available(cmd):
     """检查命令行工具是否可用"""
     return shutil.which(cmd) is not None
 
 
-def separate_vocals(input_mp3, output_dir, device="cpu"):
+def separate_vocals(input_mp3, output_dir, device="cpu", pcm=None, plan=None):
     """
     使用 Demucs 分离人声
 
@@ -100,13 +330,18 @@ def separate_vocals(input_mp3, output_dir, device="cpu"):
         input_mp3: 输入 MP3 文件路径
         output_dir: 输出目录
         device: 使用的设备 (cuda/mps/cpu)
+        pcm: 已解码的共享 PCM 缓冲区 (可选)；提供时在进程内分离，不再重复解码
+        plan: plan_resources() 生成的线程与分块参数 (可选)
 
     Returns:
-        vocals_path: 人声文件路径
+        vocals_path: 人声 WAV 文件路径（进程内分离时旁边另有同名 .f32 PCM 缓冲区，见 vocals_buffer_path）
     """
     input_path = Path(input_mp3)
     output_path = Path(output_dir)
 
+    if pcm is not None:
+        return _separate_in_process(pcm, output_path / DEMUCS_MODEL / input_path.stem, device, plan)
+
     # 构建 demucs 命令
     cmd = [
         sys.executable, "-m", "demucs",
@@ -115,17 +350,21 @@ def separate_vocals(input_mp3, output_dir, device="cpu"):
         "--device", device if device != "mps" else "mps",
     ]
 
+    env = None
+    if plan:
+        cmd += ["--shifts", str(plan["shifts"])]
+        if plan["segment"]:
+            cmd += ["--segment", str(plan["segment"])]
+        if plan["demucs_jobs"]:
+            cmd += ["-j", str(plan["demucs_jobs"])]
+        env = _thread_env(plan["threads"])
+
     # 添加输入文件
     cmd.append(str(input_path))
 
     # 执行命令
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=1800  # 30 分钟超时
-        )
+        result = run_tool(cmd, timeout=1800, tool="Demucs", env=env)  # 30 分钟超时
 
         if result.returncode != 0:
             return None, f"Demucs 执行失败: {result.stderr}"
@@ -133,7 +372,7 @@ def separate_vocals(input_mp3, output_dir, device="cpu"):
         # 查找输出的人声文件
         # Demucs 输出格式: output_dir/htdemucs/song_name/vocals.wav
         song_name = input_path.stem
-        vocals_path = output_path / "htdemucs" / song_name / "vocals.wav"
+        vocals_path = output_path / DEMUCS_MODEL / song_name / "vocals.wav"
 
         if not vocals_path.exists():
             # 尝试其他可能的路径
@@ -145,6 +384,9 @@ def separate_vocals(input_mp3, output_dir, device="cpu"):
                         break
 
         if vocals_path.exists():
+            # 清掉之前进程内分离留下的缓冲区，避免与新的 WAV 不一致
+            from audio_buffer import remove_buffer
+            remove_buffer(vocals_path.with_suffix(".f32"))
             return str(vocals_path), None
         else:
             return None, f"未找到人声文件，请检查 {output_path} 目录"
@@ -155,17 +397,116 @@ def separate_vocals(input_mp3, output_dir, device="cpu"):
         return None, f"Demucs 执行异常: {str(e)}"
 
 
-def convert_to_midi(vocals_wav, output_dir):
+def _separate_in_process(pcm, stem_dir, device="cpu", plan=None):
+    """
+    在进程内调用 Demucs 模型，直接读取共享 PCM 缓冲区
+
+    只写出人声分轨：float32 PCM 缓冲区 vocals.f32 供后续转写直接映射，
+    以及同内容的 vocals.wav 作为对外产物；不再写伴奏 WAV
     """
-    使用 Basic Pitch 将人声转换为 MIDI
+    try:
+        import torch
+        from demucs.pretrained import get_model
+        from demucs.apply import apply_model
+        from audio_buffer import write_buffer, export_wav
+
+        plan = plan or {"threads": None, "demucs_jobs": 0, "segment": None, "shifts": 1}
+        if plan["threads"]:
+            torch.set_num_threads(plan["threads"])
+
+        model = get_model(DEMUCS_MODEL)
+        model.eval()
+
+        if (pcm.sample_rate, pcm.channels) != (model.samplerate, model.audio_channels):
+            return None, f"PCM 缓冲区布局与 Demucs 模型不匹配: {pcm.sample_rate}Hz/{pcm.channels}ch"
+
+        # (frames, channels) 写时复制映射的转置视图交给 torch，原地归一化：
+        # 只有被写到的页复制进内存，不再另外分配一份归一化后的张量
+        wav = torch.from_numpy(pcm.array(writable=True).T)
+        ref = wav.mean(0)
+        mean, std = ref.mean(), ref.std()
+        wav.sub_(mean).div_(std)
+
+        with torch.no_grad():
+            sources = apply_model(model, wav[None], device=device,
+                                  shifts=plan["shifts"], split=True, overlap=0.25, progress=_PROGRESS,
+                                  num_workers=plan["demucs_jobs"], segment=plan["segment"])[0]
+        vocals = sources[model.sources.index("vocals")] * std + mean
+
+        vocals_pcm = write_buffer(Path(stem_dir) / "vocals.f32", vocals.T.cpu().numpy(), model.samplerate)
+        return export_wav(vocals_pcm, Path(stem_dir) / "vocals.wav"), None
+
+    except ImportError as e:
+        return None, f"Demucs 进程内分离缺少依赖: {str(e)}"
+    except Exception as e:
+        return None, f"Demucs 执行异常: {str(e)}"
+
+
+def _is_pcm_buffer(path):
+    return str(path).endswith(".f32")
+
+
+def vocals_buffer_path(vocals_wav):
+    """人声 WAV 旁边完整的 .f32 PCM 缓冲区路径（进程内分离时写出），没有时返回 None"""
+    if not vocals_wav:
+        return None
+    if _is_pcm_buffer(vocals_wav):
+        return str(vocals_wav)
+    try:
+        from audio_buffer import open_buffer
+    except ImportError:
+        return None
+    pcm = open_buffer(Path(vocals_wav).with_suffix(".f32"))
+    return pcm.path if pcm else None
+
+
+def _transcription_source(vocals_wav, vocals_buffer, transcriber, vad):
+    """转写输入：在进程内读取采样时（YIN、区段转写）映射 PCM 缓冲区，整文件 Basic Pitch 直接读 WAV"""
+    if vocals_buffer and (vad or transcriber == "yin"):
+        return vocals_buffer
+    return vocals_wav
+
+
+def _release_buffers(buffers):
+    """删除本次运行解码出的输入缓冲区（.pcm 目录下的中间产物）"""
+    try:
+        from audio_buffer import remove_buffer
+    except ImportError:
+        return
+    for pcm in buffers.values():
+        remove_buffer(pcm.path)
+        try:
+            Path(pcm.path).parent.rmdir()
+        except OSError:
+            pass  # 目录里还有其他任务的缓冲区
+
+
+def convert_to_midi(vocals_wav, output_dir, transcriber=DEFAULT_TRANSCRIBER):
+    """
+    将人声转换为 MIDI
 
     Args:
-        vocals_wav: 人声 WAV 文件路径
+        vocals_wav: 人声 WAV 文件或 PCM 缓冲区路径
         output_dir: 输出目录
+        transcriber: 转写器 (basic_pitch/yin)
 
     Returns:
         midi_path: MIDI 文件路径
     """
+    if transcriber == "yin":
+        return _convert_with_yin(vocals_wav, output_dir)
+
+    if _is_pcm_buffer(vocals_wav):
+        # Basic Pitch 只接受文件路径，且内部会转为单声道：导出单声道 16-bit WAV
+        try:
+            from audio_buffer import open_buffer, export_wav
+            pcm = open_buffer(vocals_wav)
+            if pcm is None:
+                return None, f"人声缓冲区不完整: {vocals_wav}"
+            vocals_wav = export_wav(pcm, Path(vocals_wav).with_suffix(".mono.wav"), mono=True)
+        except Exception as e:
+            return None, f"导出人声 WAV 失败: {str(e)}"
+
     vocals_path = Path(vocals_wav)
     output_path = Path(output_dir)
 
@@ -177,12 +518,7 @@ def convert_to_midi(vocals_wav, output_dir):
     ]
 
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 分钟超时
-        )
+        result = run_tool(cmd, timeout=300, tool="Basic Pitch")  # 5 分钟超时
 
         if result.returncode != 0:
             return None, f"Basic Pitch 执行失败: {result.stderr}"
@@ -206,13 +542,272 @@ def convert_to_midi(vocals_wav, output_dir):
         return None, f"Basic Pitch 执行异常: {str(e)}"
 
 
-def process_audio(input_mp3, output_dir=None):
+def _convert_with_yin(vocals_wav, output_dir):
+    """使用内置 YIN 音高追踪在进程内将人声转换为 MIDI"""
+    vocals_path = Path(vocals_wav)
+    midi_path = Path(output_dir) / (vocals_path.stem + "_yin.mid")
+
+    try:
+        if _is_pcm_buffer(vocals_path):
+            from audio_buffer import open_buffer
+            from pitch_tracker import transcribe_samples
+            pcm = open_buffer(vocals_path)
+            if pcm is None:
+                return None, f"人声缓冲区不完整: {vocals_path}"
+            transcribe_samples(pcm.mono(), pcm.sample_rate, str(midi_path))
+        else:
+            from pitch_tracker import transcribe_file
+            transcribe_file(str(vocals_path), str(midi_path))
+        return str(midi_path), None
+    except ImportError as e:
+        return None, f"YIN 音高追踪缺少依赖: {str(e)}"
+    except Exception as e:
+        return None, f"YIN 音高追踪执行异常: {str(e)}"
+
+
+def _load_vocals(vocals_wav):
+    """读取人声为单声道采样（PCM 缓冲区直接映射，WAV 重采样到音高追踪采样率）"""
+    if _is_pcm_buffer(vocals_wav):
+        from audio_buffer import open_buffer
+        pcm = open_buffer(vocals_wav)
+        if pcm is None:
+            raise ValueError(f"人声缓冲区不完整: {vocals_wav}")
+        return pcm.mono(), pcm.sample_rate
+
+    from pitch_tracker import load_audio
+    return load_audio(str(vocals_wav))
+
+
+def _basic_pitch_notes(note_events):
+    """Basic Pitch note_events: [(开始秒, 结束秒, 音高, 振幅, 弯音), ...] -> NoteEvents"""
+    import numpy as np
+    from pitch_tracker import NoteEvents
+
+    events = sorted(note_events, key=lambda event: event[0])
+    return NoteEvents(
+        start=np.array([e[0] for e in events], dtype=np.float64),
+        end=np.array([e[1] for e in events], dtype=np.float64),
+        pitch=np.array([e[2] for e in events], dtype=np.int64),
+        velocity=np.array([int(round(127 * e[3])) for e in events], dtype=np.int64)
+    )
+
+
+def _segment_transcriber(transcriber, work_dir):
+    """返回 (区段采样, 采样率) -> NoteEvents 的转写函数，供演唱区段并行调用"""
+    if transcriber == "yin":
+        from pitch_tracker import detect_notes
+        return lambda samples, sr: detect_notes(samples, sr)[0]
+
+    from voice_activity import write_wav
+    from basic_pitch import ICASSP_2022_MODEL_PATH
+    from basic_pitch.inference import predict
+    try:
+        # 模型只加载一次，各区段共用
+        from basic_pitch.inference import Model
+        model = Model(ICASSP_2022_MODEL_PATH)
+    except ImportError:
+        model = ICASSP_2022_MODEL_PATH
+
+    counter = itertools.count()
+
+    def transcribe(samples, sr):
+        # Basic Pitch 只接受文件路径
+        wav_path = write_wav(samples, sr, Path(work_dir) / f"segment_{next(counter)}.wav")
+        _, _, note_events = predict(wav_path, model)
+        return _basic_pitch_notes(note_events)
+
+    return transcribe
+
+
+def transcribe_notes(vocals_wav, transcriber=DEFAULT_TRANSCRIBER, vad=False, cores=None,
+                     timeout=TRANSCRIBE_TIMEOUT):
+    """
+    在进程内将人声转写为音符事件（秒），不写出 MIDI 文件
+
+    Args:
+        vad: 先检测演唱区段，只转写这些区段（前奏、间奏、尾奏不送入转写器）
+        cores: 本任务可用的核数，决定区段并行线程数和推理线程数
+        timeout: Basic Pitch 转写的超时秒数（在子进程中运行，超时即终止）
+
+    Returns:
+        (NoteEvents, VoicedRegions 或 None, error)；音符时间均在原始时间轴上
+    """
+    cores = max(1, cores or os.cpu_count() or 1)
+    if transcriber == "basic_pitch":
+        return _transcribe_in_worker(vocals_wav, transcriber, vad, cores, timeout)
+    return _transcribe(vocals_wav, transcriber, vad, cores)
+
+
+def _transcribe_in_worker(vocals_wav, transcriber, vad, cores, timeout):
+    """
+    在子进程中运行 Basic Pitch 转写
+
+    predict() 会向 stdout 打印进度，破坏本脚本的 JSON 输出；进程内推理也无法在超时后中断。
+    子进程中把 stdout 重定向到 stderr，超时后直接终止子进程。
+    """
+    import multiprocessing
+    import tempfile
+
+    name = TRANSCRIBERS[transcriber][0]
+    # 仅 Linux 使用 fork；Windows 不支持 fork，macOS 在导入 torch/MPS 后 fork 不安全，使用平台默认方式
+    context = multiprocessing.get_context("fork") if sys.platform.startswith("linux") else multiprocessing.get_context()
+
+    # 区段 WAV 目录由父进程创建和清理，子进程被终止时也不会遗留
+    with tempfile.TemporaryDirectory(prefix="musicify-vad-") as work_root:
+        try:
+            pool = context.Pool(1)
+        except (OSError, ValueError) as e:
+            return None, None, f"{name} 无法启动转写子进程: {str(e)}"
+        try:
+            pending = pool.apply_async(_basic_pitch_worker, (str(vocals_wav), transcriber, vad, cores, work_root))
+            return pending.get(timeout)
+        except multiprocessing.TimeoutError:
+            return None, None, f"{name} 处理超时 (超过 {timeout} 秒)"
+        except Exception as e:
+            # 子进程异常退出或结果无法回传
+            return None, None, f"{name} 转写子进程失败: {str(e)}"
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def _basic_pitch_worker(vocals_wav, transcriber, vad, cores, work_root):
+    # TensorFlow 的算子线程池为进程级共享，各区段线程共用，大小设为本任务核数；
+    # 其余数学库只在区段线程中做前处理，限制为单线程，避免 线程数 × 推理线程 超订
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(cores)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = "1"
+
+    with contextlib.redirect_stdout(sys.stderr):
+        return _transcribe(vocals_wav, transcriber, vad, cores, work_root)
+
+
+def _region_workers(transcriber, cores):
+    """区段并行线程数：YIN 每个线程单核计算，Basic Pitch 共用推理线程池，只需少量线程交替前处理"""
+    if transcriber == "yin":
+        return cores
+    return min(cores, BASIC_PITCH_REGION_WORKERS)
+
+
+def _transcribe(vocals_wav, transcriber, vad, cores, work_root=None):
+    try:
+        if vad:
+            import tempfile
+            from voice_activity import detect_voiced_regions, transcribe_regions
+
+            samples, sr = _load_vocals(vocals_wav)
+            regions = detect_voiced_regions(samples, sr)
+            with tempfile.TemporaryDirectory(prefix="musicify-vad-", dir=work_root) as work_dir:
+                notes = transcribe_regions(samples, sr, regions,
+                                           _segment_transcriber(transcriber, work_dir),
+                                           _region_workers(transcriber, cores))
+            return notes, regions, None
+
+        if transcriber == "yin":
+            from pitch_tracker import detect_notes
+            notes, _ = detect_notes(*_load_vocals(vocals_wav))
+            return notes, None, None
+
+        if _is_pcm_buffer(vocals_wav):
+            from audio_buffer import open_buffer, export_wav
+            pcm = open_buffer(vocals_wav)
+            if pcm is None:
+                return None, None, f"人声缓冲区不完整: {vocals_wav}"
+            vocals_wav = export_wav(pcm, Path(vocals_wav).with_suffix(".mono.wav"), mono=True)
+
+        from basic_pitch.inference import predict
+        _, _, note_events = predict(str(vocals_wav))
+        return _basic_pitch_notes(note_events), None, None
+    except ImportError as e:
+        return None, None, f"{TRANSCRIBERS[transcriber][0]} 缺少依赖: {str(e)}"
+    except Exception as e:
+        return None, None, f"{TRANSCRIBERS[transcriber][0]} 转写异常: {str(e)}"
+
+
+def _load_analyzer():
+    """导入 MIDI 分析器；缺少 mido / music21 时返回错误而不是退出进程"""
+    try:
+        import mido  # noqa: F401
+        import music21  # noqa: F401
+    except ImportError as e:
+        return None, f"旋律分析缺少依赖: {str(e)}"
+    from midi_analyzer import ProfessionalMidiAnalyzer
+    return ProfessionalMidiAnalyzer(), None
+
+
+def decode_shared_pcm(input_mp3, output_dir, separation=True, fingerprint=False, input_digest=None):
+    """
+    将输入音频解码一次到共享 PCM 缓冲区
+
+    Args:
+        input_digest: 输入文件的 SHA-256，作为缓冲区文件名的一部分（同名的不同输入不会互相复用）
+        separation: 是否输出分离使用的布局 (SEPARATION_LAYOUT)
+        fingerprint: 是否同时输出音频指纹使用的布局 (FINGERPRINT_LAYOUT)
+
+    Returns:
+        ({"separation": PcmBuffer, "fingerprint": PcmBuffer}, error)；ffmpeg 或 numpy 不可用时返回错误，
+        调用方回退到按文件处理
+    """
+    try:
+        from audio_buffer import decode_audio, SEPARATION_LAYOUT
+        from fingerprint import FINGERPRINT_LAYOUT
+    except ImportError as e:
+        return None, f"共享 PCM 缓冲区缺少依赖: {str(e)}"
+
+    layouts = {}
+    if separation:
+        layouts["separation"] = SEPARATION_LAYOUT
+    if fingerprint:
+        layouts["fingerprint"] = FINGERPRINT_LAYOUT
+
+    buffers, error = decode_audio(input_mp3, Path(output_dir) / ".pcm", list(layouts.values()), input_digest)
+    if error:
+        return None, error
+    return {name: buffers[layout] for name, layout in layouts.items()}, None
+
+
+def find_duplicate(fingerprint_pcm):
+    """
+    在本地指纹库中查找同一首歌（不同码率、裁剪或编码）的已处理记录
+
+    Returns:
+        (FingerprintIndex, Fingerprint, 匹配记录或 None, error)
+    """
+    try:
+        from fingerprint import FingerprintIndex, fingerprint_buffer
+        fp = fingerprint_buffer(fingerprint_pcm)
+        index = FingerprintIndex()
+        return index, fp, index.match(fp), None
+    except Exception as e:
+        return None, None, None, f"音频指纹去重失败: {str(e)}"
+
+
+def checkpoint_path(output_dir, input_mp3):
+    """断点清单路径: <output_dir>/.checkpoints/<song>.json"""
+    return Path(output_dir) / ".checkpoints" / (Path(input_mp3).stem + ".json")
+
+
+def process_audio(input_mp3, output_dir=None, transcriber=DEFAULT_TRANSCRIBER, shared_pcm=True,
+                  resume=True, concurrent_jobs=None, memory_budget_mb=None,
+                  analyze=False, lyrics_path=None, export_midi=True, dedup=True, vad=True):
     """
     完整的音频处理流程
 
     Args:
         input_mp3: 输入 MP3 文件路径
         output_dir: 输出目录 (默认为输入文件所在目录)
+        transcriber: MIDI 转写器 (basic_pitch/yin)
+        shared_pcm: 是否先解码到共享 PCM 缓冲区并在进程内分离
+        resume: 是否根据断点清单跳过已完成且产物有效的步骤；为 False 时全部重新计算，
+            也不通过音频指纹复用其他记录的产物
+        concurrent_jobs: 同机并发任务数，用于规划线程和内存
+        memory_budget_mb: 单任务内存预算 (MB)
+        analyze: 在进程内将转写的音符事件直接送入旋律分析（结果写入 analysis），不经过 MIDI 文件
+        lyrics_path: 旋律分析使用的歌词文件（analyze 时有效）
+        export_midi: analyze 时是否同时导出 MIDI 文件
+        dedup: 分离前用音频指纹匹配已处理过的同一首歌，命中时复用其人声分轨和 MIDI
+        vad: 转写前检测演唱区段，只并行转写这些区段
 
     Returns:
         处理结果字典
@@ -225,19 +820,27 @@ def process_audio(input_mp3, output_dir=None):
             "error": f"输入文件不存在: {input_mp3}"
         }
 
+    if transcriber not in TRANSCRIBERS:
+        return {
+            "status": "error",
+            "error": f"未知的转写器: {transcriber}",
+            "available_transcribers": list(TRANSCRIBERS)
+        }
+
     if output_dir is None:
         output_dir = input_path.parent
 
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    # 检测硬件
+    # 检测硬件并规划资源
     hardware = detect_hardware()
+    plan = plan_resources(hardware, concurrent_jobs, memory_budget_mb)
 
     # 检查依赖
     deps = check_dependencies()
-    missing_deps = [name for name, info in deps.items()
-                   if not info["installed"] and name != "torch"]
+    missing_deps = [name for name in required_dependencies(transcriber)
+                    if not deps[name]["installed"]]
 
     if missing_deps:
         return {
@@ -253,9 +856,17 @@ def process_audio(input_mp3, output_dir=None):
         "input_file": str(input_path),
         "output_dir": str(output_path),
         "hardware": hardware,
+        "resource_plan": plan,
+        "transcriber": transcriber,
         "steps": []
     }
 
+    # 断点清单：输入哈希 + 各步骤参数与产物
+    manifest = StepManifest(checkpoint_path(output_path, input_path), input_path)
+    result["checkpoint"] = str(manifest.path)
+    if manifest.stale_reason:
+        result["checkpoint_reset"] = manifest.stale_reason
+
     # Step 1: 分离人声
     result["steps"].append({
         "step": 1,
@@ -263,78 +874,310 @@ def process_audio(input_mp3, output_dir=None):
         "status": "in_progress",
         "tool": "Demucs"
     })
-
-    vocals_path, error = separate_vocals(
-        input_mp3,
-        output_path,
-        hardware["device"]
-    )
-
-    if error:
-        result["status"] = "error"
-        result["steps"][-1]["status"] = "failed"
-        result["steps"][-1]["error"] = error
-        return result
+    _emit_step(result["steps"][-1])
+
+    separate_params = {"model": DEMUCS_MODEL}
+    cached = manifest.completed("separate", separate_params) if resume else None
+    dedup = dedup and resume
+
+    # 指纹库中的记录：duplicate 为命中的已有记录，fingerprint_track 为本次新登记的记录 ID
+    fingerprint_index = fingerprint = duplicate = fingerprint_track = None
+
+    if cached:
+        vocals_path = cached["vocals"]
+        vocals_buffer = cached.get("vocals_buffer")
+        result["steps"][-1]["from_checkpoint"] = True
+    else:
+        buffers = {}
+        if shared_pcm or dedup:
+            # 指纹布局与分离布局在同一次 ffmpeg 解码中产生
+            buffers, pcm_error = decode_shared_pcm(input_path, output_path,
+                                                   separation=shared_pcm, fingerprint=dedup,
+                                                   input_digest=manifest.input_digest)
+            if buffers is None:
+                buffers = {}
+                if shared_pcm:
+                    result["pcm_fallback"] = pcm_error
+                if dedup:
+                    result["dedup_skipped"] = pcm_error
+            elif "separation" in buffers:
+                result["pcm_buffer"] = buffers["separation"].to_dict()
+
+        if "fingerprint" in buffers:
+            fingerprint_index, fingerprint, duplicate, dedup_error = find_duplicate(buffers["fingerprint"])
+            if dedup_error:
+                result["dedup_skipped"] = dedup_error
+
+        if duplicate:
+            _release_buffers(buffers)
+            vocals_path = duplicate["vocals_file"]
+            result["duplicate_of"] = {
+                key: duplicate[key]
+                for key in ("id", "input_file", "score", "match_ratio", "offset_seconds")
+            }
+            result["steps"][-1]["reused_from"] = duplicate["input_file"]
+        else:
+            vocals_path, error = separate_vocals(
+                input_mp3,
+                output_path,
+                hardware["device"],
+                buffers.get("separation"),
+                plan
+            )
+            # 解码出的输入缓冲区只用于指纹和分离，用完即删
+            _release_buffers(buffers)
+
+            if error:
+                manifest.invalidate("separate")
+                result["status"] = "error"
+                result["steps"][-1]["status"] = "failed"
+                result["steps"][-1]["error"] = error
+                _emit_step(result["steps"][-1])
+                return result
+
+            if fingerprint is not None:
+                fingerprint_track = _register_fingerprint(result, fingerprint_index, fingerprint,
+                                                          input_path, vocals_path)
+
+        vocals_buffer = vocals_buffer_path(vocals_path)
+        outputs = {"vocals": vocals_path}
+        if vocals_buffer:
+            # 缓冲区是裸 PCM，布局在描述文件中：两者一起校验
+            from audio_buffer import meta_path
+            outputs["vocals_buffer"] = vocals_buffer
+            outputs["vocals_buffer_meta"] = str(meta_path(vocals_buffer))
+        manifest.record("separate", separate_params, outputs)
 
     result["steps"][-1]["status"] = "completed"
     result["steps"][-1]["output"] = vocals_path
     result["vocals_file"] = vocals_path
+    if vocals_buffer:
+        result["vocals_buffer"] = vocals_buffer
+    _emit_step(result["steps"][-1])
+
+    if analyze:
+        return _analyze_vocals(result, _transcription_source(vocals_path, vocals_buffer, transcriber, vad),
+                               output_path / (input_path.stem + ".mid"),
+                               transcriber, lyrics_path, export_midi, vad, _job_cores(plan))
 
-    # Step 2: 转换为 MIDI
+    # Step 2: 转换为 MIDI（人声产物变化时自动失效）
     result["steps"].append({
         "step": 2,
         "name": "转换 MIDI",
         "status": "in_progress",
-        "tool": "Basic Pitch"
+        "tool": TRANSCRIBERS[transcriber][0]
     })
+    _emit_step(result["steps"][-1])
 
-    midi_path, error = convert_to_midi(vocals_path, output_path)
+    transcribe_params = {
+        "transcriber": transcriber,
+        "vad": vad,
+        "vocals_sha256": manifest.output_digest("separate", "vocals")
+    }
+    cached = manifest.completed("transcribe", transcribe_params) if resume else None
+
+    final_midi_path = output_path / (input_path.stem + ".mid")
+    # 命中记录的 MIDI 须由相同的转写器和 VAD 设置生成
+    reuse_params = {"transcriber": transcriber, "vad": vad}
+    reusable_midi = (duplicate and duplicate["midi_file"] and Path(duplicate["midi_file"]).exists()
+                     and duplicate["transcribe_params"] == params_key(reuse_params))
+
+    if cached:
+        result["steps"][-1]["status"] = "completed"
+        result["steps"][-1]["output"] = cached["midi"]
+        result["steps"][-1]["from_checkpoint"] = True
+        result["midi_file"] = cached["midi"]
+    elif reusable_midi:
+        if Path(duplicate["midi_file"]).resolve() != final_midi_path.resolve():
+            shutil.copyfile(duplicate["midi_file"], final_midi_path)
+        result["steps"][-1]["status"] = "completed"
+        result["steps"][-1]["output"] = str(final_midi_path)
+        result["steps"][-1]["reused_from"] = duplicate["midi_file"]
+        result["midi_file"] = str(final_midi_path)
+        manifest.record("transcribe", transcribe_params, {"midi": result["midi_file"]})
+    else:
+        source = _transcription_source(vocals_path, vocals_buffer, transcriber, vad)
+        if vad:
+            midi_path, error = _convert_voiced(result, source, final_midi_path,
+                                               transcriber, _job_cores(plan))
+        else:
+            midi_path, error = convert_to_midi(source, output_path, transcriber)
+
+        if error:
+            manifest.invalidate("transcribe")
+            result["status"] = "error"
+            result["steps"][-1]["status"] = "failed"
+            result["steps"][-1]["error"] = error
+            _emit_step(result["steps"][-1])
+            return result
+
+        result["steps"][-1]["status"] = "completed"
+        result["steps"][-1]["output"] = midi_path
+        result["midi_file"] = midi_path
+
+        # 重命名 MIDI 文件为更友好的名称
+        if str(midi_path) != str(final_midi_path):
+            try:
+                shutil.move(midi_path, final_midi_path)
+                result["midi_file"] = str(final_midi_path)
+            except Exception:
+                pass  # 保持原文件名
+
+        manifest.record("transcribe", transcribe_params, {"midi": result["midi_file"]})
+
+        # 供之后的同一首歌复用：登记到本次记录，或补全命中记录缺少的 MIDI
+        track_id = fingerprint_track or (duplicate["id"] if duplicate and not duplicate["midi_file"] else None)
+        if track_id is not None:
+            _register_midi(result, fingerprint_index, track_id, result["midi_file"], reuse_params)
+
+    _emit_step(result["steps"][-1])
+
+    result["status"] = "success"
+    result["message"] = "MP3 转 MIDI 完成"
+    result["completed_at"] = datetime.now().isoformat()
+
+    return result
+
+
+def _job_cores(plan):
+    """本任务分到的核数"""
+    return max(1, plan["cores"] // plan["concurrent_jobs"])
+
+
+def _convert_voiced(result, vocals_path, midi_path, transcriber, cores):
+    """只转写演唱区段并写出 MIDI，区段信息写入 result["voice_activity"]"""
+    notes, regions, error = transcribe_notes(vocals_path, transcriber, vad=True, cores=cores)
+    if error:
+        return None, error
+
+    result["voice_activity"] = regions.to_dict()
+    try:
+        from pitch_tracker import write_midi
+        return write_midi(notes, str(midi_path)), None
+    except Exception as e:
+        return None, f"写出 MIDI 失败: {str(e)}"
+
+
+def _register_fingerprint(result, index, fingerprint, input_path, vocals_path):
+    """分离完成后登记指纹，返回记录 ID；指纹库不可写时只记录原因"""
+    try:
+        return index.add(fingerprint, input_path.resolve(), Path(vocals_path).resolve())
+    except Exception as e:
+        result["dedup_skipped"] = f"音频指纹登记失败: {str(e)}"
+        return None
+
+
+def _register_midi(result, index, track_id, midi_path, transcribe_params):
+    try:
+        index.set_midi(track_id, Path(midi_path).resolve(), transcribe_params)
+    except Exception as e:
+        result["dedup_skipped"] = f"音频指纹登记失败: {str(e)}"
+
+
+def _analyze_vocals(result, vocals_path, midi_path, transcriber, lyrics_path, export_midi,
+                    vad=True, cores=None):
+    """Step 2（分析模式）：人声 → 音符事件 → 旋律特征，MIDI 仅作为可选导出"""
+    result["steps"].append({
+        "step": 2,
+        "name": "提取旋律特征",
+        "status": "in_progress",
+        "tool": TRANSCRIBERS[transcriber][0]
+    })
+    _emit_step(result["steps"][-1])
+
+    analyzer, error = _load_analyzer()
+    notes = None
+    if not error:
+        notes, regions, error = transcribe_notes(vocals_path, transcriber, vad=vad, cores=cores)
+        if regions is not None:
+            result["voice_activity"] = regions.to_dict()
+
+    if not error and export_midi:
+        try:
+            from pitch_tracker import write_midi
+            result["midi_file"] = write_midi(notes, str(midi_path))
+        except Exception as e:
+            error = f"导出 MIDI 失败: {str(e)}"
+
+    if not error:
+        analysis = analyzer.analyze_note_events(notes.start, notes.end, notes.pitch, notes.velocity,
+                                                lyrics_path=lyrics_path, source=vocals_path)
+        if analysis["status"] != "success":
+            error = analysis["message"]
+        result["analysis"] = analysis
 
     if error:
         result["status"] = "error"
         result["steps"][-1]["status"] = "failed"
         result["steps"][-1]["error"] = error
+        _emit_step(result["steps"][-1])
         return result
 
     result["steps"][-1]["status"] = "completed"
-    result["steps"][-1]["output"] = midi_path
-    result["midi_file"] = midi_path
-
-    # 重命名 MIDI 文件为更友好的名称
-    final_midi_name = input_path.stem + ".mid"
-    final_midi_path = output_path / final_midi_name
-
-    if str(midi_path) != str(final_midi_path):
-        try:
-            shutil.move(midi_path, final_midi_path)
-            result["midi_file"] = str(final_midi_path)
-        except Exception:
-            pass  # 保持原文件名
+    result["steps"][-1]["note_count"] = len(notes)
+    _emit_step(result["steps"][-1])
 
     result["status"] = "success"
-    result["message"] = "MP3 转 MIDI 完成"
+    result["message"] = "MP3 旋律分析完成"
     result["completed_at"] = datetime.now().isoformat()
-
     return result
 
 
+def _usage_error(error):
+    """输出 JSON 格式的用法说明并退出"""
+    output_json({
+        "status": "error",
+        "error": error,
+        "usage": "python audio_to_midi.py <input_mp3> [output_dir] [--transcriber basic_pitch|yin]",
+        "examples": [
+            "python audio_to_midi.py song.mp3",
+            "python audio_to_midi.py song.mp3 ./output",
+            "python audio_to_midi.py song.mp3 ./output --transcriber yin",
+            "python audio_to_midi.py song.mp3 ./output --analyze --lyrics lyrics.txt",
+            "python audio_to_midi.py --check"
+        ]
+    })
+    sys.exit(1)
+
+
+class _JsonArgumentParser(argparse.ArgumentParser):
+    """参数错误时输出 JSON 用法说明，便于脚本调用方解析"""
+
+    def error(self, message):
+        _usage_error(f"参数错误: {message}")
+
+
 def main():
     """主函数"""
-    if len(sys.argv) < 2:
-        output_json({
-            "status": "error",
-            "error": "缺少参数",
-            "usage": "python audio_to_midi.py <input_mp3> [output_dir]",
-            "examples": [
-                "python audio_to_midi.py song.mp3",
-                "python audio_to_midi.py song.mp3 ./output",
-                "python audio_to_midi.py --check"
-            ]
-        })
-        sys.exit(1)
+    parser = _JsonArgumentParser(description="MP3 转 MIDI 工具")
+    parser.add_argument("input_mp3", nargs="?", help="输入 MP3 文件路径")
+    parser.add_argument("output_dir", nargs="?", help="输出目录（可选）")
+    parser.add_argument("--check", action="store_true", help="检查依赖和硬件")
+    parser.add_argument("--transcriber", choices=list(TRANSCRIBERS), default=DEFAULT_TRANSCRIBER,
+                        help="MIDI 转写器（默认 basic_pitch；yin 为内置 CPU 音高追踪）")
+    parser.add_argument("--no-shared-pcm", action="store_true",
+                        help="不使用共享 PCM 缓冲区，由各工具自行解码文件")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="忽略断点清单，重新执行全部步骤")
+    parser.add_argument("--concurrent-jobs", type=int,
+                        help="同机并发转换任务数（默认读取 MUSICIFY_CONCURRENT_JOBS 或 1）")
+    parser.add_argument("--memory-budget", type=int, help="单任务内存预算 (MB)")
+    parser.add_argument("--analyze", action="store_true",
+                        help="转写后直接在进程内分析旋律特征（不重新解析 MIDI 文件）")
+    parser.add_argument("--lyrics", help="旋律分析使用的歌词文件（配合 --analyze）")
+    parser.add_argument("--no-midi", action="store_true", help="配合 --analyze：不导出 MIDI 文件")
+    parser.add_argument("--progress", action="store_true",
+                        help="向 stderr 输出 JSON Lines 进度事件（步骤状态和工具输出）")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="不使用音频指纹匹配已处理过的同一首歌")
+    parser.add_argument("--no-vad", action="store_true",
+                        help="不检测演唱区段，整段人声送入转写器")
+
+    args = parser.parse_args()
+    enable_progress(args.progress)
 
     # 检查模式
-    if sys.argv[1] == "--check":
+    if args.check:
         deps = check_dependencies()
         hardware = detect_hardware()
 
@@ -348,16 +1191,25 @@ def main():
             "status": "ready" if all_installed else "missing_dependencies",
             "dependencies": deps,
             "hardware": hardware,
+            "resource_plan": plan_resources(hardware, args.concurrent_jobs, args.memory_budget),
+            "available_transcribers": {
+                name: all(deps[dep]["installed"] for dep in required_dependencies(name))
+                for name in TRANSCRIBERS
+            },
             "install_command": "pip install demucs basic-pitch" if not all_installed else None,
             "online_alternative": "https://basicpitch.spotify.com"
         })
         sys.exit(0 if all_installed else 1)
 
-    # 处理模式
-    input_mp3 = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    if not args.input_mp3:
+        _usage_error("缺少参数")
 
-    result = process_audio(input_mp3, output_dir)
+    # 处理模式
+    result = process_audio(args.input_mp3, args.output_dir, args.transcriber,
+                           shared_pcm=not args.no_shared_pcm, resume=not args.no_resume,
+                           concurrent_jobs=args.concurrent_jobs, memory_budget_mb=args.memory_budget,
+                           analyze=args.analyze, lyrics_path=args.lyrics, export_midi=not args.no_midi,
+                           dedup=not args.no_dedup, vad=not args.no_vad)
     output_json(result)
 
     sys.exit(0 if result["status"] == "success" else 1)
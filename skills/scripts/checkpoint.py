@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+处理流程断点记录 - 让 process_audio 重跑时跳过已完成的步骤
+
+清单文件记录：
+- 输入文件的 SHA-256（输入变化时所有步骤失效）
+- 每个步骤的参数键（参数或上游产物变化时该步骤失效）
+- 每个步骤产物的路径、大小和 SHA-256（产物缺失、被截断或被改动时该步骤失效）
+
+清单使用临时文件 + 原子替换写入，进程中途被终止也不会留下半个清单。
+"""
+
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+MANIFEST_VERSION = 1
+
+_HASH_CHUNK = 1 << 20
+
+
+def file_digest(path) -> str:
+    """流式计算文件 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def params_key(params: Dict[str, Any]) -> str:
+    """参数字典的稳定摘要"""
+    encoded = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+class StepManifest:
+    """步骤级断点清单"""
+
+    def __init__(self, manifest_path, input_path):
+        self.path = Path(manifest_path)
+        self.input_digest = file_digest(input_path)
+        self.stale_reason = None
+        self.data = self._load()
+
+        if self.data.get("input_sha256") != self.input_digest:
+            if self.data.get("steps"):
+                self.stale_reason = "输入文件已变化"
+            self.data = {
+                "version": MANIFEST_VERSION,
+                "input_file": str(input_path),
+                "input_sha256": self.input_digest,
+                "steps": {}
+            }
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if data.get("version") == MANIFEST_VERSION else {}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.path)
+
+    def completed(self, step: str, params: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """
+        返回步骤的有效产物 {名称: 路径}；未完成、参数变化或产物无效时返回 None
+        """
+        record = self.data["steps"].get(step)
+        if not record or record.get("params_key") != params_key(params):
+            return None
+
+        for output in record["outputs"].values():
+            path = Path(output["path"])
+            if not path.exists() or path.stat().st_size != output["size"]:
+                return None
+            if file_digest(path) != output["sha256"]:
+                return None
+
+        return {name: output["path"] for name, output in record["outputs"].items()}
+
+    def output_digest(self, step: str, name: str) -> Optional[str]:
+        """已记录产物的 SHA-256，用作下游步骤的参数"""
+        record = self.data["steps"].get(step)
+        if not record or name not in record["outputs"]:
+            return None
+        return record["outputs"][name]["sha256"]
+
+    def record(self, step: str, params: Dict[str, Any], outputs: Dict[str, str]):
+        """记录步骤完成并立即落盘"""
+        self.data["steps"][step] = {
+            "params": params,
+            "params_key": params_key(params),
+            "outputs": {
+                name: {
+                    "path": str(path),
+                    "size": Path(path).stat().st_size,
+                    "sha256": file_digest(path)
+                }
+                for name, path in outputs.items()
+            },
+            "completed_at": datetime.now().isoformat()
+        }
+        self.save()
+
+    def invalidate(self, step: str):
+        if self.data["steps"].pop(step, None) is not None:
+            self.save()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+列式特征库 - 批量保存 MelodyFeatures 和人声音轨候选，按列内存映射读取
+
+目录结构（只追加，不修改已有分段）:
+    <store>/
+        <分段>/
+            songs/<列>.npy             每首歌一行
+            candidates/<列>.npy        每个人声音轨候选一行（song_row 指向同分段的 songs 行）
+            _segment.json              各表行数
+        .tmp-*                         正在写入的分段，完成后原子重命名
+
+变长列（旋律轮廓、乐句结构）按 <列>.values.npy + <列>.offsets.npy 存储。
+读取时 np.load(mmap_mode='r')，只映射请求的列，不解析任何 JSON。
+
+用法:
+    python feature_store.py analyze <store> <midi文件或目录> [...] [--batch-size 500]
+    python feature_store.py ingest <store> <分析结果.json> [...]
+    python feature_store.py info <store>
+"""
+
+import os
+import sys
+import json
+import uuid
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+SEGMENT_META = "_segment.json"
+SEGMENT_VERSION = 1
+TABLES = ("songs", "candidates")
+
+RHYTHM_PATTERNS = ("whole", "half", "quarter", "eighth", "sixteenth", "dotted", "triplet")
+INTERVAL_TYPES = ("unison", "step", "small_leap", "large_leap", "octave")
+MODE_TYPES = ("pentatonic", "major", "minor")
+
+# 定长列：列名 → (dtype, 从分析结果取值的函数)
+_SONG_COLUMNS = {
+    "midi_path": (str, lambda r: r.get("file_info", {}).get("midi_path") or r.get("file_info", {}).get("source") or ""),
+    "total_notes": (np.int32, lambda r: r["melody_features"]["total_notes"]),
+    "note_min": (np.int16, lambda r: r["melody_features"]["note_range"][0]),
+    "note_max": (np.int16, lambda r: r["melody_features"]["note_range"][1]),
+    "duration_beats": (np.float64, lambda r: r["melody_features"]["duration_beats"]),
+    "rhythm_complexity": (np.float64, lambda r: r["melody_features"]["rhythm_complexity"]),
+    "syncopation_level": (np.float64, lambda r: r["melody_features"]["syncopation_level"]),
+    "stepwise_ratio": (np.float64, lambda r: r["melody_features"]["stepwise_ratio"]),
+    "leap_ratio": (np.float64, lambda r: r["melody_features"]["leap_ratio"]),
+    "key_signature": (str, lambda r: r["melody_features"]["key_signature"]),
+    "scale_notes": (str, lambda r: " ".join(r["melody_features"]["scale_notes"])),
+    **{f"rhythm_{name}": (np.float64, lambda r, name=name: r["melody_features"]["rhythm_patterns"].get(name, 0.0))
+       for name in RHYTHM_PATTERNS},
+    **{f"interval_{name}": (np.float64, lambda r, name=name: r["melody_features"]["interval_distribution"].get(name, 0.0))
+       for name in INTERVAL_TYPES},
+    **{f"mode_{name}": (np.float64, lambda r, name=name: r["melody_features"]["mode_analysis"].get(name, 0.0))
+       for name in MODE_TYPES},
+    "complexity_score": (np.float64, lambda r: r.get("mode_recommendation", {}).get("complexity_score", np.nan)),
+    "recommended_mode": (str, lambda r: r.get("mode_recommendation", {}).get("recommended", "")),
+    "chorus_candidate": (str, lambda r: (r.get("melody_structure") or {}).get("chorus_candidate") or ""),
+    "repetition_coverage": (np.float64, lambda r: (r.get("melody_structure") or {}).get("repetition_coverage", np.nan)),
+    "selection_confidence": (np.float64,
+                             lambda r: (r.get("vocal_track_analysis") or {}).get("selection_confidence", np.nan)),
+}
+
+# 变长列：列名 → (值 dtype, 取值函数)
+_SONG_RAGGED = {
+    "contour_vector": (np.int8, lambda r: r["melody_features"]["contour_vector"]),
+    "phrase_structure": (np.int32, lambda r: [i for phrase in r["melody_features"]["phrase_structure"] for i in phrase]),
+}
+
+_CANDIDATE_COLUMNS = {
+    "song_row": (np.int64, lambda c: c["song_row"]),
+    "track_index": (np.int32, lambda c: c["track_index"]),
+    "track_name": (str, lambda c: c["track_name"]),
+    "note_count": (np.int32, lambda c: c["note_count"]),
+    "note_min": (np.int16, lambda c: c["note_range"][0]),
+    "note_max": (np.int16, lambda c: c["note_range"][1]),
+    "confidence_score": (np.float64, lambda c: c["confidence_score"]),
+    "selected": (np.bool_, lambda c: c["selected"]),
+    "reasons": (str, lambda c: "\n".join(c["reasons"])),
+}
+
+
+def _column_array(values: List[Any], dtype) -> np.ndarray:
+    # 字符串列使用定长 Unicode，np.load 可直接内存映射
+    if dtype is str:
+        return np.array(values, dtype=str) if values else np.zeros(0, dtype="U1")
+    return np.array(values, dtype=dtype)
+
+
+def _ragged_arrays(rows: List[Sequence], dtype) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(row) for row in rows])
+    values = np.fromiter((v for row in rows for v in row), dtype=dtype, count=int(offsets[-1]))
+    return values, offsets
+
+
+class FeatureStore:
+    """只追加的列式特征库"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def segments(self) -> List[Path]:
+        """已完成的分段（按名称即写入时间排序）"""
+        if not self.root.exists():
+            return []
+        return sorted(p for p in self.root.iterdir()
+                      if p.is_dir() and not p.name.startswith(".") and (p / SEGMENT_META).exists())
+
+    def append(self, results: Iterable[Dict[str, Any]]) -> int:
+        """
+        将一批分析结果写为一个新分段（失败的结果跳过）
+
+        Returns:
+            写入的歌曲行数
+        """
+        songs = [r for r in results if r.get("status") == "success" and r.get("melody_features")]
+        if not songs:
+            return 0
+
+        candidates = []
+        for row, result in enumerate(songs):
+            vocal = result.get("vocal_track_analysis") or {}
+            selected = (vocal.get("selected_track") or {}).get("track_index")
+            for candidate in vocal.get("all_candidates", []):
+                candidates.append(dict(candidate, song_row=row, selected=candidate["track_index"] == selected))
+
+        name = f"{datetime.now():%Y%m%d%H%M%S%f}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        tmp_dir = self.root / f".tmp-{name}"
+        tables = {"songs": (songs, _SONG_COLUMNS, _SONG_RAGGED), "candidates": (candidates, _CANDIDATE_COLUMNS, {})}
+
+        for table, (rows, columns, ragged) in tables.items():
+            table_dir = tmp_dir / table
+            table_dir.mkdir(parents=True)
+            for column, (dtype, getter) in columns.items():
+                np.save(table_dir / f"{column}.npy", _column_array([getter(r) for r in rows], dtype))
+            for column, (dtype, getter) in ragged.items():
+                values, offsets = _ragged_arrays([getter(r) for r in rows], dtype)
+                np.save(table_dir / f"{column}.values.npy", values)
+                np.save(table_dir / f"{column}.offsets.npy", offsets)
+
+        with open(tmp_dir / SEGMENT_META, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": SEGMENT_VERSION,
+                "rows": {table: len(rows) for table, (rows, _, _) in tables.items()},
+                "created_at": datetime.now().isoformat()
+            }, f)
+
+        # 原子发布：读者要么看到完整分段，要么看不到
+        tmp_dir.rename(self.root / name)
+        return len(songs)
+
+    def _segment_rows(self, segment: Path) -> Dict[str, int]:
+        with open(segment / SEGMENT_META, 'r', encoding='utf-8') as f:
+            return json.load(f)["rows"]
+
+    def columns(self, table: str = "songs") -> List[str]:
+        segments = self.segments()
+        if not segments:
+            return []
+        names = set()
+        for path in (segments[0] / table).glob("*.npy"):
+            stem = path.name[:-len(".npy")]
+            names.add(stem.rsplit(".", 1)[0] if stem.endswith((".values", ".offsets")) else stem)
+        return sorted(names)
+
+    def iter_segments(self, table: str = "songs",
+                      columns: Optional[Sequence[str]] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        逐分段内存映射读取指定列（零拷贝）
+
+        变长列返回 <列>.values 和 <列>.offsets 两项
+        """
+        if table not in TABLES:
+            raise ValueError(f"未知的表: {table}")
+        for segment in self.segments():
+            table_dir = segment / table
+            data = {}
+            for column in columns or self.columns(table):
+                path = table_dir / f"{column}.npy"
+                if path.exists():
+                    data[column] = np.load(path, mmap_mode='r')
+                elif (table_dir / f"{column}.values.npy").exists():
+                    for part in ("values", "offsets"):
+                        data[f"{column}.{part}"] = np.load(table_dir / f"{column}.{part}.npy", mmap_mode='r')
+                else:
+                    raise KeyError(f"列不存在: {table}.{column}")
+            yield data
+
+    def read(self, table: str = "songs", columns: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        读取全部分段的指定列
+
+        只有一个分段时直接返回内存映射；多个分段时拼接（变长列的 offsets 和
+        候选表的 song_row 会换算为全局行号）
+        """
+        parts: Dict[str, List[np.ndarray]] = {}
+        song_base = 0
+        value_base: Dict[str, int] = {}
+        segments = self.segments()
+
+        for segment, data in zip(segments, self.iter_segments(table, columns)):
+            if len(segments) == 1:
+                return data
+            for key, array in data.items():
+                if key == "song_row":
+                    array = array + song_base
+                elif key.endswith(".offsets"):
+                    base = value_base.get(key, 0)
+                    value_base[key] = base + int(array[-1])
+                    array = array + base
+                    if key in parts:
+                        array = array[1:]
+                parts.setdefault(key, []).append(array)
+            song_base += self._segment_rows(segment)["songs"]
+
+        return {key: np.concatenate(arrays) for key, arrays in parts.items()}
+
+    def row_counts(self) -> Dict[str, int]:
+        totals = {table: 0 for table in TABLES}
+        for segment in self.segments():
+            for table, rows in self._segment_rows(segment).items():
+                totals[table] += rows
+        return totals
+
+
+def ragged_row(values: np.ndarray, offsets: np.ndarray, row: int) -> np.ndarray:
+    """取变长列的第 row 行"""
+    return values[offsets[row]:offsets[row + 1]]
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def analyze_into_store(store: FeatureStore, paths: Iterable[str], batch_size: int = 500) -> Dict[str, int]:
+    """逐个分析 MIDI 文件，每 batch_size 首写入一个分段（内存中只保留一个批次）"""
+    from midi_analyzer import ProfessionalMidiAnalyzer
+    from style_profiler import iter_midi_files
+
+    analyzer = ProfessionalMidiAnalyzer()
+    written = failed = 0
+    for batch in _batched(iter_midi_files(paths), batch_size):
+        results = [analyzer.analyze_midi_file(str(path)) for path in batch]
+        count = store.append(results)
+        written += count
+        failed += len(batch) - count
+    return {"written": written, "failed": failed}
+
+
+def _load_result_files(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    for path in map(Path, paths):
+        files = sorted(path.rglob("*.json")) if path.is_dir() else [path]
+        for file in files:
+            with open(file, 'r', encoding='utf-8') as f:
+                yield json.load(f)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="列式特征库")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    analyze = sub.add_parser("analyze", help="分析 MIDI 文件并写入特征库")
+    analyze.add_argument("store", help="特征库目录")
+    analyze.add_argument("paths", nargs="+", help="MIDI 文件或目录")
+    analyze.add_argument("--batch-size", type=int, default=500, help="每个分段的歌曲数")
+
+    ingest = sub.add_parser("ingest", help="导入 midi_analyzer.py 输出的 JSON 结果")
+    ingest.add_argument("store", help="特征库目录")
+    ingest.add_argument("paths", nargs="+", help="JSON 文件或目录")
+    ingest.add_argument("--batch-size", type=int, default=500, help="每个分段的歌曲数")
+
+    info = sub.add_parser("info", help="查看特征库概况")
+    info.add_argument("store", help="特征库目录")
+
+    args = parser.parse_args()
+    store = FeatureStore(args.store)
+
+    try:
+        if args.command == "analyze":
+            output = {"status": "success", **analyze_into_store(store, args.paths, args.batch_size)}
+        elif args.command == "ingest":
+            written = sum(store.append(batch) for batch in _batched(_load_result_files(args.paths), args.batch_size))
+            output = {"status": "success", "written": written}
+        else:
+            output = {"status": "success"}
+        output.update({
+            "store": str(store.root),
+            "segments": len(store.segments()),
+            "rows": store.row_counts(),
+            "columns": {table: store.columns(table) for table in TABLES}
+        })
+    except (OSError, ValueError, KeyError) as e:
+        print(json.dumps({"status": "error", "error": str(e)}, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
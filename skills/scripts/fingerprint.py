@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+音频指纹去重 - 识别不同码率、裁剪和编码的同一首歌，复用已有的人声分轨和 MIDI
+
+指纹：11025 Hz 单声道频谱图上的局部峰值（星座图），每个锚点峰与其后若干个峰
+组成 (f1, f2, Δt) 哈希，记录锚点所在帧。重新编码只会改变少量峰值，裁剪只会让
+所有帧整体平移，因此按 "库中帧 - 查询帧" 做偏移直方图，峰值高度即匹配得分。
+
+只有时间轴对齐且两者时长基本一致的匹配才会复用人声分轨和 MIDI：
+裁剪版本或较短的片段虽能识别（offset_seconds 非零或时长不一致），但其产物的时间轴
+与本次输入不一致，按未命中处理。MIDI 还要求转写参数（转写器、是否 VAD）相同。
+
+指纹库为 SQLite（默认 ~/.musicify/fingerprints.db，可用 MUSICIFY_FINGERPRINT_DB 覆盖）。
+
+用法:
+    python fingerprint.py match <input_audio>
+    python fingerprint.py list
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+from checkpoint import params_key
+
+# 指纹使用的解码布局，加入共享 PCM 的同一次 ffmpeg 解码
+FINGERPRINT_LAYOUT = (11025, 1)
+
+N_FFT = 1024
+HOP_LENGTH = 256
+# 峰值邻域（频率 bin / 帧）与密度上限
+PEAK_FREQ_RADIUS = 10
+PEAK_TIME_RADIUS = 5
+PEAKS_PER_SECOND = 30
+# 峰值需高于所在帧中位数的 dB 数
+PEAK_MIN_DB_ABOVE_MEDIAN = 20.0
+# 每个锚点配对的后续峰数与最大帧差（6 bit）
+FAN_OUT = 5
+MAX_DELTA_FRAMES = 63
+
+# 判定为同一首歌：偏移直方图峰值的最少哈希数，以及占查询哈希的最低比例
+# （同一首歌重新编码后通常保留一半以上的哈希；只共享前奏或采样的不同歌曲远低于此）
+MIN_MATCH_COUNT = 50
+MIN_MATCH_RATIO = 0.3
+
+# 可直接复用产物：两者时间轴对齐（编码器延迟等在容差内），且时长之比接近 1
+MAX_REUSE_OFFSET_SECONDS = 0.1
+MAX_REUSE_DURATION_DEVIATION = 0.02
+
+DEFAULT_DB_PATH = Path.home() / ".musicify" / "fingerprints.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_file TEXT NOT NULL,
+    duration REAL NOT NULL,
+    hash_count INTEGER NOT NULL,
+    vocals_file TEXT,
+    midi_file TEXT,
+    transcriber TEXT,
+    transcribe_params TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash INTEGER NOT NULL,
+    track_id INTEGER NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_hashes_hash ON hashes (hash);
+"""
+
+
+@dataclass
+class Fingerprint:
+    """星座图哈希及锚点帧"""
+    hashes: np.ndarray   # uint32
+    offsets: np.ndarray  # int32，锚点帧号
+    duration: float
+
+    @property
+    def frame_seconds(self) -> float:
+        return HOP_LENGTH / FINGERPRINT_LAYOUT[0]
+
+
+def default_db_path():
+    """指纹库路径 (MUSICIFY_FINGERPRINT_DB 环境变量优先)"""
+    return Path(os.environ.get("MUSICIFY_FINGERPRINT_DB", DEFAULT_DB_PATH))
+
+
+def _sliding_max(values: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (radius, radius)
+    padded = np.pad(values, pad, mode='constant', constant_values=-np.inf)
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1, axis=axis).max(axis=-1)
+
+
+def spectral_peaks(samples: np.ndarray, sample_rate: int = FINGERPRINT_LAYOUT[0]):
+    """
+    提取频谱峰值
+
+    Returns:
+        (帧号, 频率 bin)，按帧号排序
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < N_FFT:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, N_FFT)[::HOP_LENGTH]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(N_FFT).astype(np.float32), axis=1))
+    db = 20 * np.log10(spectrum + 1e-6)
+
+    # 二维局部最大值：频率方向与时间方向可分离的滑动最大值
+    neighborhood = _sliding_max(_sliding_max(db, PEAK_FREQ_RADIUS, axis=1), PEAK_TIME_RADIUS, axis=0)
+    floor = np.median(db, axis=1, keepdims=True) + PEAK_MIN_DB_ABOVE_MEDIAN
+    times, freqs = np.nonzero((db == neighborhood) & (db > floor))
+
+    # 只保留最强的峰，控制指纹大小
+    limit = max(1, int(PEAKS_PER_SECOND * len(samples) / sample_rate))
+    if len(times) > limit:
+        strongest = np.argpartition(db[times, freqs], -limit)[-limit:]
+        times, freqs = times[strongest], freqs[strongest]
+
+    order = np.lexsort((freqs, times))
+    return times[order], freqs[order]
+
+
+def compute_fingerprint(samples: np.ndarray, sample_rate: int = FINGERPRINT_LAYOUT[0]) -> Fingerprint:
+    """由单声道采样计算指纹（采样率应为 FINGERPRINT_LAYOUT）"""
+    times, freqs = spectral_peaks(samples, sample_rate)
+    hashes, offsets = [], []
+    for k in range(1, FAN_OUT + 1):
+        anchor, target = times[:-k], times[k:]
+        delta = target - anchor
+        valid = (delta > 0) & (delta <= MAX_DELTA_FRAMES)
+        # f1 (10 bit) | f2 (10 bit) | Δt (6 bit)
+        hashes.append((freqs[:-k][valid] << 16) | (freqs[k:][valid] << 6) | delta[valid])
+        offsets.append(anchor[valid])
+
+    return Fingerprint(
+        hashes=np.concatenate(hashes).astype(np.uint32) if hashes else np.zeros(0, np.uint32),
+        offsets=np.concatenate(offsets).astype(np.int32) if offsets else np.zeros(0, np.int32),
+        duration=len(samples) / sample_rate
+    )
+
+
+def fingerprint_buffer(pcm) -> Fingerprint:
+    """由共享 PCM 缓冲区（FINGERPRINT_LAYOUT）计算指纹"""
+    return compute_fingerprint(pcm.mono(), pcm.sample_rate)
+
+
+class FingerprintIndex:
+    """本地指纹库：记录已处理音频的指纹和产物"""
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else default_db_path()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # 旧版指纹库没有转写参数列：补上该列，旧记录的 MIDI 不再被复用
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(tracks)")}
+            if "transcribe_params" not in columns:
+                conn.execute("ALTER TABLE tracks ADD COLUMN transcribe_params TEXT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def add(self, fingerprint: Fingerprint, input_file, vocals_file=None) -> int:
+        """登记一条音频及其人声分轨，返回记录 ID"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "INSERT INTO tracks (input_file, duration, hash_count, vocals_file, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (str(input_file), fingerprint.duration, len(fingerprint.hashes),
+                 str(vocals_file) if vocals_file else None, datetime.now().isoformat())
+            )
+            track_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO hashes (hash, track_id, offset) VALUES (?, ?, ?)",
+                zip(fingerprint.hashes.tolist(), [track_id] * len(fingerprint.hashes), fingerprint.offsets.tolist())
+            )
+            conn.execute("COMMIT")
+        return track_id
+
+    def set_midi(self, track_id: int, midi_file, transcribe_params: Dict[str, Any]):
+        """登记记录的 MIDI 及生成它的转写参数（须包含 transcriber）"""
+        with self._connect() as conn:
+            conn.execute("UPDATE tracks SET midi_file = ?, transcriber = ?, transcribe_params = ? WHERE id = ?",
+                         (str(midi_file), transcribe_params["transcriber"],
+                          params_key(transcribe_params), track_id))
+
+    def match(self, fingerprint: Fingerprint, reusable_only: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        查找同一首歌的已登记记录（人声分轨仍存在者）
+
+        Args:
+            reusable_only: 只返回可直接复用产物的记录（时间轴对齐且时长一致）
+
+        Returns:
+            记录字典，附 score（对齐的哈希数）、match_ratio、offset_seconds（库中音频相对本次输入的时间偏移）
+            和 reusable
+        """
+        if len(fingerprint.hashes) == 0:
+            return None
+
+        with self._connect() as conn:
+            conn.execute("CREATE TEMP TABLE query (hash INTEGER, offset INTEGER)")
+            conn.executemany("INSERT INTO query (hash, offset) VALUES (?, ?)",
+                             zip(fingerprint.hashes.tolist(), fingerprint.offsets.tolist()))
+            # 偏移直方图：同一记录、同一帧偏移的命中数
+            rows = conn.execute(
+                "SELECT h.track_id, h.offset - q.offset AS delta, COUNT(*) AS score "
+                "FROM query q JOIN hashes h ON h.hash = q.hash "
+                "GROUP BY h.track_id, delta HAVING score >= ? "
+                "ORDER BY score DESC",
+                (MIN_MATCH_COUNT,)
+            ).fetchall()
+
+            for row in rows:
+                ratio = row["score"] / len(fingerprint.hashes)
+                if ratio < MIN_MATCH_RATIO:
+                    break
+                track = conn.execute("SELECT * FROM tracks WHERE id = ?", (row["track_id"],)).fetchone()
+                if not (track["vocals_file"] and Path(track["vocals_file"]).exists()):
+                    continue
+                offset = row["delta"] * fingerprint.frame_seconds
+                reusable = (abs(offset) <= MAX_REUSE_OFFSET_SECONDS and
+                            abs(track["duration"] / fingerprint.duration - 1) <= MAX_REUSE_DURATION_DEVIATION)
+                if reusable_only and not reusable:
+                    continue
+                match = dict(track)
+                match.update(score=row["score"], match_ratio=round(ratio, 4),
+                             offset_seconds=round(offset, 3), reusable=reusable)
+                return match
+        return None
+
+    def list_tracks(self):
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute("SELECT * FROM tracks ORDER BY id")]
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 2 or sys.argv[1] not in ("match", "list") or (sys.argv[1] == "match" and len(sys.argv) < 3):
+        print(json.dumps({
+            "status": "error",
+            "error": "缺少参数",
+            "usage": "python fingerprint.py match <input_audio> | python fingerprint.py list"
+        }, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    index = FingerprintIndex()
+    if sys.argv[1] == "list":
+        print(json.dumps({"status": "success", "tracks": index.list_tracks()}, ensure_ascii=False, indent=2))
+        return
+
+    from audio_buffer import decode_audio
+    with tempfile.TemporaryDirectory() as cache_dir:
+        buffers, error = decode_audio(sys.argv[2], cache_dir, [FINGERPRINT_LAYOUT])
+        if error:
+            print(json.dumps({"status": "error", "error": error}, ensure_ascii=False, indent=2))
+            sys.exit(1)
+        fingerprint = fingerprint_buffer(buffers[FINGERPRINT_LAYOUT])
+
+    print(json.dumps({
+        "status": "success",
+        "hash_count": len(fingerprint.hashes),
+        "match": index.match(fingerprint, reusable_only=False)
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
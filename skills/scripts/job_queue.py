@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+音频转 MIDI 本地持久化任务队列
+基于 SQLite：提交、查询、取消任务，按机器限制并发，进程重启后任务不丢失
+
+用法:
+    python job_queue.py submit <input_mp3> [output_dir] [--transcriber yin] [--analyze --lyrics 歌词.txt] [--no-vad] ...
+    python job_queue.py status <job_id>
+    python job_queue.py result <job_id>
+    python job_queue.py cancel <job_id>
+    python job_queue.py list [--status queued]
+    python job_queue.py worker [--max-jobs N] [--once]
+
+输出:
+    JSON 格式结果（worker 除外）
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import socket
+import sqlite3
+import argparse
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+
+from audio_to_midi import output_json, TRANSCRIBERS, DEFAULT_TRANSCRIBER
+
+# 数据库位置，可通过环境变量覆盖
+DEFAULT_DB_PATH = Path.home() / ".musicify" / "jobs.db"
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# 其他机器上的运行中任务超过该时长无心跳，视为失联并重新排队
+STALE_SECONDS = 120
+
+# 同一任务最多尝试次数（含因 worker 崩溃导致的重试）
+MAX_ATTEMPTS = 3
+
+AUDIO_TO_MIDI_SCRIPT = Path(__file__).resolve().parent / "audio_to_midi.py"
+
+# 任务选项 → audio_to_midi.py 参数（并发数由 worker 通过 MUSICIFY_CONCURRENT_JOBS 传递，不在此列）
+_FLAG_OPTIONS = {
+    "no_shared_pcm": "--no-shared-pcm",
+    "no_resume": "--no-resume",
+    "analyze": "--analyze",
+    "no_midi": "--no-midi",
+    "no_dedup": "--no-dedup",
+    "no_vad": "--no-vad",
+}
+_VALUE_OPTIONS = {
+    "lyrics": "--lyrics",
+    "memory_budget": "--memory-budget",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    input_file TEXT NOT NULL,
+    output_dir TEXT,
+    options TEXT NOT NULL DEFAULT '{}',
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    heartbeat REAL,
+    host TEXT,
+    pid INTEGER,
+    child_pid INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    log_file TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+"""
+
+
+def default_db_path():
+    """任务数据库路径 (MUSICIFY_JOB_DB 环境变量优先)"""
+    return Path(os.environ.get("MUSICIFY_JOB_DB", DEFAULT_DB_PATH))
+
+
+def default_max_jobs():
+    """默认单机并发：Demucs 在 CPU 上会占满多个核心，每 8 核一个任务"""
+    env_value = os.environ.get("MUSICIFY_MAX_JOBS")
+    if env_value:
+        return max(1, int(env_value))
+    return max(1, (os.cpu_count() or 1) // 8)
+
+
+def _kill_group(pid, sig=signal.SIGTERM):
+    """向任务进程组发送信号：任务以独立会话启动，Demucs / Basic Pitch 等派生进程一并终止"""
+    try:
+        os.killpg(pid, sig)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+
+def _pid_alive(pid):
+    """检查本机进程是否仍在运行"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """SQLite 持久化任务队列"""
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else default_db_path()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.log_dir = self.db_path.parent / "job-logs"
+        self.host = socket.gethostname()
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def submit(self, input_file, output_dir=None, options=None):
+        """提交任务，立即返回任务信息"""
+        job_id = uuid.uuid4().hex[:12]
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, input_file, output_dir, options, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, str(Path(input_file).resolve()),
+                 str(Path(output_dir).resolve()) if output_dir else None,
+                 json.dumps(options or {}, ensure_ascii=False), datetime.now().isoformat())
+            )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """查询单个任务"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row)
+
+    def list_jobs(self, status=None, limit=50):
+        """按提交时间倒序列出任务"""
+        query = "SELECT * FROM jobs"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        """取消任务：排队中的直接取消，运行中的由 worker 终止"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            if row["status"] == QUEUED:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ?",
+                    (CANCELLED, datetime.now().isoformat(), job_id)
+                )
+            elif row["status"] == RUNNING:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            conn.execute("COMMIT")
+        return self.get(job_id)
+
+    def running_count(self, host=None):
+        """运行中任务数（可按机器过滤）"""
+        with self._connect() as conn:
+            if host:
+                row = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND host = ?", (RUNNING, host)
+                ).fetchone()
+            else:
+                row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()
+        return row[0]
+
+    def claim(self, max_jobs, pid):
+        """
+        原子地领取最早排队的任务
+
+        同一机器上所有 worker 共享 max_jobs 限额，避免多 worker 超额占用 CPU
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            running = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND host = ?", (RUNNING, self.host)
+            ).fetchone()[0]
+            if running >= max_jobs:
+                conn.execute("ROLLBACK")
+                return None
+
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, host = ?, pid = ?, started_at = ?, heartbeat = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, self.host, pid, datetime.now().isoformat(), time.time(), row["id"])
+            )
+            conn.execute("COMMIT")
+        return self.get(row["id"])
+
+    def set_process(self, job_id, child_pid, log_file):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET child_pid = ?, log_file = ? WHERE id = ?",
+                         (child_pid, log_file, job_id))
+
+    def heartbeat(self, job_ids):
+        if not job_ids:
+            return
+        with self._connect() as conn:
+            conn.executemany("UPDATE jobs SET heartbeat = ? WHERE id = ?",
+                             [(time.time(), job_id) for job_id in job_ids])
+
+    def cancel_requested(self, job_ids):
+        """返回其中已请求取消的任务 ID"""
+        if not job_ids:
+            return set()
+        placeholders = ",".join("?" * len(job_ids))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({placeholders})",
+                list(job_ids)
+            ).fetchall()
+        return {row["id"] for row in rows}
+
+    def finish(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, "
+                "pid = NULL, child_pid = NULL WHERE id = ?",
+                (status, datetime.now().isoformat(),
+                 json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, job_id)
+            )
+
+    def recover_stale(self):
+        """
+        回收失联任务：本机 worker 进程已退出的，或其他机器长时间无心跳的
+
+        重新排队（未超过最大尝试次数时），依赖 process_audio 的断点续跑避免重复计算
+        """
+        recovered = []
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT * FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            for row in rows:
+                if row["host"] == self.host:
+                    stale = not _pid_alive(row["pid"])
+                    # worker 已退出但转换子进程仍在运行：终止孤儿进程组，避免超额占用
+                    if stale and _pid_alive(row["child_pid"]):
+                        _kill_group(row["child_pid"])
+                else:
+                    stale = (row["heartbeat"] or 0) < now - STALE_SECONDS
+                if not stale:
+                    continue
+
+                if row["cancel_requested"]:
+                    new_status, error = CANCELLED, None
+                elif row["attempts"] >= MAX_ATTEMPTS:
+                    new_status, error = FAILED, f"worker 多次中断，已尝试 {row['attempts']} 次"
+                else:
+                    new_status, error = QUEUED, None
+
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, pid = NULL, child_pid = NULL, "
+                    "host = NULL, finished_at = ? WHERE id = ?",
+                    (new_status, error,
+                     datetime.now().isoformat() if new_status != QUEUED else None, row["id"])
+                )
+                recovered.append(row["id"])
+            conn.execute("COMMIT")
+        return recovered
+
+
+def _job_command(job):
+    """构建执行任务的 audio_to_midi.py 命令"""
+    options = job["options"]
+    cmd = [sys.executable, str(AUDIO_TO_MIDI_SCRIPT), job["input_file"]]
+    if job["output_dir"]:
+        cmd.append(job["output_dir"])
+    cmd += ["--transcriber", options.get("transcriber", DEFAULT_TRANSCRIBER)]
+    for name, flag in _FLAG_OPTIONS.items():
+        if options.get(name):
+            cmd.append(flag)
+    for name, flag in _VALUE_OPTIONS.items():
+        if options.get(name) is not None:
+            cmd += [flag, str(options[name])]
+    return cmd
+
+
+def _collect_result(result_file):
+    """解析 audio_to_midi.py 写到 stdout 的 JSON 结果（stderr 单独进入日志，不会混入）"""
+    try:
+        with open(result_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def run_worker(queue, max_jobs=None, poll_interval=2.0, once=False):
+    """
+    worker 主循环：领取任务、在子进程中执行、处理取消、写回结果
+
+    Args:
+        queue: JobQueue
+        max_jobs: 本机并发上限（默认按 CPU 核数计算）
+        poll_interval: 轮询间隔（秒）
+        once: 处理完当前可领取的任务后退出
+    """
+    max_jobs = max_jobs or default_max_jobs()
+    queue.log_dir.mkdir(parents=True, exist_ok=True)
+    running = {}  # job_id -> (Popen, log_file, result_file)
+
+    while True:
+        queue.recover_stale()
+
+        # 回收已结束的子进程
+        for job_id, (proc, log_file, result_file) in list(running.items()):
+            if proc.poll() is None:
+                continue
+            del running[job_id]
+            result = _collect_result(result_file)
+            job = queue.get(job_id)
+            if job and job["cancel_requested"]:
+                queue.finish(job_id, CANCELLED, result)
+            elif proc.returncode == 0 and result and result.get("status") == "success":
+                queue.finish(job_id, SUCCEEDED, result)
+            else:
+                error = (result or {}).get("error") or f"进程退出码 {proc.returncode}，详见 {log_file}"
+                queue.finish(job_id, FAILED, result, error)
+
+        # 终止已请求取消的任务
+        for job_id in queue.cancel_requested(list(running)):
+            proc = running[job_id][0]
+            if proc.poll() is None:
+                _kill_group(proc.pid)
+
+        # 在并发限额内领取新任务
+        while len(running) < max_jobs:
+            job = queue.claim(max_jobs, os.getpid())
+            if job is None:
+                break
+            log_file = str(queue.log_dir / f"{job['id']}.log")
+            result_file = str(queue.log_dir / f"{job['id']}.result.json")
+            # 告知子进程同机并发数，由 audio_to_midi 的资源规划均分核心和内存
+            env = dict(os.environ, MUSICIFY_CONCURRENT_JOBS=str(max_jobs))
+            # stdout 只有结果 JSON，stderr（工具输出、进度条）单独写日志；
+            # 独立会话使任务及其派生进程同属一个进程组，取消时整组终止
+            with open(result_file, 'w', encoding='utf-8') as out, open(log_file, 'w', encoding='utf-8') as log:
+                proc = subprocess.Popen(_job_command(job), stdout=out, stderr=log,
+                                        cwd=str(AUDIO_TO_MIDI_SCRIPT.parent), env=env,
+                                        start_new_session=True)
+            queue.set_process(job["id"], proc.pid, log_file)
+            running[job["id"]] = (proc, log_file, result_file)
+
+        queue.heartbeat(list(running))
+
+        if once and not running:
+            return
+        time.sleep(poll_interval)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="音频转 MIDI 任务队列")
+    parser.add_argument("--db", help="任务数据库路径（默认 ~/.musicify/jobs.db）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    submit = sub.add_parser("submit", help="提交转换任务")
+    submit.add_argument("input_mp3", help="输入 MP3 文件路径")
+    submit.add_argument("output_dir", nargs="?", help="输出目录（可选）")
+    submit.add_argument("--transcriber", choices=list(TRANSCRIBERS), default=DEFAULT_TRANSCRIBER)
+    submit.add_argument("--no-shared-pcm", action="store_true")
+    submit.add_argument("--no-resume", action="store_true")
+    submit.add_argument("--memory-budget", type=int, help="单任务内存预算 (MB)")
+    submit.add_argument("--analyze", action="store_true", help="转写后在进程内分析旋律特征")
+    submit.add_argument("--lyrics", help="旋律分析使用的歌词文件（配合 --analyze）")
+    submit.add_argument("--no-midi", action="store_true", help="配合 --analyze：不导出 MIDI 文件")
+    submit.add_argument("--no-dedup", action="store_true", help="不使用音频指纹复用已处理的同一首歌")
+    submit.add_argument("--no-vad", action="store_true", help="不检测演唱区段，整段转写")
+
+    for name, help_text in (("status", "查询任务状态"), ("result", "获取任务结果"), ("cancel", "取消任务")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("job_id")
+
+    list_cmd = sub.add_parser("list", help="列出任务")
+    list_cmd.add_argument("--status", choices=[QUEUED, RUNNING, *FINISHED_STATES])
+    list_cmd.add_argument("--limit", type=int, default=50)
+
+    worker = sub.add_parser("worker", help="启动 worker")
+    worker.add_argument("--max-jobs", type=int, help="本机并发上限")
+    worker.add_argument("--poll-interval", type=float, default=2.0)
+    worker.add_argument("--once", action="store_true", help="处理完队列后退出")
+
+    args = parser.parse_args()
+    queue = JobQueue(args.db)
+
+    if args.command == "submit":
+        if not Path(args.input_mp3).exists():
+            output_json({"status": "error", "error": f"输入文件不存在: {args.input_mp3}"})
+            sys.exit(1)
+        if args.lyrics and not Path(args.lyrics).exists():
+            output_json({"status": "error", "error": f"歌词文件不存在: {args.lyrics}"})
+            sys.exit(1)
+        options = {"transcriber": args.transcriber, "memory_budget": args.memory_budget,
+                   # worker 在脚本目录下运行，歌词路径须为绝对路径
+                   "lyrics": str(Path(args.lyrics).resolve()) if args.lyrics else None}
+        options.update({name: getattr(args, name) for name in _FLAG_OPTIONS})
+        job = queue.submit(args.input_mp3, args.output_dir, options)
+        output_json({
+            "status": "submitted",
+            "job": job,
+            "status_command": f"python3 {Path(__file__).resolve()} status {job['id']}"
+        })
+
+    elif args.command in ("status", "result", "cancel"):
+        job = queue.cancel(args.job_id) if args.command == "cancel" else queue.get(args.job_id)
+        if job is None:
+            output_json({"status": "error", "error": f"任务不存在: {args.job_id}"})
+            sys.exit(1)
+        if args.command == "result":
+            if job["status"] not in FINISHED_STATES:
+                output_json({"status": "pending", "job_status": job["status"], "job_id": job["id"]})
+                sys.exit(1)
+            output_json(job["result"] or {"status": job["status"], "error": job["error"]})
+            sys.exit(0 if job["status"] == SUCCEEDED else 1)
+        output_json(job)
+
+    elif args.command == "list":
+        output_json({"jobs": queue.list_jobs(args.status, args.limit)})
+
+    elif args.command == "worker":
+        run_worker(queue, args.max_jobs, args.poll_interval, args.once)
+
+
+if __name__ == "__main__":
+    main()
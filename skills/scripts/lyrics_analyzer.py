@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+歌词分析器 - 单次遍历完成段落、行、字数和句尾韵脚分析
+
+韵脚查找表由 skills/resources/rhyme-patterns.json 的 common_rhymes 编译而来
+（每个词的末字 → 韵母组），每个进程只编译一次，适合批量分析整个歌词语料。
+编译时将资源文件中的组名（如 ing、iang、iao）按十三辙归一，同一字出现在多个组时，
+这些组视为可互押并合并为一组；资源文件本身不做修改。
+查找表未收录的字在安装了 pypinyin 时按拼音韵母归入同名的韵母组。
+
+用法:
+    python lyrics_analyzer.py <lyrics.txt|目录> [...] [--pretty]
+"""
+
+import json
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterable, Iterator
+
+RHYME_PATTERNS_PATH = Path(__file__).resolve().parent.parent / "resources" / "rhyme-patterns.json"
+
+# 韵脚未知时在韵式中使用的占位符，其余字母按出现顺序分配给韵母组
+UNKNOWN_RHYME = "X"
+_SCHEME_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWYZ"
+
+# 拼音韵母 → 韵母组（十三辙），用于归一 rhyme-patterns.json 的组名和 pypinyin 回退结果
+PINYIN_FINAL_GROUPS = {
+    'a': 'a', 'ia': 'a', 'ua': 'a',
+    'o': 'o', 'uo': 'o', 'e': 'o',
+    'ie': 'ie', 've': 'ie', 'ue': 'ie',
+    'i': 'i', 'v': 'i', 'er': 'i',
+    'u': 'u',
+    'ai': 'ai', 'uai': 'ai',
+    'ei': 'ei', 'ui': 'ei', 'uei': 'ei',
+    'ao': 'ao', 'iao': 'ao',
+    'ou': 'ou', 'iu': 'ou', 'iou': 'ou',
+    'an': 'an', 'ian': 'an', 'uan': 'an', 'van': 'an',
+    'en': 'en', 'in': 'en', 'un': 'en', 'uen': 'en', 'vn': 'en',
+    'ang': 'ang', 'iang': 'ang', 'uang': 'ang',
+    'eng': 'eng', 'ing': 'eng', 'ong': 'eng', 'iong': 'eng', 'ueng': 'eng',
+}
+
+
+@dataclass
+class RhymeTable:
+    """句尾字 → 韵母组查找表"""
+    char_to_group: Dict[str, str]
+    groups: List[str]
+    # 资源文件中的组名及归一后的组名 → 合并后的组名
+    aliases: Dict[str, str] = field(default_factory=dict)
+    # pypinyin 回退结果的缓存（含未命中的 None）
+    _fallback_cache: Dict[str, Optional[str]] = field(default_factory=dict, repr=False)
+
+    def lookup(self, char: str) -> Optional[str]:
+        group = self.char_to_group.get(char)
+        if group is not None:
+            return group
+        if char not in self._fallback_cache:
+            self._fallback_cache[char] = self.group_for_final(_pinyin_final(char))
+        return self._fallback_cache[char]
+
+    def group_for_final(self, final: Optional[str]) -> Optional[str]:
+        """拼音韵母 → 韵母组（与查找表同一组名空间）"""
+        group = PINYIN_FINAL_GROUPS.get(final)
+        return self.aliases.get(group, group)
+
+
+def _pinyin_final(char: str) -> Optional[str]:
+    """使用 pypinyin（可选依赖）取汉字韵母"""
+    try:
+        from pypinyin import lazy_pinyin, Style
+    except ImportError:
+        return None
+    if not '一' <= char <= '鿿':
+        return None
+    final = lazy_pinyin(char, style=Style.FINALS, strict=False)[0]
+    return final or None
+
+
+@lru_cache(maxsize=None)
+def load_rhyme_table(path: str = str(RHYME_PATTERNS_PATH)) -> RhymeTable:
+    """从 rhyme-patterns.json 编译韵脚查找表（同一路径只编译一次）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        patterns = json.load(f)
+
+    # 并查集：组名先按十三辙归一，同一字出现在多个组时再合并这些组，合并后沿用先出现的组名
+    parent = {}
+    labels = {}
+
+    def find(group):
+        while parent[group] != group:
+            parent[group] = parent[parent[group]]
+            group = parent[group]
+        return group
+
+    first_group = {}
+    for entries in patterns.get("common_rhymes", {}).values():
+        for entry in entries:
+            group = labels.setdefault(entry["group"], PINYIN_FINAL_GROUPS.get(entry["group"], entry["group"]))
+            parent.setdefault(group, group)
+            for word in entry["words"]:
+                # 押韵看末字
+                root, other = find(group), find(first_group.setdefault(word[-1], group))
+                if root != other:
+                    order = list(parent)
+                    first, second = sorted((root, other), key=order.index)
+                    parent[second] = first
+
+    return RhymeTable(
+        char_to_group={char: find(group) for char, group in first_group.items()},
+        groups=[group for group in parent if find(group) == group],
+        aliases={**{label: find(group) for label, group in labels.items()},
+                 **{group: find(group) for group in parent}}
+    )
+
+
+def _line_final_char(line: str) -> Optional[str]:
+    """行尾最后一个文字字符（跳过标点）"""
+    for char in reversed(line):
+        if char.isalpha():
+            return char
+    return None
+
+
+def _rhyme_scheme(finals: List[Optional[str]]) -> str:
+    """按出现顺序为韵母组分配字母，得到 AABB 形式的韵式"""
+    letters = {}
+    scheme = []
+    for group in finals:
+        if group is None:
+            scheme.append(UNKNOWN_RHYME)
+            continue
+        if group not in letters:
+            letters[group] = _SCHEME_LETTERS[len(letters) % len(_SCHEME_LETTERS)]
+        scheme.append(letters[group])
+    return ''.join(scheme)
+
+
+def analyze_lyrics_text(content: str, table: Optional[RhymeTable] = None) -> Dict[str, Any]:
+    """
+    单次遍历分析歌词文本
+
+    Returns:
+        total_chars / total_lines / sections / has_structure_markers，
+        以及每段的 rhyme_finals、rhyme_scheme 和全文 rhyme_distribution
+    """
+    table = table or load_rhyme_table()
+
+    total_chars = 0
+    total_lines = 0
+    has_markers = False
+    sections = []
+    current = None
+    distribution = Counter()
+    rhymed_lines = 0
+
+    for raw_line in content.split('\n'):
+        # 字数统计覆盖全文（含段落标记），与逐字统计整个文件结果一致
+        alpha_count = sum(map(str.isalpha, raw_line))
+        total_chars += alpha_count
+
+        if raw_line.startswith('['):
+            has_markers = True
+
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        if line.startswith('[') and line.endswith(']'):
+            if current:
+                sections.append(current)
+            current = {"name": line[1:-1], "lines": [], "char_count": 0, "rhyme_finals": []}
+            continue
+
+        if not line.startswith('['):
+            total_lines += 1
+        if current is None:
+            continue
+
+        final_char = _line_final_char(line)
+        group = table.lookup(final_char) if final_char else None
+        current["lines"].append(line)
+        current["char_count"] += alpha_count
+        current["rhyme_finals"].append(group)
+        if group is not None:
+            distribution[group] += 1
+            rhymed_lines += 1
+
+    if current:
+        sections.append(current)
+
+    for section in sections:
+        section["rhyme_scheme"] = _rhyme_scheme(section["rhyme_finals"])
+
+    section_lines = sum(len(section["lines"]) for section in sections)
+    return {
+        "total_chars": total_chars,
+        "total_lines": total_lines,
+        "sections": sections,
+        "has_structure_markers": has_markers,
+        "rhyme_distribution": dict(distribution.most_common()),
+        "rhyme_coverage": rhymed_lines / section_lines if section_lines else 0.0
+    }
+
+
+def analyze_lyrics_file(path, table: Optional[RhymeTable] = None) -> Dict[str, Any]:
+    """读取并分析单个歌词文件"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return analyze_lyrics_text(f.read(), table)
+
+
+def iter_lyrics_files(paths: Iterable[str]) -> Iterator[Path]:
+    """展开文件和目录（目录下递归查找 .txt）"""
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(path.rglob("*.txt"))
+        else:
+            yield path
+
+
+def analyze_corpus(paths: Iterable[str], table: Optional[RhymeTable] = None) -> Iterator[Dict[str, Any]]:
+    """批量分析歌词语料，共享同一张韵脚查找表"""
+    table = table or load_rhyme_table()
+    for path in iter_lyrics_files(paths):
+        try:
+            result = analyze_lyrics_file(path, table)
+        except Exception as e:
+            result = {"error": f"歌词分析失败: {str(e)}"}
+        result["lyrics_path"] = str(path)
+        yield result
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="歌词结构与韵脚分析")
+    parser.add_argument("paths", nargs="+", help="歌词文件或目录")
+    parser.add_argument("--pretty", action="store_true", help="格式化 JSON 输出")
+    args = parser.parse_args()
+
+    results = list(analyze_corpus(args.paths))
+    schemes = Counter(
+        section["rhyme_scheme"]
+        for result in results for section in result.get("sections", [])
+    )
+
+    output = {
+        "status": "success",
+        "file_count": len(results),
+        "scheme_distribution": dict(schemes.most_common(20)),
+        "files": results
+    }
+    print(json.dumps(output, ensure_ascii=False, indent=2 if args.pretty else None))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+旋律结构检测 - 基于后缀数组查找重复动机和重复段落（主歌/副歌候选）
+
+旋律先转换为与移调无关的 token 序列：每个 token 由相邻两音的音程和前一音的
+起音间隔（IOI，按十六分音符量化）组成，因此移调后的重复和原样重复视为相同。
+
+重复段落：在 token 序列上用 NumPy 前缀倍增构建后缀数组（O(log n) 轮 lexsort，
+O(n log² n)），Kasai 算法计算 LCP 数组（O(n)），再枚举 LCP 区间得到右极大重复。
+区间至多 n 个，每个区间最多取 MAX_OCCURRENCES 个出现位置，因此枚举为 O(n × c)，
+即使整首旋律高度重复（区间层层嵌套）也不会退化为 O(n²)；段落挑选用覆盖前缀和
+计算重叠，每个候选只与其出现次数成正比。
+
+重复动机：对每个动机长度 k 逐级计算 k-gram 编号（上一级编号与新 token 组合后
+np.unique 重编号），按编号分组统计不重叠出现次数，O(k 的取值数 × n log n)。
+所有长度的 k-gram 都参与（而不只是右极大重复），因此嵌套在更长重复中、出现
+次数更多的短动机同样可以检出。
+"""
+
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+
+# 音程截断范围（半音），超出视为同一类大跳
+MAX_INTERVAL = 24
+# IOI 量化：每拍 4 格（十六分音符），最长 16 拍
+RHYTHM_STEPS_PER_BEAT = 4
+MAX_RHYTHM_STEPS = 16 * RHYTHM_STEPS_PER_BEAT
+
+# 每个重复段落最多取的出现位置数（超出部分不计入次数）
+MAX_OCCURRENCES = 64
+
+_RHYTHM_CLASSES = MAX_RHYTHM_STEPS + 1
+_SECTION_LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def tokenize_melody(pitches: np.ndarray, onsets: np.ndarray, ticks_per_beat: int) -> np.ndarray:
+    """
+    将音符序列转换为移调无关的 token（长度为音符数 - 1）
+
+    token i 描述音符 i → i+1：音程和音符 i 的起音间隔
+    """
+    pitches = np.asarray(pitches, dtype=np.int64)
+    onsets = np.asarray(onsets, dtype=np.float64)
+    if len(pitches) < 2:
+        return np.zeros(0, dtype=np.int64)
+
+    intervals = np.clip(np.diff(pitches), -MAX_INTERVAL, MAX_INTERVAL) + MAX_INTERVAL
+    ioi_steps = np.rint(np.diff(onsets) / ticks_per_beat * RHYTHM_STEPS_PER_BEAT)
+    rhythm = np.clip(ioi_steps, 0, MAX_RHYTHM_STEPS).astype(np.int64)
+    return intervals * _RHYTHM_CLASSES + rhythm
+
+
+def suffix_array(tokens: np.ndarray) -> np.ndarray:
+    """前缀倍增构建后缀数组（每轮一次 lexsort，共 O(log n) 轮）"""
+    n = len(tokens)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # 初始秩：token 的稠密编号
+    _, rank = np.unique(tokens, return_inverse=True)
+    rank = rank.astype(np.int64)
+    k = 1
+    while True:
+        # 第二关键字：后移 k 位的秩，越界记为 -1（短后缀排在前）
+        second = np.full(n, -1, dtype=np.int64)
+        if k < n:
+            second[:n - k] = rank[k:]
+        order = np.lexsort((second, rank))
+
+        first_sorted = rank[order]
+        second_sorted = second[order]
+        changed = np.empty(n, dtype=bool)
+        changed[0] = False
+        changed[1:] = (first_sorted[1:] != first_sorted[:-1]) | (second_sorted[1:] != second_sorted[:-1])
+
+        new_rank = np.empty(n, dtype=np.int64)
+        new_rank[order] = np.cumsum(changed)
+        rank = new_rank
+
+        if rank.max() == n - 1 or k >= n:
+            return order.astype(np.int64)
+        k *= 2
+
+
+def lcp_array(tokens: np.ndarray, sa: np.ndarray) -> np.ndarray:
+    """
+    Kasai 算法计算 LCP 数组
+
+    lcp[i] 为 sa[i-1] 与 sa[i] 两个后缀的最长公共前缀长度，lcp[0] = 0
+    """
+    n = len(tokens)
+    lcp = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return lcp
+
+    seq = tokens.tolist()
+    suffixes = sa.tolist()
+    rank = [0] * n
+    for i, start in enumerate(suffixes):
+        rank[start] = i
+
+    h = 0
+    for start in range(n):
+        r = rank[start]
+        if r == 0:
+            h = 0
+            continue
+        prev = suffixes[r - 1]
+        while start + h < n and prev + h < n and seq[start + h] == seq[prev + h]:
+            h += 1
+        lcp[r] = h
+        if h:
+            h -= 1
+    return lcp
+
+
+def _lcp_intervals(sa: np.ndarray, lcp: np.ndarray, min_length: int):
+    """
+    枚举 LCP 区间 (长度, 左端, 右端, 最小起点, 最大起点)
+
+    sa[左端..右端] 的后缀共享该长度前缀；区间内起点的最值随区间栈自底向上合并，
+    每个区间 O(1)，不需要扫描区间内的全部后缀。
+    """
+    n = len(lcp)
+    values = lcp.tolist()
+    positions = sa.tolist()
+    # 栈元素: [长度, 左端, 最小起点, 最大起点]
+    stack = [[0, 0, n, -1]]
+    for i in range(1, n + 1):
+        position = positions[i - 1]
+        top = stack[-1]
+        top[2], top[3] = min(top[2], position), max(top[3], position)
+
+        current = values[i] if i < n else 0
+        left, low, high = i - 1, position, position
+        while stack[-1][0] > current:
+            length, left, low, high = stack.pop()
+            if length >= min_length:
+                yield length, left, i - 1, low, high
+            # 弹出的区间是栈顶区间（或即将入栈的区间）的子区间，最值并入父区间
+            parent = stack[-1]
+            if parent[0] >= current:
+                parent[2], parent[3] = min(parent[2], low), max(parent[3], high)
+        if stack[-1][0] < current:
+            stack.append([current, left, low, high])
+
+
+def _non_overlapping(starts: np.ndarray, length: int) -> List[int]:
+    """贪心选出互不重叠的出现位置"""
+    selected = []
+    last_end = -1
+    for start in np.sort(starts).tolist():
+        if start >= last_end:
+            selected.append(start)
+            last_end = start + length
+    return selected
+
+
+def find_repeats(tokens: np.ndarray, min_length: int,
+                 max_occurrences: int = MAX_OCCURRENCES) -> List[Tuple[int, List[int]]]:
+    """
+    查找长度不小于 min_length、至少两次不重叠出现的右极大重复
+
+    Args:
+        max_occurrences: 每个重复最多考察的出现位置数（按后缀数组顺序截取，
+            另加最左、最右两处出现，保证能否两次不重叠出现的判断不受截取影响）
+
+    Returns:
+        [(token 长度, [起始位置, ...]), ...]
+    """
+    if len(tokens) < 2 * min_length:
+        return []
+
+    sa = suffix_array(tokens)
+    lcp = lcp_array(tokens, sa)
+
+    repeats = []
+    for length, left, right, low, high in _lcp_intervals(sa, lcp, min_length):
+        if high - low < length:
+            continue
+        candidates = sa[left:min(right + 1, left + max_occurrences)]
+        starts = _non_overlapping(np.concatenate([candidates, [low, high]]), length)
+        if len(starts) >= 2:
+            repeats.append((length, starts))
+    return repeats
+
+
+def find_motifs(tokens: np.ndarray, min_length: int, max_length: int) -> List[Tuple[int, List[int]]]:
+    """
+    查找长度在 [min_length, max_length] 内、至少两次不重叠出现的所有 k-gram
+
+    Returns:
+        [(token 长度, [起始位置, ...]), ...]
+    """
+    tokens = np.asarray(tokens, dtype=np.int64)
+    repeats = []
+    if len(tokens) < 2 * min_length:
+        return repeats
+
+    # ids[i] 为 tokens[i:i + k] 的稠密编号，由 k - 1 级编号追加一个 token 得到
+    _, ids = np.unique(tokens, return_inverse=True)
+    token_classes = int(tokens.max()) + 1
+    for length in range(2, max_length + 1):
+        if len(tokens) < 2 * length:
+            break
+        window_count = len(tokens) - length + 1
+        _, ids = np.unique(ids[:window_count] * token_classes + tokens[length - 1:], return_inverse=True)
+        if length < min_length:
+            continue
+
+        repeated = np.flatnonzero(np.bincount(ids)[ids] >= 2)
+        order = repeated[np.argsort(ids[repeated], kind='stable')]
+        boundaries = np.flatnonzero(np.diff(ids[order])) + 1
+        for group in np.split(order, boundaries):
+            starts = _non_overlapping(group, length)
+            if len(starts) >= 2:
+                repeats.append((length, starts))
+    return repeats
+
+
+def _occurrence(notes: List[Dict], start: int, length: int, ticks_per_beat: int) -> Dict[str, Any]:
+    end = start + length
+    return {
+        "start_note": start,
+        "end_note": end,
+        "start_beat": round(notes[start]['start_time'] / ticks_per_beat, 3),
+        "end_beat": round((notes[end]['start_time'] + notes[end]['duration']) / ticks_per_beat, 3)
+    }
+
+
+def _select_sections(repeats, note_count: int, max_sections: int, max_overlap: float):
+    """
+    按覆盖音符数贪心挑选互相重叠不多的段落
+
+    已选覆盖的前缀和只在选中段落时重算，候选段落与其重叠的音符数由各出现区间
+    在前缀和上做差得到，每个候选 O(出现次数)。
+    """
+    covered = np.zeros(note_count, dtype=bool)
+    covered_prefix = np.zeros(note_count + 1, dtype=np.int64)
+    selected = []
+    for length, starts in sorted(repeats, key=lambda r: (r[0] * len(r[1]), r[0]), reverse=True):
+        ends = np.asarray(starts) + length + 1
+        # 相邻两次出现可能共享一个音符：起点截到上一次出现的终点，使各区间互不相交
+        begins = np.maximum(starts, np.concatenate([[0], ends[:-1]]))
+        span = (ends - begins).sum()
+        if (covered_prefix[ends] - covered_prefix[begins]).sum() > max_overlap * span:
+            continue
+        for begin, end in zip(begins.tolist(), ends.tolist()):
+            covered[begin:end] = True
+        np.cumsum(covered, out=covered_prefix[1:])
+        selected.append((length, starts))
+        if len(selected) >= max_sections:
+            break
+    return selected, covered
+
+
+def _select_motifs(repeats, tokens: np.ndarray, max_motifs: int):
+    """
+    按出现次数挑选动机（次数相同取较长者）
+
+    与某个已选动机次数相同、且每次出现都相距同一偏移的，属于同一段更长的重复
+    （子串、平移窗口或同一段落的另一部分），跳过；次数更多的短动机即使嵌套在
+    已选动机中也会保留。
+    """
+    selected = []
+    for length, starts in sorted(repeats, key=lambda r: (len(r[1]), r[0]), reverse=True):
+        positions = np.asarray(starts)
+        if any(len(other) == len(positions) and np.ptp(positions - other) == 0 for _, other in selected):
+            continue
+        selected.append((tokens[starts[0]:starts[0] + length].tolist(), positions))
+        if len(selected) >= max_motifs:
+            break
+    return [(pattern, positions.tolist()) for pattern, positions in selected]
+
+
+def analyze_melody_structure(notes: List[Dict],
+                             ticks_per_beat: int,
+                             motif_length: Tuple[int, int] = (3, 8),
+                             min_section_length: int = 12,
+                             max_motifs: int = 10,
+                             max_sections: int = 4,
+                             max_section_overlap: float = 0.25) -> Dict[str, Any]:
+    """
+    检测重复动机和重复段落
+
+    Args:
+        notes: 按起始时间排序的音符（pitch / start_time / duration，单位 tick）
+        motif_length: 动机的 token 长度范围（音程个数）
+        min_section_length: 段落最少 token 数
+        max_section_overlap: 新段落与已选段落重叠音符的最大比例
+
+    Returns:
+        motifs、repeated_sections、chorus_candidate 和重复覆盖率
+    """
+    pitches = np.fromiter((note['pitch'] for note in notes), dtype=np.int64, count=len(notes))
+    onsets = np.fromiter((note['start_time'] for note in notes), dtype=np.float64, count=len(notes))
+    tokens = tokenize_melody(pitches, onsets, ticks_per_beat)
+
+    min_motif, max_motif = motif_length
+    sections, covered = _select_sections(
+        find_repeats(tokens, min_section_length), len(notes), max_sections, max_section_overlap
+    )
+    # 段落标签按首次出现顺序分配
+    sections.sort(key=lambda r: r[1][0])
+    repeated_sections = [
+        {
+            "label": _SECTION_LABELS[i % len(_SECTION_LABELS)],
+            "length_notes": length + 1,
+            "count": len(starts),
+            "occurrences": [_occurrence(notes, start, length, ticks_per_beat) for start in starts]
+        }
+        for i, (length, starts) in enumerate(sections)
+    ]
+
+    motifs = [
+        {
+            "length_notes": len(pattern) + 1,
+            "count": len(starts),
+            "intervals": [token // _RHYTHM_CLASSES - MAX_INTERVAL for token in pattern],
+            "ioi_beats": [(token % _RHYTHM_CLASSES) / RHYTHM_STEPS_PER_BEAT for token in pattern],
+            "occurrences": [_occurrence(notes, start, len(pattern), ticks_per_beat) for start in starts]
+        }
+        for pattern, starts in _select_motifs(find_motifs(tokens, min_motif, max_motif), tokens, max_motifs)
+    ]
+
+    # 副歌候选：重复次数最多的段落（次数相同取较长者）
+    chorus = max(repeated_sections, key=lambda s: (s["count"], s["length_notes"]), default=None)
+
+    return {
+        "token_count": int(len(tokens)),
+        "motifs": motifs,
+        "repeated_sections": repeated_sections,
+        "chorus_candidate": chorus["label"] if chorus else None,
+        "repetition_coverage": float(covered.mean()) if len(notes) else 0.0
+    }
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+滑动窗口旋律特征 - 按 N 拍窗口和步长输出调性、音程分布、节奏型和密度的时间序列
+
+整曲特征会把主歌、副歌的差异平均掉。这里不对每个窗口重新运行整曲分析器，
+而是对音符数组一次性分类，构建各类别的前缀和（累积直方图），窗口内的计数
+由 searchsorted 定位音符下标后做差得到；音域最值用稀疏表做 O(1) 区间查询。
+总体 O(n log n + 窗口数 × 类别数)，与窗口重叠程度无关。
+
+分类规则与 ProfessionalMidiAnalyzer 的整曲分析一致，窗口覆盖全曲时结果相同。
+"""
+
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+# 时值分类（拍），顺序即整曲分析中的判断顺序
+RHYTHM_CLASSES = (
+    ('whole', 4.0),
+    ('half', 2.0),
+    ('quarter', 1.0),
+    ('eighth', 0.5),
+    ('sixteenth', 0.25),
+    ('dotted', 1.5),
+    ('triplet', 0.33),
+)
+RHYTHM_TOLERANCE = 0.1
+# 超过该比例的节奏型计入复杂度
+RHYTHM_COMPLEXITY_MIN_RATIO = 0.05
+
+INTERVAL_CLASSES = ('unison', 'step', 'small_leap', 'large_leap', 'octave')
+
+
+def _rhythm_class(beat_durations: np.ndarray) -> np.ndarray:
+    """每个音符的节奏型下标，未归类为 -1"""
+    conditions = [np.abs(beat_durations - value) < RHYTHM_TOLERANCE for _, value in RHYTHM_CLASSES]
+    return np.select(conditions, np.arange(len(RHYTHM_CLASSES)), default=-1)
+
+
+def _interval_class(intervals: np.ndarray) -> np.ndarray:
+    """每个音程的类别下标（INTERVAL_CLASSES）"""
+    size = np.abs(intervals)
+    return np.select(
+        [size == 0, size <= 2, size <= 4, size == 12],
+        [0, 1, 2, 4],
+        default=3
+    )
+
+
+def _prefix_counts(classes: np.ndarray, n_classes: int) -> np.ndarray:
+    """累积直方图：第 i 行为前 i 个元素中各类别的计数，形状 (n + 1, n_classes)"""
+    counts = np.zeros((len(classes) + 1, n_classes), dtype=np.int64)
+    valid = classes >= 0
+    one_hot = np.zeros((len(classes), n_classes), dtype=np.int64)
+    one_hot[np.flatnonzero(valid), classes[valid]] = 1
+    np.cumsum(one_hot, axis=0, out=counts[1:])
+    return counts
+
+
+def _sparse_table(values: np.ndarray, op) -> List[np.ndarray]:
+    """稀疏表：levels[k][i] 为 values[i:i + 2^k] 的 op 归约"""
+    levels = [values]
+    span = 1
+    while 2 * span <= len(values):
+        previous = levels[-1]
+        levels.append(op(previous[:-span], previous[span:]))
+        span *= 2
+    return levels
+
+
+def _range_query(levels: List[np.ndarray], first: np.ndarray, last: np.ndarray, op) -> np.ndarray:
+    """查询 values[first:last] 的 op 归约（要求 last > first）"""
+    k = np.floor(np.log2(last - first)).astype(np.int64)
+    result = np.empty(len(first), dtype=levels[0].dtype)
+    for level in np.unique(k):
+        rows = k == level
+        table = levels[level]
+        result[rows] = op(table[first[rows]], table[last[rows] - (1 << level)])
+    return result
+
+
+def _ratios(counts: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    return np.divide(counts, totals[:, None], out=np.zeros(counts.shape, dtype=np.float64),
+                     where=totals[:, None] > 0)
+
+
+def _rounded(values: np.ndarray, digits: int = 4) -> List[float]:
+    return np.round(values.astype(np.float64), digits).tolist()
+
+
+def windowed_features(notes: List[Dict],
+                      ticks_per_beat: int,
+                      pentatonic_scales: Dict[str, List[int]],
+                      window_beats: float = 8.0,
+                      hop_beats: Optional[float] = None) -> Dict[str, Any]:
+    """
+    计算滑动窗口旋律特征序列
+
+    Args:
+        notes: 按起始时间排序的音符（pitch / start_time / duration，单位 tick）
+        pentatonic_scales: 调名 -> 五声音阶音级，与整曲调性分析一致
+        window_beats: 窗口长度（拍）
+        hop_beats: 窗口步长（拍，默认等于窗口长度，即不重叠）
+
+    Returns:
+        按列组织的特征序列：每个键对应一个与窗口一一对应的列表
+        （音符按起音落在哪个窗口归属，音程需两个音符都在窗口内）
+    """
+    hop_beats = window_beats if hop_beats is None else hop_beats
+    if window_beats <= 0 or hop_beats <= 0:
+        raise ValueError("窗口长度和步长必须为正数")
+
+    pitches = np.fromiter((note['pitch'] for note in notes), dtype=np.int64, count=len(notes))
+    onsets = np.fromiter((note['start_time'] for note in notes), dtype=np.int64, count=len(notes))
+    durations = np.fromiter((note['duration'] for note in notes), dtype=np.int64, count=len(notes))
+
+    # 窗口边界 (tick) 与窗口内音符下标区间 [first, last)
+    song_end = int((onsets + durations).max()) if len(notes) else 0
+    window_ticks = window_beats * ticks_per_beat
+    hop_ticks = hop_beats * ticks_per_beat
+    window_count = max(1, int(np.ceil(max(song_end - window_ticks, 0) / hop_ticks)) + 1)
+    window_start = np.arange(window_count) * hop_ticks
+    first = np.searchsorted(onsets, window_start, side='left')
+    last = np.searchsorted(onsets, window_start + window_ticks, side='left')
+    note_count = last - first
+    interval_count = np.maximum(note_count - 1, 0)
+
+    # 节奏型
+    beat_durations = durations / ticks_per_beat
+    rhythm_prefix = _prefix_counts(_rhythm_class(beat_durations), len(RHYTHM_CLASSES))
+    rhythm = _ratios(rhythm_prefix[last] - rhythm_prefix[first], note_count)
+    syncopated = ((beat_durations > 0.3) & (beat_durations < 0.7)) | ((beat_durations > 1.3) & (beat_durations < 1.7))
+    syncopated_prefix = np.concatenate([[0], np.cumsum(syncopated)])
+    syncopation = _ratios((syncopated_prefix[last] - syncopated_prefix[first])[:, None], note_count)[:, 0]
+
+    # 音程：音程 i 连接音符 i 与 i+1，窗口内为 [first, last - 1)
+    interval_prefix = _prefix_counts(_interval_class(np.diff(pitches)), len(INTERVAL_CLASSES))
+    last_interval = len(interval_prefix) - 1
+    interval_first = np.minimum(first, last_interval)
+    interval_last = np.minimum(np.maximum(last - 1, first), last_interval)
+    intervals = _ratios(interval_prefix[interval_last] - interval_prefix[interval_first], interval_count)
+
+    # 调性：音级累积直方图 × 五声音阶隶属矩阵，取得分最高的调（并列取先出现者）
+    key_names = list(pentatonic_scales)
+    membership = np.zeros((12, len(key_names)), dtype=np.int64)
+    for column, scale in enumerate(pentatonic_scales.values()):
+        membership[scale, column] = 1
+    pc_prefix = _prefix_counts(pitches % 12, 12)
+    key_scores = (pc_prefix[last] - pc_prefix[first]) @ membership
+    best_key = np.argmax(key_scores, axis=1)
+    pentatonic_ratio = _ratios(key_scores.max(axis=1)[:, None], note_count)[:, 0]
+
+    # 音域与平均音高
+    occupied = note_count > 0
+    low = np.zeros(window_count, dtype=np.int64)
+    high = np.zeros(window_count, dtype=np.int64)
+    if occupied.any():
+        low[occupied] = _range_query(_sparse_table(pitches, np.minimum), first[occupied], last[occupied], np.minimum)
+        high[occupied] = _range_query(_sparse_table(pitches, np.maximum), first[occupied], last[occupied], np.maximum)
+    pitch_prefix = np.concatenate([[0], np.cumsum(pitches)])
+    mean_pitch = _ratios((pitch_prefix[last] - pitch_prefix[first])[:, None], note_count)[:, 0]
+
+    return {
+        "window_beats": window_beats,
+        "hop_beats": hop_beats,
+        "window_count": window_count,
+        "start_beat": _rounded(window_start / ticks_per_beat, 3),
+        "end_beat": _rounded((window_start + window_ticks) / ticks_per_beat, 3),
+        "note_count": note_count.tolist(),
+        "note_density": _rounded(note_count / window_beats),
+        "mean_pitch": _rounded(mean_pitch, 2),
+        "note_range": [[int(lo), int(hi)] if has_notes else None
+                       for lo, hi, has_notes in zip(low, high, occupied)],
+        "key_signature": [key_names[k] if has_notes else None for k, has_notes in zip(best_key, occupied)],
+        "pentatonic_ratio": _rounded(pentatonic_ratio),
+        "rhythm_patterns": {name: _rounded(rhythm[:, i]) for i, (name, _) in enumerate(RHYTHM_CLASSES)},
+        "rhythm_complexity": (rhythm > RHYTHM_COMPLEXITY_MIN_RATIO).sum(axis=1).tolist(),
+        "syncopation_level": _rounded(syncopation),
+        "interval_distribution": {name: _rounded(intervals[:, i]) for i, name in enumerate(INTERVAL_CLASSES)},
+        "stepwise_ratio": _rounded(intervals[:, 1]),
+        "leap_ratio": _rounded(intervals[:, 2] + intervals[:, 3])
+    }
@@ -13,8 +13,10 @@ MIDI 音乐分析器 - 专业级旋律风格分析
 import sys
 import json
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Sequence, Tuple
 from dataclasses import dataclass, asdict
 import traceback
 
@@ -37,6 +39,10 @@ except ImportError as e:
     }, ensure_ascii=False, indent=2))
     sys.exit(1)
 
+from lyrics_analyzer import analyze_lyrics_file
+from melody_structure import analyze_melody_structure
+from melody_windows import windowed_features
+
 @dataclass
 class VocalTrackCandidate:
     """人声音轨候选"""
@@ -74,10 +80,36 @@ class MelodyFeatures:
     contour_vector: List[int]
     phrase_structure: List[Tuple[int, int]]
 
+# 并行音轨评分时 worker 进程内共享的状态（由进程池 initializer 设置）
+_TRACK_WORKER_STATE: Dict[str, Any] = {}
+
+
+def _init_track_worker(analyzer, midi_file, lyrics_info):
+    _TRACK_WORKER_STATE.update(analyzer=analyzer, midi_file=midi_file, lyrics_info=lyrics_info)
+
+
+def _score_track_in_worker(track_idx: int):
+    state = _TRACK_WORKER_STATE
+    return state['analyzer']._score_track(state['midi_file'], track_idx, state['lyrics_info'])
+
+
 class ProfessionalMidiAnalyzer:
     """专业级 MIDI 分析器"""
 
-    def __init__(self):
+    def __init__(self, workers: int = 1, parallel_track_threshold: int = 32,
+                 window_beats: Optional[float] = None, hop_beats: Optional[float] = None):
+        """
+        Args:
+            workers: 音轨评分的并行进程数（1 为串行，0 为 CPU 核数）
+            parallel_track_threshold: 音轨数达到该值才启用并行，小文件保持串行
+            window_beats: 设置后额外输出该拍数窗口的滑动特征序列 (windowed_features)
+            hop_beats: 滑动窗口步长（拍，默认等于窗口长度）
+        """
+        self.workers = workers
+        self.parallel_track_threshold = parallel_track_threshold
+        self.window_beats = window_beats
+        self.hop_beats = hop_beats
+
         # 人声音域范围 (MIDI note numbers)
         self.vocal_range = (48, 84)  # C3 to C6
 
@@ -134,11 +166,10 @@ class ProfessionalMidiAnalyzer:
             if not notes:
                 return self._create_error_result("no_notes", "人声音轨中未找到音符数据")
 
-            # 深度旋律特征分析
-            melody_features = self._extract_melody_features(notes, midi_file)
-
-            # 生成创作模式推荐
-            mode_recommendation = self.recommend_creation_mode(melody_features, lyrics_info)
+            # 深度旋律特征、重复结构和创作模式推荐
+            melody_features, melody_structure, mode_recommendation = self._analyze_notes(
+                notes, midi_file.ticks_per_beat, lyrics_info
+            )
 
             # 构建分析结果
             result = {
@@ -156,6 +187,8 @@ class ProfessionalMidiAnalyzer:
                     "selection_confidence": best_vocal.confidence_score
                 },
                 "melody_features": asdict(melody_features),
+                "melody_structure": melody_structure,
+                "windowed_features": self._windowed_features(notes, midi_file.ticks_per_beat),
                 "lyrics_analysis": lyrics_info,
                 "mode_recommendation": mode_recommendation,  # NEW: 模式推荐信息
                 "technical_info": {
@@ -174,121 +207,193 @@ class ProfessionalMidiAnalyzer:
                 {"traceback": traceback.format_exc()}
             )
 
-    def _analyze_lyrics(self, lyrics_path: str) -> Optional[Dict[str, Any]]:
-        """分析歌词文件"""
+    def analyze_note_events(self,
+                            start: Sequence[float],
+                            end: Sequence[float],
+                            pitch: Sequence[int],
+                            velocity: Optional[Sequence[int]] = None,
+                            lyrics_path: Optional[str] = None,
+                            tempo_bpm: float = 120.0,
+                            ticks_per_beat: int = 480,
+                            source: Optional[str] = None) -> Dict[str, Any]:
+        """
+        直接分析转写器输出的音符事件（以秒为单位），无需先写出再解析 MIDI 文件
+
+        Args:
+            start / end / pitch / velocity: 单声部音符事件数组（Basic Pitch note_events、YIN NoteEvents 等）
+            tempo_bpm / ticks_per_beat: 秒转 tick 的换算参数，与导出 MIDI 时一致则结果与分析该 MIDI 相同
+            source: 记录在 file_info 中的来源（如人声文件路径）
+        """
         try:
-            with open(lyrics_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 统计字数（排除标点符号）
-            clean_text = ''.join(char for char in content if char.isalpha())
-
-            # 检测段落结构
-            sections = []
-            current_section = None
-
-            for line in content.split('\n'):
-                line = line.strip()
-                if line.startswith('[') and line.endswith(']'):
-                    if current_section:
-                        sections.append(current_section)
-                    current_section = {
-                        "name": line[1:-1],
-                        "lines": [],
-                        "char_count": 0
-                    }
-                elif line and current_section:
-                    current_section["lines"].append(line)
-                    current_section["char_count"] += len([c for c in line if c.isalpha()])
-
-            if current_section:
-                sections.append(current_section)
+            start = np.asarray(start, dtype=np.float64)
+            end = np.asarray(end, dtype=np.float64)
+            pitch = np.asarray(pitch, dtype=np.int64)
+            velocity = np.full(len(pitch), 64) if velocity is None else np.asarray(velocity, dtype=np.int64)
+
+            ticks_per_second = tempo_bpm / 60.0 * ticks_per_beat
+            start_ticks = np.rint(start * ticks_per_second).astype(np.int64)
+            end_ticks = np.maximum(np.rint(end * ticks_per_second).astype(np.int64), start_ticks + 1)
+            order = np.argsort(start_ticks, kind='stable')
+
+            notes = [
+                {'pitch': p, 'start_time': s, 'duration': e - s, 'velocity': v}
+                for s, e, p, v in zip(start_ticks[order].tolist(), end_ticks[order].tolist(),
+                                      pitch[order].tolist(), velocity[order].tolist())
+            ]
+
+            if not notes:
+                return self._create_error_result("no_notes", "转写结果中未找到音符数据")
+
+            lyrics_info = self._analyze_lyrics(lyrics_path) if lyrics_path else None
+            melody_features, melody_structure, mode_recommendation = self._analyze_notes(
+                notes, ticks_per_beat, lyrics_info
+            )
 
             return {
-                "total_chars": len(clean_text),
-                "total_lines": len([line for line in content.split('\n') if line.strip() and not line.strip().startswith('[')]),
-                "sections": sections,
-                "has_structure_markers": any(line.startswith('[') for line in content.split('\n'))
+                "status": "success",
+                "analysis_type": "professional",
+                "file_info": {
+                    "source": source,
+                    "lyrics_path": lyrics_path,
+                    "note_count": len(notes)
+                },
+                "vocal_track_analysis": None,
+                "melody_features": asdict(melody_features),
+                "melody_structure": melody_structure,
+                "windowed_features": self._windowed_features(notes, ticks_per_beat),
+                "lyrics_analysis": lyrics_info,
+                "mode_recommendation": mode_recommendation,
+                "technical_info": {
+                    "ticks_per_beat": ticks_per_beat,
+                    "tempo_bpm": tempo_bpm,
+                    "total_time": int(end_ticks.max()),
+                    "format_type": None
+                }
             }
 
+        except Exception as e:
+            return self._create_error_result(
+                "analysis_error",
+                f"分析过程中发生错误: {str(e)}",
+                {"traceback": traceback.format_exc()}
+            )
+
+    def _analyze_notes(self, notes: List[Dict], ticks_per_beat: int, lyrics_info: Optional[Dict]):
+        """旋律特征、重复结构和创作模式推荐（MIDI 文件与音符事件两条路径共用）"""
+        melody_features = self._extract_melody_features(notes, ticks_per_beat)
+
+        # 重复动机与段落（主歌/副歌候选）
+        melody_structure = analyze_melody_structure(notes, ticks_per_beat)
+
+        mode_recommendation = self.recommend_creation_mode(melody_features, lyrics_info)
+        return melody_features, melody_structure, mode_recommendation
+
+    def _windowed_features(self, notes: List[Dict], ticks_per_beat: int) -> Optional[Dict[str, Any]]:
+        """滑动窗口特征序列（未设置 window_beats 时为 None）"""
+        if not self.window_beats:
+            return None
+        return windowed_features(notes, ticks_per_beat, self.pentatonic_scales,
+                                 self.window_beats, self.hop_beats)
+
+    def _analyze_lyrics(self, lyrics_path: str) -> Optional[Dict[str, Any]]:
+        """分析歌词文件（单次遍历，含句尾韵脚与韵式）"""
+        try:
+            return analyze_lyrics_file(lyrics_path)
         except Exception as e:
             return {"error": f"歌词分析失败: {str(e)}"}
 
     def _identify_vocal_tracks(self, midi_file: mido.MidiFile, lyrics_info: Optional[Dict]) -> List[VocalTrackCandidate]:
         """智能识别人声音轨"""
-        candidates = []
-
-        for track_idx, track in enumerate(midi_file.tracks):
-            notes = self._extract_notes_from_track(midi_file, track_idx)
-
-            if not notes:
-                continue
-
-            # 计算基本信息
-            pitches = [note['pitch'] for note in notes]
-            min_pitch, max_pitch = min(pitches), max(pitches)
-            note_count = len(notes)
-
-            # 评分系统
-            score = 0.0
-            reasons = []
-
-            # 1. 音轨名称匹配（30分）
-            track_name = getattr(track, 'name', f'Track {track_idx}')
-            vocal_keywords = ['vocal', 'voice', 'melody', 'lead', '主旋律', '人声']
-            if any(keyword.lower() in track_name.lower() for keyword in vocal_keywords):
-                score += 30
-                reasons.append(f"音轨名包含人声关键词: {track_name}")
-
-            # 2. 音域匹配（25分）
-            vocal_range_overlap = self._calculate_range_overlap(
-                (min_pitch, max_pitch), self.vocal_range
-            )
-            if vocal_range_overlap > 0.7:
-                score += 25
-                reasons.append(f"音域高度匹配人声范围: {vocal_range_overlap:.1%}")
-            elif vocal_range_overlap > 0.5:
-                score += 15
-                reasons.append(f"音域部分匹配人声范围: {vocal_range_overlap:.1%}")
-
-            # 3. 歌词字数匹配（20分）
-            if lyrics_info and 'total_chars' in lyrics_info:
-                lyrics_chars = lyrics_info['total_chars']
-                if lyrics_chars > 0:
-                    ratio = abs(1 - note_count / lyrics_chars)
-                    if ratio < 0.1:  # 10%内匹配
-                        score += 20
-                        reasons.append(f"音符数与歌词字数高度匹配: {note_count}≈{lyrics_chars}")
-                    elif ratio < 0.3:  # 30%内匹配
-                        score += 10
-                        reasons.append(f"音符数与歌词字数基本匹配: {note_count}vs{lyrics_chars}")
-
-            # 4. 音符密度合理性（15分）
-            if 20 <= note_count <= 200:  # 合理的旋律长度
-                score += 15
-                reasons.append(f"音符数量合理: {note_count}")
-            elif note_count > 10:
-                score += 5
-                reasons.append(f"音符数量可接受: {note_count}")
-
-            # 5. 旋律特征（10分）
-            interval_variety = self._calculate_interval_variety(notes)
-            if interval_variety > 0.3:  # 有合理的音程变化
-                score += 10
-                reasons.append(f"音程变化丰富: {interval_variety:.2f}")
-
-            candidates.append(VocalTrackCandidate(
-                track_index=track_idx,
-                track_name=track_name,
-                note_count=note_count,
-                note_range=(min_pitch, max_pitch),
-                confidence_score=score,
-                reasons=reasons
-            ))
+        track_count = len(midi_file.tracks)
+        workers = self.workers or multiprocessing.cpu_count()
+
+        if workers > 1 and track_count >= self.parallel_track_threshold:
+            # 各音轨的解码和评分互不依赖：分发到进程池，map 保持音轨顺序，结果与串行一致
+            context = multiprocessing.get_context('fork') if sys.platform.startswith('linux') else None
+            with ProcessPoolExecutor(max_workers=min(workers, track_count), mp_context=context,
+                                     initializer=_init_track_worker,
+                                     initargs=(self, midi_file, lyrics_info)) as executor:
+                chunksize = max(1, track_count // (workers * 4))
+                scored = list(executor.map(_score_track_in_worker, range(track_count), chunksize=chunksize))
+        else:
+            scored = [self._score_track(midi_file, track_idx, lyrics_info) for track_idx in range(track_count)]
+
+        candidates = [c for c in scored if c is not None]
 
         # 按置信度排序
         return sorted(candidates, key=lambda x: x.confidence_score, reverse=True)
 
+    def _score_track(self, midi_file: mido.MidiFile, track_idx: int,
+                     lyrics_info: Optional[Dict]) -> Optional[VocalTrackCandidate]:
+        """为单个音轨打分，无音符时返回 None"""
+        track = midi_file.tracks[track_idx]
+        notes = self._extract_notes_from_track(midi_file, track_idx)
+
+        if not notes:
+            return None
+
+        # 计算基本信息
+        pitches = [note['pitch'] for note in notes]
+        min_pitch, max_pitch = min(pitches), max(pitches)
+        note_count = len(notes)
+
+        # 评分系统
+        score = 0.0
+        reasons = []
+
+        # 1. 音轨名称匹配（30分）
+        track_name = getattr(track, 'name', f'Track {track_idx}')
+        vocal_keywords = ['vocal', 'voice', 'melody', 'lead', '主旋律', '人声']
+        if any(keyword.lower() in track_name.lower() for keyword in vocal_keywords):
+            score += 30
+            reasons.append(f"音轨名包含人声关键词: {track_name}")
+
+        # 2. 音域匹配（25分）
+        vocal_range_overlap = self._calculate_range_overlap(
+            (min_pitch, max_pitch), self.vocal_range
+        )
+        if vocal_range_overlap > 0.7:
+            score += 25
+            reasons.append(f"音域高度匹配人声范围: {vocal_range_overlap:.1%}")
+        elif vocal_range_overlap > 0.5:
+            score += 15
+            reasons.append(f"音域部分匹配人声范围: {vocal_range_overlap:.1%}")
+
+        # 3. 歌词字数匹配（20分）
+        if lyrics_info and 'total_chars' in lyrics_info:
+            lyrics_chars = lyrics_info['total_chars']
+            if lyrics_chars > 0:
+                ratio = abs(1 - note_count / lyrics_chars)
+                if ratio < 0.1:  # 10%内匹配
+                    score += 20
+                    reasons.append(f"音符数与歌词字数高度匹配: {note_count}≈{lyrics_chars}")
+                elif ratio < 0.3:  # 30%内匹配
+                    score += 10
+                    reasons.append(f"音符数与歌词字数基本匹配: {note_count}vs{lyrics_chars}")
+
+        # 4. 音符密度合理性（15分）
+        if 20 <= note_count <= 200:  # 合理的旋律长度
+            score += 15
+            reasons.append(f"音符数量合理: {note_count}")
+        elif note_count > 10:
+            score += 5
+            reasons.append(f"音符数量可接受: {note_count}")
+
+        # 5. 旋律特征（10分）
+        interval_variety = self._calculate_interval_variety(notes)
+        if interval_variety > 0.3:  # 有合理的音程变化
+            score += 10
+            reasons.append(f"音程变化丰富: {interval_variety:.2f}")
+
+        return VocalTrackCandidate(
+            track_index=track_idx,
+            track_name=track_name,
+            note_count=note_count,
+            note_range=(min_pitch, max_pitch),
+            confidence_score=score,
+            reasons=reasons
+        )
+
     def _extract_notes_from_track(self, midi_file: mido.MidiFile, track_idx: int) -> List[Dict]:
         """从指定音轨提取音符信息"""
         track = midi_file.tracks[track_idx]
@@ -316,10 +421,8 @@ class ProfessionalMidiAnalyzer:
         # 按开始时间排序
         return sorted(notes, key=lambda x: x['start_time'])
 
-    def _extract_melody_features(self, notes: List[Dict], midi_file: mido.MidiFile) -> MelodyFeatures:
+    def _extract_melody_features(self, notes: List[Dict], ticks_per_beat: int) -> MelodyFeatures:
         """深度旋律特征提取"""
-        ticks_per_beat = midi_file.ticks_per_beat
-
         # 基本信息
         pitches = [note['pitch'] for note in notes]
         durations = [note['duration'] for note in notes]
@@ -651,11 +754,21 @@ def main():
     parser.add_argument("--lyrics", help="歌词文件路径（可选）")
     parser.add_argument("--output", help="输出 JSON 文件路径（可选）")
     parser.add_argument("--pretty", action="store_true", help="格式化 JSON 输出")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="音轨评分并行进程数（默认 1 串行，0 为 CPU 核数）")
+    parser.add_argument("--parallel-threshold", type=int, default=32,
+                        help="音轨数达到该值才启用并行（默认 32）")
+    parser.add_argument("--window-beats", type=float,
+                        help="额外输出每 N 拍窗口的滑动特征序列（如 4 为 4/4 拍的一小节）")
+    parser.add_argument("--hop-beats", type=float,
+                        help="滑动窗口步长（拍，默认等于窗口长度）")
 
     args = parser.parse_args()
 
     # 创建分析器
-    analyzer = ProfessionalMidiAnalyzer()
+    analyzer = ProfessionalMidiAnalyzer(workers=args.workers,
+                                        parallel_track_threshold=args.parallel_threshold,
+                                        window_beats=args.window_beats, hop_beats=args.hop_beats)
 
     # 执行分析
     result = analyzer.analyze_midi_file(args.midi_file, args.lyrics)
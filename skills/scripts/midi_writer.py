@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+快速 MIDI 写出器 - 将音符数组直接编码为标准 MIDI 文件 (SMF) 字节
+
+不创建逐条消息对象：事件排序、delta-time 和变长数量 (VLQ) 编码全部向量化完成；
+批量接口把所有变体拼接后一次编码再按变体切分，适合一次导出成千上万个候选旋律。
+
+输出为 Type 1 文件：速度轨（tempo map）+ 旋律轨。
+
+用法:
+    python midi_writer.py <melody.json> <output.mid|output_dir>
+
+    melody.json 为 melody-gen 的 JSON 音符数据格式（key / bpm / sections / measures / notes），
+    顶层也可以是 {"variants": [...]} 或变体列表，此时输出到目录。
+"""
+
+import sys
+import json
+import struct
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_TICKS_PER_BEAT = 480
+DEFAULT_TEMPO_MAP = ((0.0, 120.0),)
+
+_NOTE_ON = 0x90
+_NOTE_OFF = 0x80
+
+# VLQ 最多 4 字节（0x0FFFFFFF）
+_VLQ_MAX = (1 << 28) - 1
+_VLQ_SHIFTS = np.array([21, 14, 7, 0], dtype=np.int64)
+
+_END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+# melody-gen JSON：简谱音级 → 相对主音的半音数，1=C4
+_JIANPU_SEMITONES = {1: 0, 2: 2, 3: 4, 4: 5, 5: 7, 6: 9, 7: 11}
+_KEY_SEMITONES = {
+    'C': 0, 'C#': 1, 'Db': 1, 'D': 2, 'D#': 3, 'Eb': 3, 'E': 4, 'F': 5,
+    'F#': 6, 'Gb': 6, 'G': 7, 'G#': 8, 'Ab': 8, 'A': 9, 'A#': 10, 'Bb': 10, 'B': 11
+}
+_MIDDLE_C = 60
+
+
+def encode_vlq(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    向量化 VLQ 编码
+
+    Returns:
+        (按顺序拼接的编码字节, 每个值的字节数)
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if values.size and (values.min() < 0 or values.max() > _VLQ_MAX):
+        raise ValueError("VLQ 取值超出范围 (0 ~ 0x0FFFFFFF)")
+
+    lengths = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+    groups = ((values[:, None] >> _VLQ_SHIFTS) & 0x7F).astype(np.uint8)
+    # 除最后一组外都置延续位
+    groups[:, :3] |= 0x80
+    # 每个值只保留最后 lengths 组
+    keep = np.arange(4) >= (4 - lengths)[:, None]
+    return groups[keep], lengths
+
+
+def _parse_tempo_map(tempo_map: Sequence[Tuple[float, float]]):
+    beats = np.array([beat for beat, _ in tempo_map], dtype=np.float64)
+    bpms = np.array([bpm for _, bpm in tempo_map], dtype=np.float64)
+    if len(beats) == 0 or beats[0] != 0:
+        raise ValueError("tempo map 必须从第 0 拍开始")
+    if np.any(np.diff(beats) <= 0):
+        raise ValueError("tempo map 的拍位置必须严格递增")
+    return beats, bpms
+
+
+def seconds_to_beats(seconds: np.ndarray, tempo_map: Sequence[Tuple[float, float]] = DEFAULT_TEMPO_MAP) -> np.ndarray:
+    """按分段恒定速度将秒换算为拍"""
+    beats, bpms = _parse_tempo_map(tempo_map)
+    segment_seconds = np.concatenate([[0.0], np.cumsum(np.diff(beats) * 60.0 / bpms[:-1])])
+    seconds = np.asarray(seconds, dtype=np.float64)
+    index = np.searchsorted(segment_seconds, seconds, side='right') - 1
+    index = np.clip(index, 0, len(beats) - 1)
+    return beats[index] + (seconds - segment_seconds[index]) * bpms[index] / 60.0
+
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return tag + struct.pack(">I", len(data)) + data
+
+
+def _meta(meta_type: int, data: bytes) -> bytes:
+    length, _ = encode_vlq(np.array([len(data)]))
+    return bytes([0xFF, meta_type]) + length.tobytes() + data
+
+
+def _conductor_track(tempo_map, ticks_per_beat: int, time_signature: Optional[Tuple[int, int]]) -> bytes:
+    beats, bpms = _parse_tempo_map(tempo_map)
+    ticks = np.rint(beats * ticks_per_beat).astype(np.int64)
+
+    body = b""
+    if time_signature:
+        numerator, denominator = time_signature
+        body += b"\x00" + _meta(0x58, bytes([numerator, int(np.log2(denominator)), 24, 8]))
+    for delta, bpm in zip(np.diff(ticks, prepend=0).tolist(), bpms.tolist()):
+        tempo = int(round(60_000_000 / bpm))
+        body += encode_vlq(np.array([delta]))[0].tobytes() + _meta(0x51, tempo.to_bytes(3, "big"))
+    return _chunk(b"MTrk", body + _END_OF_TRACK)
+
+
+def encode_midi_batch(variants: Sequence[Dict[str, Any]],
+                      ticks_per_beat: int = DEFAULT_TICKS_PER_BEAT,
+                      tempo_map: Sequence[Tuple[float, float]] = DEFAULT_TEMPO_MAP,
+                      time_unit: str = "beats",
+                      time_signature: Optional[Tuple[int, int]] = (4, 4),
+                      track_name: str = "Melody",
+                      channel: int = 0) -> List[bytes]:
+    """
+    批量编码旋律变体为 SMF 字节（所有变体共用速度轨，音符一次性向量化编码）
+
+    Args:
+        variants: 每个变体为 {"pitch", "start", "duration", "velocity"(可选)} 数组字典
+        time_unit: start / duration 的单位，"beats"、"ticks" 或 "seconds"（按 tempo_map 换算）
+        tempo_map: [(拍位置, BPM), ...]，第一项必须位于第 0 拍
+
+    Returns:
+        与 variants 顺序一致的 MIDI 文件字节
+    """
+    if time_unit not in ("beats", "ticks", "seconds"):
+        raise ValueError(f"未知的时间单位: {time_unit}")
+
+    header = _chunk(b"MThd", struct.pack(">HHH", 1, 2, ticks_per_beat))
+    conductor = _conductor_track(tempo_map, ticks_per_beat, time_signature)
+    name_event = b"\x00" + _meta(0x03, track_name.encode("utf-8"))
+    prefix = header + conductor
+
+    counts = np.array([len(v["pitch"]) for v in variants], dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        # 无音符（如静音人声）：只写轨道名和轨道结束，保持合法的 Type 1 文件
+        return [prefix + _chunk(b"MTrk", name_event + _END_OF_TRACK) for _ in variants]
+    variant_ids = np.repeat(np.arange(len(variants)), counts)
+
+    def column(name, default=None, dtype=np.float64):
+        parts = [np.full(len(v["pitch"]), default) if v.get(name) is None else np.asarray(v[name])
+                 for v in variants]
+        return np.concatenate(parts).astype(dtype)
+
+    pitch = np.clip(column("pitch", dtype=np.int64), 0, 127)
+    velocity = np.clip(column("velocity", 80, dtype=np.int64), 1, 127)
+    start = column("start")
+    end = start + column("duration")
+
+    if time_unit == "seconds":
+        start, end = seconds_to_beats(start, tempo_map), seconds_to_beats(end, tempo_map)
+    scale = 1 if time_unit == "ticks" else ticks_per_beat
+    on_ticks = np.rint(start * scale).astype(np.int64)
+    off_ticks = np.maximum(np.rint(end * scale).astype(np.int64), on_ticks + 1)
+
+    # 事件：每个音符一个 note_off 和一个 note_on；同一时刻先关后开，避免相邻同音互相截断
+    ev_variant = np.concatenate([variant_ids, variant_ids])
+    ev_tick = np.concatenate([off_ticks, on_ticks])
+    ev_is_on = np.concatenate([np.zeros(total, np.int64), np.ones(total, np.int64)])
+    ev_pitch = np.concatenate([pitch, pitch])
+    ev_velocity = np.concatenate([np.zeros(total, np.int64), velocity])
+
+    order = np.lexsort((ev_pitch, ev_is_on, ev_tick, ev_variant))
+    ev_variant, ev_tick, ev_is_on = ev_variant[order], ev_tick[order], ev_is_on[order]
+    ev_pitch, ev_velocity = ev_pitch[order], ev_velocity[order]
+
+    # 各变体内的 delta-time（每个变体的第一个事件相对第 0 tick）
+    deltas = np.diff(ev_tick, prepend=0)
+    first = np.ones(len(ev_tick), dtype=bool)
+    first[1:] = ev_variant[1:] != ev_variant[:-1]
+    deltas[first] = ev_tick[first]
+
+    vlq_bytes, vlq_lengths = encode_vlq(deltas)
+
+    # 组装：每个事件 = VLQ(delta) + 状态字节 + 音高 + 力度
+    event_sizes = vlq_lengths + 3
+    offsets = np.concatenate([[0], np.cumsum(event_sizes)[:-1]]).astype(np.int64)
+    buffer = np.empty(int(event_sizes.sum()), dtype=np.uint8)
+    vlq_positions = np.repeat(offsets, vlq_lengths) + (
+        np.arange(len(vlq_bytes)) - np.repeat(np.cumsum(vlq_lengths) - vlq_lengths, vlq_lengths)
+    )
+    buffer[vlq_positions] = vlq_bytes
+    status_positions = offsets + vlq_lengths
+    buffer[status_positions] = np.where(ev_is_on == 1, _NOTE_ON, _NOTE_OFF) | (channel & 0x0F)
+    buffer[status_positions + 1] = ev_pitch
+    buffer[status_positions + 2] = ev_velocity
+
+    # 按变体切分事件字节
+    variant_bytes = np.bincount(ev_variant, weights=event_sizes, minlength=len(variants)).astype(np.int64)
+    bounds = np.concatenate([[0], np.cumsum(variant_bytes)])
+    raw = buffer.tobytes()
+
+    return [
+        prefix + _chunk(b"MTrk", name_event + raw[bounds[i]:bounds[i + 1]] + _END_OF_TRACK)
+        for i in range(len(variants))
+    ]
+
+
+def encode_midi(pitch, start, duration, velocity=None, **kwargs) -> bytes:
+    """编码单条旋律为 SMF 字节（参数同 encode_midi_batch）"""
+    return encode_midi_batch([{"pitch": pitch, "start": start, "duration": duration,
+                               "velocity": velocity}], **kwargs)[0]
+
+
+def write_midi(path, pitch, start, duration, velocity=None, **kwargs) -> str:
+    """写出单条旋律 MIDI 文件"""
+    Path(path).write_bytes(encode_midi(pitch, start, duration, velocity, **kwargs))
+    return str(path)
+
+
+def write_midi_batch(variants: Sequence[Dict[str, Any]], output_dir, prefix: str = "variant", **kwargs) -> List[str]:
+    """批量写出变体，文件名为 <prefix>_<序号>.mid"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    width = max(3, len(str(len(variants))))
+    paths = []
+    for index, data in enumerate(encode_midi_batch(variants, **kwargs)):
+        path = output_dir / f"{prefix}_{index:0{width}d}.mid"
+        path.write_bytes(data)
+        paths.append(str(path))
+    return paths
+
+
+def melody_json_to_arrays(melody: Dict[str, Any]) -> Dict[str, Any]:
+    """将 melody-gen JSON 音符数据（简谱音级 + 八度 + 拍数时值）转换为音符数组，pitch 为 0 表示休止"""
+    tonic = _MIDDLE_C + _KEY_SEMITONES.get(str(melody.get("key", "C")), 0)
+    pitches, starts, durations = [], [], []
+    position = 0.0
+    for section in melody.get("sections", []):
+        for measure in section.get("measures", []):
+            for note in measure.get("notes", []):
+                duration = float(note.get("duration", 1))
+                degree = int(note.get("pitch", 0))
+                if degree in _JIANPU_SEMITONES:
+                    pitches.append(tonic + _JIANPU_SEMITONES[degree] + 12 * int(note.get("octave", 0)))
+                    starts.append(position)
+                    durations.append(duration)
+                position += duration
+    return {
+        "pitch": np.array(pitches, dtype=np.int64),
+        "start": np.array(starts, dtype=np.float64),
+        "duration": np.array(durations, dtype=np.float64),
+        "bpm": float(melody.get("bpm", 120))
+    }
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 3:
+        print(json.dumps({
+            "status": "error",
+            "error": "缺少参数",
+            "usage": "python midi_writer.py <melody.json> <output.mid|output_dir>"
+        }, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    try:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if isinstance(data, dict) and "variants" not in data:
+            melody = melody_json_to_arrays(data)
+            path = write_midi(sys.argv[2], melody["pitch"], melody["start"], melody["duration"],
+                              tempo_map=((0.0, melody["bpm"]),))
+            output = {"status": "success", "midi_file": path, "note_count": int(len(melody["pitch"]))}
+        else:
+            variants = [melody_json_to_arrays(v) for v in (data["variants"] if isinstance(data, dict) else data)]
+            output_dir = Path(sys.argv[2])
+            output_dir.mkdir(parents=True, exist_ok=True)
+            width = max(3, len(str(len(variants))))
+            paths = [str(output_dir / f"variant_{i:0{width}d}.mid") for i in range(len(variants))]
+            # 速度相同的变体共用速度轨，一次批量编码
+            for bpm in sorted({v["bpm"] for v in variants}):
+                indices = [i for i, v in enumerate(variants) if v["bpm"] == bpm]
+                encoded = encode_midi_batch([variants[i] for i in indices], tempo_map=((0.0, bpm),))
+                for i, midi_bytes in zip(indices, encoded):
+                    Path(paths[i]).write_bytes(midi_bytes)
+            output = {"status": "success", "midi_files": paths, "variant_count": len(variants)}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(json.dumps({"status": "error", "error": str(e)}, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
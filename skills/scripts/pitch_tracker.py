@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+单声部音高追踪器 - 纯 NumPy 实现的 YIN 算法
+作为 Basic Pitch 的轻量替代，在 CPU 上直接将分离后的人声转为 MIDI
+
+特点：
+- 向量化 YIN：按帧块批量计算差分函数（FFT 自相关 + 累积能量）
+- 音符切分：中值平滑 + 半音量化 + 短片段合并
+- 无需 TensorFlow / ONNX 等 ML 运行时，只依赖 numpy 与 mido
+
+用法:
+    python pitch_tracker.py <vocals_wav> <output_mid>
+"""
+
+import sys
+import json
+import wave
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Any, Tuple
+
+import numpy as np
+
+# 默认分析采样率：Demucs 输出 44.1kHz，整数倍降采样即可
+DEFAULT_SAMPLE_RATE = 22050
+
+# 人声基频范围 (Hz)：约 C2 - C6
+DEFAULT_FMIN = 65.0
+DEFAULT_FMAX = 1050.0
+
+
+@dataclass
+class PitchTrack:
+    """逐帧音高追踪结果"""
+    times: np.ndarray          # 帧中心时间 (秒)
+    f0: np.ndarray             # 基频 (Hz)，无声帧为 0
+    voiced: np.ndarray         # 是否为有声帧
+    voiced_prob: np.ndarray    # 有声置信度 (1 - 非周期度)
+    rms: np.ndarray            # 帧能量
+    hop_seconds: float
+
+
+@dataclass
+class NoteEvents:
+    """音符事件数组（按开始时间排序）"""
+    start: np.ndarray      # 开始时间 (秒)
+    end: np.ndarray        # 结束时间 (秒)
+    pitch: np.ndarray      # MIDI 音高
+    velocity: np.ndarray   # 力度
+
+    def __len__(self) -> int:
+        return len(self.pitch)
+
+
+def load_audio(path: str, target_sr: int = DEFAULT_SAMPLE_RATE) -> Tuple[np.ndarray, int]:
+    """读取 WAV 文件，返回单声道 float32 采样与采样率"""
+    try:
+        import soundfile
+        samples, sr = soundfile.read(path, dtype='float32', always_2d=True)
+    except ImportError:
+        samples, sr = _read_pcm_wav(path)
+
+    mono = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    return resample(mono, sr, target_sr), target_sr
+
+
+def _read_pcm_wav(path: str) -> Tuple[np.ndarray, int]:
+    """使用标准库 wave 读取 PCM WAV（未安装 soundfile 时的回退）"""
+    with wave.open(path, 'rb') as wav:
+        sr = wav.getframerate()
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128.0
+    elif width == 2:
+        data = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 3:
+        # 24-bit：拼成 32-bit 整数后右移保留符号
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        data = ((b[:, 0] << 8) | (b[:, 1] << 16) | (b[:, 2] << 24)) >> 8
+        data = data.astype(np.float32) / 8388608.0
+    elif width == 4:
+        data = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"不支持的 WAV 采样位宽: {width * 8} bit")
+
+    return data.reshape(-1, channels), sr
+
+
+def resample(samples: np.ndarray, sr: int, target_sr: int) -> np.ndarray:
+    """重采样到目标采样率（整数倍时使用均值降采样）"""
+    if sr == target_sr:
+        return samples.astype(np.float32, copy=False)
+
+    if sr % target_sr == 0:
+        factor = sr // target_sr
+        n = len(samples) // factor
+        return samples[:n * factor].reshape(n, factor).mean(axis=1).astype(np.float32)
+
+    positions = np.arange(int(len(samples) * target_sr / sr)) * (sr / target_sr)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def track_pitch(samples: np.ndarray,
+                sr: int,
+                fmin: float = DEFAULT_FMIN,
+                fmax: float = DEFAULT_FMAX,
+                window: int = 1024,
+                hop_length: int = 256,
+                threshold: float = 0.15,
+                silence_db: float = -45.0,
+                block_frames: int = 512) -> PitchTrack:
+    """
+    向量化 YIN 基频追踪
+
+    Args:
+        samples: 单声道采样
+        sr: 采样率
+        fmin / fmax: 基频搜索范围 (Hz)
+        window: 差分函数积分窗长（采样点）
+        hop_length: 帧移（采样点）
+        threshold: YIN 绝对阈值
+        silence_db: 相对最大帧能量的静音门限 (dB)
+        block_frames: 每批处理的帧数，控制峰值内存
+
+    Returns:
+        PitchTrack 逐帧结果
+    """
+    tau_min = max(2, int(sr / fmax))
+    tau_max = int(np.ceil(sr / fmin))
+    frame_length = window + tau_max + 1
+
+    samples = np.asarray(samples, dtype=np.float32)
+    n_frames = max(1, 1 + (len(samples) - window) // hop_length) if len(samples) >= window else 0
+    if n_frames == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return PitchTrack(empty, empty, empty.astype(bool), empty, empty, hop_length / sr)
+
+    # 末尾补零，保证每一帧都有完整的 tau_max 延迟区间
+    padded_len = (n_frames - 1) * hop_length + frame_length
+    padded = np.zeros(padded_len, dtype=np.float32)
+    padded[:min(len(samples), padded_len)] = samples[:padded_len]
+    frames_view = np.lib.stride_tricks.sliding_window_view(padded, frame_length)[::hop_length]
+
+    fft_size = 1 << int(np.ceil(np.log2(frame_length + window)))
+    taus = np.arange(tau_max + 1)
+
+    f0 = np.zeros(n_frames, dtype=np.float32)
+    aperiodicity = np.ones(n_frames, dtype=np.float32)
+    rms = np.zeros(n_frames, dtype=np.float32)
+
+    for start in range(0, n_frames, block_frames):
+        frames = frames_view[start:start + block_frames].astype(np.float64)
+
+        # r(tau) = sum_j x[j] * x[j + tau]，通过 FFT 互相关批量计算
+        spectrum = np.fft.rfft(frames, fft_size, axis=1)
+        head = np.fft.rfft(frames[:, :window], fft_size, axis=1)
+        acf = np.fft.irfft(np.conj(head) * spectrum, fft_size, axis=1)[:, :tau_max + 1]
+
+        # 滑动窗口能量：E(tau) = sum_{j=tau}^{tau+W-1} x[j]^2
+        energy = np.concatenate(
+            [np.zeros((len(frames), 1)), np.cumsum(frames ** 2, axis=1)], axis=1
+        )
+        energy0 = energy[:, window]
+        energy_tau = energy[:, taus + window] - energy[:, taus]
+
+        diff = np.maximum(energy0[:, None] + energy_tau - 2.0 * acf, 0.0)
+        diff[:, 0] = 0.0
+
+        # 累积均值归一化差分函数 (CMNDF)
+        cumulative = np.cumsum(diff[:, 1:], axis=1)
+        cmnd = np.ones_like(diff)
+        cmnd[:, 1:] = diff[:, 1:] * taus[1:] / np.maximum(cumulative, 1e-12)
+
+        # 第一个低于阈值的谷底；不存在时退回全局最小值
+        segment = cmnd[:, tau_min:tau_max]
+        candidates = (segment < threshold) & (segment <= cmnd[:, tau_min + 1:tau_max + 1])
+        has_dip = candidates.any(axis=1)
+        best = np.where(has_dip, np.argmax(candidates, axis=1), np.argmin(segment, axis=1)) + tau_min
+
+        # 抛物线插值得到亚采样精度的周期
+        rows = np.arange(len(frames))
+        left, mid, right = cmnd[rows, best - 1], cmnd[rows, best], cmnd[rows, best + 1]
+        denom = left - 2.0 * mid + right
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shift = np.where(np.abs(denom) > 1e-12, 0.5 * (left - right) / denom, 0.0)
+        period = best + np.clip(shift, -1.0, 1.0)
+
+        block = slice(start, start + len(frames))
+        f0[block] = np.where(has_dip, sr / period, 0.0)
+        aperiodicity[block] = np.where(has_dip, mid, 1.0)
+        rms[block] = np.sqrt(energy0 / window)
+
+    # 静音门限：相对最响帧
+    peak = rms.max() if n_frames else 0.0
+    loud = rms > max(peak * 10 ** (silence_db / 20.0), 1e-5)
+    voiced = (f0 > 0) & loud
+
+    times = (np.arange(n_frames) * hop_length + window / 2) / sr
+    return PitchTrack(
+        times=times.astype(np.float32),
+        f0=np.where(voiced, f0, 0.0).astype(np.float32),
+        voiced=voiced,
+        voiced_prob=np.clip(1.0 - aperiodicity, 0.0, 1.0),
+        rms=rms,
+        hop_seconds=hop_length / sr
+    )
+
+
+def segment_notes(track: PitchTrack,
+                  min_note_seconds: float = 0.08,
+                  median_frames: int = 5) -> NoteEvents:
+    """
+    将逐帧音高切分为音符
+
+    流程：MIDI 音高换算 → 中值平滑 → 半音量化 → 游程切分 →
+    过短片段并入前一个音符 → 合并相邻同音高音符
+    """
+    n = len(track.f0)
+    if n == 0 or not track.voiced.any():
+        return _empty_notes()
+
+    midi = np.full(n, np.nan, dtype=np.float64)
+    midi[track.voiced] = 69.0 + 12.0 * np.log2(track.f0[track.voiced] / 440.0)
+
+    # 中值平滑，抑制八度跳变和颤音抖动
+    half = median_frames // 2
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.pad(midi, half, constant_values=np.nan), median_frames
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        smooth = np.nanmedian(windows, axis=1)
+
+    labels = np.where(track.voiced & ~np.isnan(smooth), np.rint(smooth), -1).astype(np.int32)
+
+    # 游程切分
+    change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    starts = np.concatenate([[0], change])
+    ends = np.concatenate([change, [n]])
+    run_labels = labels[starts]
+
+    min_frames = max(1, int(round(min_note_seconds / track.hop_seconds)))
+
+    # 游程数量远小于帧数，这里逐段合并
+    runs = []
+    for s, e, label in zip(starts.tolist(), ends.tolist(), run_labels.tolist()):
+        if label < 0:
+            continue
+        if runs and runs[-1][1] == s and (e - s < min_frames or runs[-1][2] == label):
+            # 紧邻的短片段（滑音、颤音）或同音高片段并入前一个音符
+            runs[-1][1] = e
+        else:
+            runs.append([s, e, label])
+
+    runs = [r for r in runs if r[1] - r[0] >= min_frames]
+    if not runs:
+        return _empty_notes()
+
+    bounds = np.array(runs, dtype=np.int64)
+    starts, ends = bounds[:, 0], bounds[:, 1]
+
+    # 音符音高取片段内平滑音高的中位数
+    pitches = np.array([np.nanmedian(smooth[s:e]) for s, e in zip(starts, ends)])
+    pitches = np.clip(np.rint(pitches), 0, 127).astype(np.int32)
+
+    # 力度由片段平均能量映射
+    peak = max(float(track.rms.max()), 1e-9)
+    # 前缀和做差只累加 [start, end) 内的帧；reduceat 会一直累加到下一个音符起点，把间隙帧也算进去
+    rms_prefix = np.concatenate([[0.0], np.cumsum(track.rms, dtype=np.float64)])
+    level = (rms_prefix[ends] - rms_prefix[starts]) / (ends - starts)
+    level_db = 20.0 * np.log10(np.maximum(level, 1e-9) / peak)
+    velocity = np.clip(np.rint(110 + level_db * 1.5), 30, 127).astype(np.int32)
+
+    offset = track.times[0] - track.hop_seconds / 2 if len(track.times) else 0.0
+    return NoteEvents(
+        start=starts * track.hop_seconds + offset,
+        end=ends * track.hop_seconds + offset,
+        pitch=pitches,
+        velocity=velocity
+    )
+
+
+def _empty_notes() -> NoteEvents:
+    return NoteEvents(
+        start=np.zeros(0), end=np.zeros(0),
+        pitch=np.zeros(0, dtype=np.int32), velocity=np.zeros(0, dtype=np.int32)
+    )
+
+
+def write_midi(notes: NoteEvents, midi_path: str,
+               tempo_bpm: float = 120.0, ticks_per_beat: int = 480,
+               track_name: str = "Vocal") -> str:
+    """将音符事件写为 Type 1 MIDI 文件（速度轨 + 旋律轨）"""
+    from midi_writer import write_midi as write_note_arrays
+
+    return write_note_arrays(midi_path, notes.pitch, notes.start, notes.end - notes.start, notes.velocity,
+                             time_unit="seconds", tempo_map=((0.0, tempo_bpm),),
+                             ticks_per_beat=ticks_per_beat, time_signature=None, track_name=track_name)
+
+
+def detect_notes(samples: np.ndarray, sr: int, **kwargs) -> Tuple[NoteEvents, PitchTrack]:
+    """对内存中的单声道采样（可为 memmap 视图）追踪音高并切分音符，不写文件"""
+    samples = resample(np.asarray(samples), sr, DEFAULT_SAMPLE_RATE)
+    track = track_pitch(samples, DEFAULT_SAMPLE_RATE, **kwargs)
+    return segment_notes(track), track
+
+
+def transcribe_samples(samples: np.ndarray, sr: int, midi_path: str, **kwargs) -> Dict[str, Any]:
+    """对内存中的单声道采样追踪音高并写出 MIDI"""
+    samples = resample(np.asarray(samples), sr, DEFAULT_SAMPLE_RATE)
+    notes, track = detect_notes(samples, DEFAULT_SAMPLE_RATE, **kwargs)
+    write_midi(notes, midi_path)
+
+    return {
+        "midi_file": midi_path,
+        "note_count": len(notes),
+        "voiced_ratio": float(track.voiced.mean()) if len(track.voiced) else 0.0,
+        "duration_seconds": float(len(samples) / DEFAULT_SAMPLE_RATE)
+    }
+
+
+def transcribe_file(wav_path: str, midi_path: str, **kwargs) -> Dict[str, Any]:
+    """读取人声 WAV，追踪音高并写出 MIDI"""
+    samples, sr = load_audio(wav_path)
+    return transcribe_samples(samples, sr, midi_path, **kwargs)
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 3:
+        print(json.dumps({
+            "status": "error",
+            "error": "缺少参数",
+            "usage": "python pitch_tracker.py <vocals_wav> <output_mid>"
+        }, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    wav_path, midi_path = sys.argv[1], sys.argv[2]
+    if not Path(wav_path).exists():
+        print(json.dumps({
+            "status": "error",
+            "error": f"输入文件不存在: {wav_path}"
+        }, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    result = transcribe_file(wav_path, midi_path)
+    result["status"] = "success"
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
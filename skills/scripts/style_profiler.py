@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+语料风格画像 - 流式统计 MIDI 语料的音程、节奏、轮廓、调式和动机分布
+
+所有统计量都是固定大小的数组，内存占用与语料规模无关：
+- 精确直方图：音程、音程二元组、节奏 (IOI)、轮廓 n-gram、调式、音级、终止式
+- Count-Min Sketch：6 音动机（以宫音为参照的音级序列），输出时枚举全部动机取高频项
+
+统计状态可保存为 .npz 并逐项相加合并，多个分片 worker 的结果合并后与单进程完全一致。
+状态中按分片记录游标（分片内已处理到的文件序号）：中断后以相同输入重新运行会从游标处继续，
+合并时拒绝包含重叠分片的状态。
+画像输出与 guofeng-patterns.json / pentatonic-rules.json 结构对应（scales / intervals / patterns）。
+
+用法:
+    python style_profiler.py accumulate <midi文件或目录> [...] --state shard0.npz [--shard 0/4]
+    python style_profiler.py merge shard0.npz shard1.npz [...] --state corpus.npz
+    python style_profiler.py profile corpus.npz [--name 国风] [--output profile.json]
+"""
+
+import sys
+import json
+import math
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+
+import mido
+import numpy as np
+
+from melody_structure import MAX_INTERVAL, RHYTHM_STEPS_PER_BEAT, MAX_RHYTHM_STEPS
+from midi_analyzer import ProfessionalMidiAnalyzer
+
+STATE_VERSION = 3
+
+INTERVAL_BINS = 2 * MAX_INTERVAL + 1
+RHYTHM_BINS = MAX_RHYTHM_STEPS + 1
+CONTOUR_ORDER = 4
+CONTOUR_BINS = 3 ** CONTOUR_ORDER
+
+# 五声调式：相对宫音的半音数 → 调式（第 6 类为结束音不在五声内）
+MODES = ["gong", "shang", "jue", "zhi", "yu", "other"]
+MODE_NAMES = {"gong": "宫调式", "shang": "商调式", "jue": "角调式", "zhi": "徵调式", "yu": "羽调式"}
+_MODE_OFFSETS = [0, 2, 4, 7, 9]
+_MODE_INDEX = np.full(12, MODES.index("other"), dtype=np.int64)
+_MODE_INDEX[_MODE_OFFSETS] = np.arange(len(_MODE_OFFSETS))
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+# 相对宫音的半音数 → 简谱音级（非自然音级为 None）
+_JIANPU = {0: 1, 2: 2, 4: 3, 5: 4, 7: 5, 9: 6, 11: 7}
+# 半音数（八度内）→ 音程度数
+_INTERVAL_DEGREES = [1, 2, 2, 3, 3, 4, 4, 5, 6, 6, 7, 7]
+
+# 动机长度与 Count-Min Sketch 尺寸（深度 × 宽度，误差约 e/宽度 × 总动机数）
+MOTIF_LENGTH = 6
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 1 << 15
+# 固定的哈希参数，保证不同进程的 sketch 可以直接相加
+_HASH_PRIME = (1 << 31) - 1
+_HASH_A = np.array([1103515245, 2654435761 % _HASH_PRIME, 97102761, 1597334677], dtype=np.int64)
+_HASH_B = np.array([12345, 40503, 2166136261 % _HASH_PRIME, 374761393], dtype=np.int64)
+
+_ARRAY_SHAPES = {
+    "intervals": (INTERVAL_BINS,),
+    "interval_bigrams": (INTERVAL_BINS, INTERVAL_BINS),
+    "rhythm": (RHYTHM_BINS,),
+    "contour_ngrams": (CONTOUR_BINS,),
+    "keys": (12, len(MODES)),
+    "degrees": (12,),
+    "cadences": (len(MODES), 12, 12),
+    "motif_sketch": (SKETCH_DEPTH, SKETCH_WIDTH),
+}
+
+MIDI_SUFFIXES = (".mid", ".midi")
+
+
+def _sketch_columns(keys: np.ndarray) -> np.ndarray:
+    """每行哈希函数下的列号，形状 (深度, len(keys))"""
+    keys = np.asarray(keys, dtype=np.int64)
+    return (_HASH_A[:, None] * keys[None, :] + _HASH_B[:, None]) % _HASH_PRIME % SKETCH_WIDTH
+
+
+class StyleAccumulator:
+    """可合并的固定大小风格统计状态"""
+
+    def __init__(self):
+        self.arrays = {name: np.zeros(shape, dtype=np.int64) for name, shape in _ARRAY_SHAPES.items()}
+        self.file_count = 0
+        self.note_count = 0
+        self.failed_count = 0
+        # (分片序号, 分片数) → 游标：该分片已处理到的文件序号（iter_midi_files 顺序，不含）
+        self.shards = {}
+
+    def add_melody(self, pitches: np.ndarray, onsets: np.ndarray, ticks_per_beat: int):
+        """累加一条旋律（音高和起音时间按起音排序，时间单位 tick）"""
+        pitches = np.asarray(pitches, dtype=np.int64)
+        onsets = np.asarray(onsets, dtype=np.float64)
+        a = self.arrays
+        self.file_count += 1
+        self.note_count += len(pitches)
+        if len(pitches) < 2:
+            return
+
+        steps = np.diff(pitches)
+        intervals = np.clip(steps, -MAX_INTERVAL, MAX_INTERVAL) + MAX_INTERVAL
+        a["intervals"] += np.bincount(intervals, minlength=INTERVAL_BINS)
+        a["interval_bigrams"] += np.bincount(
+            intervals[:-1] * INTERVAL_BINS + intervals[1:], minlength=INTERVAL_BINS ** 2
+        ).reshape(INTERVAL_BINS, INTERVAL_BINS)
+
+        ioi = np.clip(np.rint(np.diff(onsets) / ticks_per_beat * RHYTHM_STEPS_PER_BEAT), 0, MAX_RHYTHM_STEPS)
+        a["rhythm"] += np.bincount(ioi.astype(np.int64), minlength=RHYTHM_BINS)
+
+        if len(steps) >= CONTOUR_ORDER:
+            windows = np.lib.stride_tricks.sliding_window_view(np.sign(steps) + 1, CONTOUR_ORDER)
+            codes = windows @ (3 ** np.arange(CONTOUR_ORDER - 1, -1, -1))
+            a["contour_ngrams"] += np.bincount(codes, minlength=CONTOUR_BINS)
+
+        # 调性：五声音阶覆盖音符最多的宫音；调式由结束音相对宫音的位置决定
+        pc_counts = np.bincount(pitches % 12, minlength=12)
+        scores = [pc_counts[(root + np.array(_MODE_OFFSETS)) % 12].sum() for root in range(12)]
+        root = int(np.argmax(scores))
+        degrees = (pitches - root) % 12
+        mode = _MODE_INDEX[degrees[-1]]
+        a["keys"][root, mode] += 1
+        a["degrees"] += np.bincount(degrees, minlength=12)
+        a["cadences"][mode, degrees[-2], degrees[-1]] += 1
+
+        if len(degrees) >= MOTIF_LENGTH:
+            windows = np.lib.stride_tricks.sliding_window_view(degrees, MOTIF_LENGTH)
+            keys = windows @ (12 ** np.arange(MOTIF_LENGTH - 1, -1, -1))
+            columns = _sketch_columns(keys)
+            for row in range(SKETCH_DEPTH):
+                a["motif_sketch"][row] += np.bincount(columns[row], minlength=SKETCH_WIDTH)
+
+    def add_notes(self, notes: List[Dict], ticks_per_beat: int):
+        """累加分析器格式的音符列表"""
+        pitches = np.fromiter((note['pitch'] for note in notes), dtype=np.int64, count=len(notes))
+        onsets = np.fromiter((note['start_time'] for note in notes), dtype=np.float64, count=len(notes))
+        self.add_melody(pitches, onsets, ticks_per_beat)
+
+    def check_shard(self, shard_id):
+        """分片与状态中已有的其他分片重叠（会重复计数同一文件）时抛出 ValueError"""
+        for existing in self.shards:
+            if existing != shard_id and _shards_overlap(existing, shard_id):
+                raise ValueError(f"分片 {_shard_label(shard_id)} 与状态中已有的分片 "
+                                 f"{_shard_label(existing)} 重叠，会重复计数")
+
+    def merge(self, other: "StyleAccumulator"):
+        for shard_id in other.shards:
+            if shard_id in self.shards:
+                raise ValueError(f"待合并的状态都包含分片 {_shard_label(shard_id)}，合并会重复计数")
+            self.check_shard(shard_id)
+        self.shards.update(other.shards)
+        for name, array in other.arrays.items():
+            self.arrays[name] += array
+        self.file_count += other.file_count
+        self.note_count += other.note_count
+        self.failed_count += other.failed_count
+        return self
+
+    def motif_estimates(self, keys: np.ndarray) -> np.ndarray:
+        """Count-Min 估计：各行计数取最小值（只会高估，不会低估）"""
+        columns = _sketch_columns(keys)
+        sketch = self.arrays["motif_sketch"]
+        return sketch[np.arange(SKETCH_DEPTH)[:, None], columns].min(axis=0)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            version=STATE_VERSION,
+            counters=np.array([self.file_count, self.note_count, self.failed_count], dtype=np.int64),
+            shards=np.array([[shard, count, cursor] for (shard, count), cursor in sorted(self.shards.items())],
+                            dtype=np.int64).reshape(-1, 3),
+            **self.arrays
+        )
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path) -> "StyleAccumulator":
+        state = cls()
+        with np.load(path) as data:
+            if int(data["version"]) != STATE_VERSION:
+                raise ValueError(f"统计状态版本不兼容: {path}")
+            for name, shape in _ARRAY_SHAPES.items():
+                if data[name].shape != shape:
+                    raise ValueError(f"统计状态尺寸不匹配 ({name}): {path}")
+                state.arrays[name] = data[name].astype(np.int64)
+            state.file_count, state.note_count, state.failed_count = (int(v) for v in data["counters"])
+            state.shards = {(int(shard), int(count)): int(cursor) for shard, count, cursor in data["shards"]}
+        return state
+
+    def profile(self, name: str = "语料", top_k: int = 10) -> Dict[str, Any]:
+        """生成与资源文件结构对应的风格画像"""
+        return build_profile(self, name, top_k)
+
+
+def _shard_label(shard_id) -> str:
+    return f"{shard_id[0]}/{shard_id[1]}"
+
+
+def _shards_overlap(a, b) -> bool:
+    """分片 i/n 与 j/m 存在共同文件序号，当且仅当 i ≡ j (mod gcd(n, m))"""
+    divisor = math.gcd(a[1], b[1])
+    return a[0] % divisor == b[0] % divisor
+
+
+def _shares(counts: np.ndarray) -> np.ndarray:
+    total = counts.sum()
+    return counts / total if total else np.zeros(counts.shape)
+
+
+def _jianpu(degrees) -> Optional[List[int]]:
+    notes = [_JIANPU.get(int(d)) for d in degrees]
+    return None if None in notes else notes
+
+
+def _interval_degree(semitones: int) -> int:
+    """半音数 → 音程度数（1 = 同度/八度，2 = 二度 ...，与 pentatonic-rules.json 一致）"""
+    return _INTERVAL_DEGREES[abs(semitones) % 12]
+
+
+def _contour_label(code: int) -> str:
+    symbols = []
+    for _ in range(CONTOUR_ORDER):
+        symbols.append("-0+"[code % 3])
+        code //= 3
+    return "".join(reversed(symbols))
+
+
+def _top_motifs(state: StyleAccumulator, top_k: int):
+    """枚举全部自然音级动机，用 sketch 估计次数并取前 top_k"""
+    diatonic = np.array(sorted(_JIANPU), dtype=np.int64)
+    grids = np.meshgrid(*([diatonic] * MOTIF_LENGTH), indexing="ij")
+    motifs = np.stack([g.ravel() for g in grids], axis=1)
+    keys = motifs @ (12 ** np.arange(MOTIF_LENGTH - 1, -1, -1))
+    estimates = state.motif_estimates(keys)
+    order = np.argsort(estimates, kind="stable")[::-1][:top_k]
+    return [(motifs[i], int(estimates[i])) for i in order if estimates[i] > 0]
+
+
+def build_profile(state: StyleAccumulator, name: str = "语料", top_k: int = 10) -> Dict[str, Any]:
+    a = state.arrays
+
+    # 调式
+    mode_counts = a["keys"].sum(axis=0)
+    mode_shares = _shares(mode_counts)
+    scales = {}
+    for index, mode in enumerate(MODES[:-1]):
+        cadences = a["cadences"][index]
+        typical = None
+        if cadences.any():
+            first, last = np.unravel_index(np.argmax(cadences), cadences.shape)
+            typical = _jianpu((first, last))
+        scales[mode] = {
+            "name": MODE_NAMES[mode],
+            "notes": [1, 2, 3, 5, 6],
+            "root": _JIANPU[_MODE_OFFSETS[index]],
+            "share": round(float(mode_shares[index]), 4),
+            "typicalCadence": typical
+        }
+
+    degree_shares = _shares(a["degrees"])
+    avoid_notes = [_JIANPU[d] for d in (5, 11) if degree_shares[d] < 0.05]
+
+    # 音程
+    interval_shares = _shares(a["intervals"])
+    degree_totals = {}
+    for index, share in enumerate(interval_shares):
+        if share > 0:
+            degree = _interval_degree(index - MAX_INTERVAL)
+            degree_totals[degree] = degree_totals.get(degree, 0.0) + float(share)
+    bigram_shares = _shares(a["interval_bigrams"]).ravel()
+    top_bigrams = np.argsort(bigram_shares, kind="stable")[::-1][:top_k]
+
+    # 节奏与轮廓
+    rhythm_shares = _shares(a["rhythm"])
+    contour_shares = _shares(a["contour_ngrams"])
+    top_contours = np.argsort(contour_shares, kind="stable")[::-1][:top_k]
+
+    key_shares = _shares(a["keys"].sum(axis=1))
+
+    patterns = {}
+    for rank, (motif, count) in enumerate(_top_motifs(state, top_k), start=1):
+        steps = np.diff(motif)
+        patterns[f"corpus_motif_{rank}"] = {
+            "name": f"{name}常用动机 {rank}",
+            "sequence": _jianpu(motif),
+            "contour": "ascending" if steps.sum() > 0 else "descending" if steps.sum() < 0 else "stable",
+            "estimatedCount": count
+        }
+
+    return {
+        "meta": {
+            "version": "1.0",
+            "description": f"{name}风格画像 - 由 MIDI 语料统计生成",
+            "created_for": "Musicify 国风旋律生成 Skill",
+            "generated_at": datetime.now().isoformat(),
+            "file_count": state.file_count,
+            "failed_count": state.failed_count,
+            "note_count": state.note_count
+        },
+        "scales": scales,
+        "keys": {
+            NOTE_NAMES[root]: round(float(share), 4)
+            for root, share in sorted(enumerate(key_shares), key=lambda x: -x[1]) if share > 0
+        },
+        "degrees": {
+            str(_JIANPU[d]) if d in _JIANPU else f"#{_JIANPU[d - 1]}": round(float(degree_shares[d]), 4)
+            for d in range(12)
+        },
+        "intervals": {
+            "allowed": sorted(d for d, share in degree_totals.items() if share >= 0.01),
+            "preferred": sorted(sorted(degree_totals, key=degree_totals.get, reverse=True)[:2]),
+            "distribution": {
+                str(index - MAX_INTERVAL): round(float(share), 4)
+                for index, share in enumerate(interval_shares) if share > 0
+            },
+            "topBigrams": [
+                {
+                    "intervals": [int(i // INTERVAL_BINS) - MAX_INTERVAL, int(i % INTERVAL_BINS) - MAX_INTERVAL],
+                    "share": round(float(bigram_shares[i]), 4)
+                }
+                for i in top_bigrams if bigram_shares[i] > 0
+            ],
+            "avoidNotes": avoid_notes
+        },
+        "rhythm": {
+            "ioi_beats": {
+                str(step / RHYTHM_STEPS_PER_BEAT): round(float(share), 4)
+                for step, share in enumerate(rhythm_shares) if share > 0
+            }
+        },
+        "contour": {
+            "ngrams": {
+                _contour_label(int(code)): round(float(contour_shares[code]), 4)
+                for code in top_contours if contour_shares[code] > 0
+            }
+        },
+        "patterns": patterns
+    }
+
+
+def iter_midi_files(paths: Iterable[str]) -> Iterator[Path]:
+    """展开文件和目录（目录下递归查找 MIDI 文件，按路径排序保证分片稳定）"""
+    for path in map(Path, paths):
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob("*") if p.suffix.lower() in MIDI_SUFFIXES)
+        else:
+            yield path
+
+
+def accumulate_files(paths: Iterable[str],
+                     state: Optional[StyleAccumulator] = None,
+                     shard: int = 0,
+                     shard_count: int = 1,
+                     checkpoint=None,
+                     checkpoint_every: int = 1000) -> StyleAccumulator:
+    """
+    流式累加 MIDI 文件（只保留统计状态，不保留逐文件结果）
+
+    Args:
+        shard / shard_count: 只处理序号 % shard_count == shard 的文件，供多 worker 分片
+        checkpoint: 每处理 checkpoint_every 个文件保存一次状态
+        state: 已有状态（如从 checkpoint 恢复），从其中该分片的游标处继续；恢复时输入须与中断前相同
+
+    Raises:
+        ValueError: 状态中已有与本分片重叠的其他分片
+    """
+    state = state or StyleAccumulator()
+    shard_id = (shard, shard_count)
+    state.check_shard(shard_id)
+    cursor = state.shards.setdefault(shard_id, 0)
+    analyzer = ProfessionalMidiAnalyzer()
+    processed = 0
+
+    for index, path in enumerate(iter_midi_files(paths)):
+        if index % shard_count != shard or index < cursor:
+            continue
+        _accumulate_file(state, analyzer, path)
+        state.shards[shard_id] = index + 1
+        processed += 1
+        if checkpoint and processed % checkpoint_every == 0:
+            state.save(checkpoint)
+
+    if checkpoint:
+        state.save(checkpoint)
+    return state
+
+
+def _accumulate_file(state: StyleAccumulator, analyzer: ProfessionalMidiAnalyzer, path: Path):
+    """累加单个文件的主旋律；无法解析或没有候选音轨时计为失败"""
+    try:
+        midi_file = mido.MidiFile(path)
+        candidates = analyzer._identify_vocal_tracks(midi_file, None)
+        if not candidates:
+            state.failed_count += 1
+            return
+        notes = analyzer._extract_notes_from_track(midi_file, candidates[0].track_index)
+        state.add_notes(notes, midi_file.ticks_per_beat)
+    except Exception:
+        state.failed_count += 1
+
+
+def _parse_shard(value: str):
+    try:
+        shard, count = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("分片格式应为 i/n，例如 0/4")
+    if not 0 <= shard < count:
+        raise argparse.ArgumentTypeError("分片序号应满足 0 <= i < n")
+    return shard, count
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="MIDI 语料风格画像")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    acc = sub.add_parser("accumulate", help="流式累加 MIDI 文件到统计状态")
+    acc.add_argument("paths", nargs="+", help="MIDI 文件或目录")
+    acc.add_argument("--state", required=True, help="统计状态文件 (.npz)，已存在时从其中该分片的游标处继续累加")
+    acc.add_argument("--shard", type=_parse_shard, default=(0, 1), help="只处理第 i 个分片 (i/n)")
+    acc.add_argument("--checkpoint-every", type=int, default=1000, help="每处理 N 个文件保存一次状态")
+
+    merge = sub.add_parser("merge", help="合并多个统计状态")
+    merge.add_argument("inputs", nargs="+", help="待合并的状态文件")
+    merge.add_argument("--state", required=True, help="输出状态文件")
+
+    profile = sub.add_parser("profile", help="由统计状态生成风格画像")
+    profile.add_argument("state", help="统计状态文件")
+    profile.add_argument("--name", default="语料", help="风格名称")
+    profile.add_argument("--top", type=int, default=10, help="输出的高频项数量")
+    profile.add_argument("--output", help="画像 JSON 输出路径（默认打印）")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "accumulate":
+            state = StyleAccumulator.load(args.state) if Path(args.state).exists() else None
+            shard, shard_count = args.shard
+            state = accumulate_files(args.paths, state, shard, shard_count,
+                                     checkpoint=args.state, checkpoint_every=args.checkpoint_every)
+            output = {"status": "success", "state": args.state,
+                      "file_count": state.file_count, "failed_count": state.failed_count,
+                      "note_count": state.note_count}
+        elif args.command == "merge":
+            state = StyleAccumulator()
+            for path in args.inputs:
+                state.merge(StyleAccumulator.load(path))
+            state.save(args.state)
+            output = {"status": "success", "state": args.state, "merged": len(args.inputs),
+                      "file_count": state.file_count, "note_count": state.note_count}
+        else:
+            result = StyleAccumulator.load(args.state).profile(args.name, args.top)
+            if args.output:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    json.dump(result, f, ensure_ascii=False, indent=2)
+                output = {"status": "success", "profile": args.output}
+            else:
+                output = result
+    except (OSError, ValueError, KeyError) as e:
+        output = {"status": "error", "error": str(e)}
+        print(json.dumps(output, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
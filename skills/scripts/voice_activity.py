@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+人声活动检测 - 在分离后的人声轨上找出演唱区段，只转写这些区段
+
+分离后的人声轨在前奏、间奏和尾奏处接近静音，整段送入转写器既浪费时间，
+又会在残留的伴奏串音上产生零碎的假音符。
+
+检测使用两个逐帧特征：
+- 能量：相对全曲参考电平（有声帧能量的高分位）的 dB
+- 频谱通量：相邻帧对数幅度谱的正向增量，捕捉弱起的乐句起音
+
+用滞回门限判决（高于进入门限进入演唱，低于退出门限才退出），再对区段
+做边缘扩展、合并短间隙、丢弃过短区段。各区段并行转写，音符时间平移回原始时间轴。
+
+用法:
+    python voice_activity.py <vocals_wav>
+"""
+
+import sys
+import json
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Any, Optional
+
+import numpy as np
+
+from pitch_tracker import NoteEvents, resample, load_audio
+
+# 检测在 11025 Hz 单声道上进行：帧长约 93 ms，帧移约 23 ms
+VAD_SAMPLE_RATE = 11025
+FRAME_LENGTH = 1024
+HOP_LENGTH = 256
+BLOCK_FRAMES = 1024
+
+# 能量参考电平：全曲帧能量的该分位数
+REFERENCE_PERCENTILE = 95
+# 滞回门限（相对参考电平的 dB）
+ENTER_DB = -25.0
+EXIT_DB = -35.0
+# 能量介于两门限之间时，频谱通量超过其中位数的该倍数也进入演唱
+FLUX_ENTER_RATIO = 4.0
+# 绝对静音门限 (dBFS)，低于此值的帧一律视为静音
+SILENCE_FLOOR_DB = -65.0
+
+# 区段后处理（秒）
+PAD_SECONDS = 0.25
+MIN_GAP_SECONDS = 0.6
+MIN_REGION_SECONDS = 0.3
+
+
+@dataclass
+class VoicedRegions:
+    """演唱区段（秒，按时间排序且互不重叠）"""
+    start: np.ndarray
+    end: np.ndarray
+    duration: float
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @property
+    def voiced_seconds(self) -> float:
+        return float((self.end - self.start).sum())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "region_count": len(self),
+            "voiced_seconds": round(self.voiced_seconds, 3),
+            "voiced_ratio": round(self.voiced_seconds / self.duration, 4) if self.duration else 0.0,
+            "regions": [[round(float(s), 3), round(float(e), 3)] for s, e in zip(self.start, self.end)]
+        }
+
+
+def frame_features(samples: np.ndarray):
+    """
+    逐帧能量 (dBFS) 与频谱通量
+
+    Args:
+        samples: VAD_SAMPLE_RATE 单声道采样
+
+    Returns:
+        (energy_db, flux)
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < FRAME_LENGTH:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+    frames_view = np.lib.stride_tricks.sliding_window_view(samples, FRAME_LENGTH)[::HOP_LENGTH]
+    n_frames = len(frames_view)
+    window = np.hanning(FRAME_LENGTH).astype(np.float32)
+
+    energy_db = np.zeros(n_frames, dtype=np.float32)
+    flux = np.zeros(n_frames, dtype=np.float32)
+    previous = None
+    for start in range(0, n_frames, BLOCK_FRAMES):
+        frames = frames_view[start:start + BLOCK_FRAMES]
+        block = slice(start, start + len(frames))
+        energy_db[block] = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+        log_mag = np.log1p(np.abs(np.fft.rfft(frames * window, axis=1)))
+        # 与上一块最后一帧衔接，整体等价于一次性计算
+        if previous is not None:
+            log_mag_prev = np.vstack([previous, log_mag[:-1]])
+        else:
+            log_mag_prev = np.vstack([log_mag[:1], log_mag[:-1]])
+        flux[block] = np.maximum(log_mag - log_mag_prev, 0.0).sum(axis=1)
+        previous = log_mag[-1:]
+
+    return energy_db, flux
+
+
+def _hysteresis(enter: np.ndarray, stay: np.ndarray) -> np.ndarray:
+    """滞回判决：enter 为真时进入，stay 为假时退出，其余帧沿用前一帧状态"""
+    state = np.where(enter, 1, np.where(stay, -1, 0))
+    decided = np.where(state >= 0, np.arange(len(state)), 0)
+    np.maximum.accumulate(decided, out=decided)
+    return state[decided] == 1
+
+
+def detect_voiced_regions(samples: np.ndarray, sr: int,
+                          enter_db: float = ENTER_DB,
+                          exit_db: float = EXIT_DB,
+                          pad_seconds: float = PAD_SECONDS,
+                          min_gap_seconds: float = MIN_GAP_SECONDS,
+                          min_region_seconds: float = MIN_REGION_SECONDS) -> VoicedRegions:
+    """
+    检测演唱区段
+
+    Args:
+        samples: 单声道采样（可为 memmap 视图）
+        sr: 采样率
+        enter_db / exit_db: 相对参考电平的进入 / 退出门限 (dB)
+        pad_seconds: 区段两端扩展，保留起音前和尾音后的上下文
+        min_gap_seconds: 小于该间隙的相邻区段合并
+        min_region_seconds: 丢弃短于该时长的区段
+
+    Returns:
+        VoicedRegions（原始时间轴上的秒）
+    """
+    duration = len(samples) / sr if sr else 0.0
+    energy_db, flux = frame_features(resample(np.asarray(samples), sr, VAD_SAMPLE_RATE))
+    empty = np.zeros(0, dtype=np.float64)
+    if len(energy_db) == 0:
+        return VoicedRegions(empty, empty, duration)
+
+    reference = np.percentile(energy_db, REFERENCE_PERCENTILE)
+    audible = energy_db > SILENCE_FLOOR_DB
+    stay = audible & (energy_db >= reference + exit_db)
+    onset = flux >= FLUX_ENTER_RATIO * max(float(np.median(flux)), 1e-6)
+    enter = audible & ((energy_db >= reference + enter_db) | (stay & onset))
+    active = _hysteresis(enter, stay)
+
+    edges = np.diff(active.astype(np.int8), prepend=0, append=0)
+    first = np.flatnonzero(edges == 1)
+    last = np.flatnonzero(edges == -1) - 1
+    if len(first) == 0:
+        return VoicedRegions(empty, empty, duration)
+
+    frame_seconds = HOP_LENGTH / VAD_SAMPLE_RATE
+    start = np.maximum(first * frame_seconds - pad_seconds, 0.0)
+    end = np.minimum((last * HOP_LENGTH + FRAME_LENGTH) / VAD_SAMPLE_RATE + pad_seconds, duration)
+
+    # 合并间隙过小的相邻区段：新区段从间隙足够大的位置开始
+    opens = np.concatenate([[True], start[1:] - end[:-1] >= min_gap_seconds])
+    merged_start = start[opens]
+    merged_end = np.maximum.reduceat(end, np.flatnonzero(opens))
+
+    keep = merged_end - merged_start >= min_region_seconds
+    return VoicedRegions(merged_start[keep], merged_end[keep], duration)
+
+
+def transcribe_regions(samples: np.ndarray, sr: int, regions: VoicedRegions,
+                       transcribe: Callable[[np.ndarray, int], NoteEvents],
+                       max_workers: Optional[int] = None) -> NoteEvents:
+    """
+    并行转写各演唱区段，并将音符时间平移回原始时间轴
+
+    Args:
+        samples: 单声道采样（与 regions 同一时间轴）
+        transcribe: (区段采样, 采样率) -> NoteEvents，时间相对区段起点
+        max_workers: 并行线程数（默认按区段数和 CPU 核数）
+
+    Returns:
+        合并后按开始时间排序的 NoteEvents
+    """
+    bounds = [(float(s), int(s * sr), int(np.ceil(e * sr))) for s, e in zip(regions.start, regions.end)]
+    if not bounds:
+        return NoteEvents(start=np.zeros(0), end=np.zeros(0),
+                          pitch=np.zeros(0, dtype=np.int32), velocity=np.zeros(0, dtype=np.int32))
+
+    def run(bound):
+        offset, first, last = bound
+        return offset, transcribe(samples[first:last], sr)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(run, bounds))
+
+    start = np.concatenate([notes.start + offset for offset, notes in results])
+    order = np.argsort(start, kind='stable')
+    return NoteEvents(
+        start=start[order],
+        end=np.concatenate([notes.end + offset for offset, notes in results])[order],
+        pitch=np.concatenate([notes.pitch for _, notes in results])[order],
+        velocity=np.concatenate([notes.velocity for _, notes in results])[order]
+    )
+
+
+def write_wav(samples: np.ndarray, sr: int, wav_path) -> str:
+    """将单声道采样写为 16-bit PCM WAV（供只接受文件路径的转写器使用）"""
+    pcm16 = np.clip(np.rint(np.asarray(samples) * 32767.0), -32768, 32767).astype('<i2')
+    with wave.open(str(wav_path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        wav.writeframes(pcm16.tobytes())
+    return str(wav_path)
+
+
+def main():
+    """命令行入口"""
+    if len(sys.argv) < 2:
+        print(json.dumps({
+            "status": "error",
+            "error": "缺少参数",
+            "usage": "python voice_activity.py <vocals_wav>"
+        }, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    wav_path = sys.argv[1]
+    if not Path(wav_path).exists():
+        print(json.dumps({
+            "status": "error",
+            "error": f"输入文件不存在: {wav_path}"
+        }, ensure_ascii=False, indent=2))
+        sys.exit(1)
+
+    samples, sr = load_audio(wav_path, VAD_SAMPLE_RATE)
+    result = {"status": "success", "input_file": wav_path}
+    result.update(detect_voiced_regions(samples, sr).to_dict())
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# skills/scripts 下的脚本以同目录模块互相导入
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "skills" / "scripts"))
@@ -0,0 +1,48 @@
+import subprocess
+
+import numpy as np
+import pytest
+
+import audio_buffer
+from audio_buffer import decode_audio, open_buffer, write_buffer
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """把输入文件的字节值当作采样写到每个 f32le 输出，记录调用次数"""
+    calls = []
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        source = np.frombuffer(open(cmd[cmd.index("-i") + 1], "rb").read(), dtype=np.uint8)
+        outputs = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "f32le"]
+        for output in outputs:
+            source.astype(np.float32).tofile(output)
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    monkeypatch.setattr(audio_buffer.shutil, "which", lambda name: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(audio_buffer.subprocess, "run", run)
+    return calls
+
+
+def test_inputs_with_same_name_do_not_share_buffers(tmp_path, fake_ffmpeg):
+    for folder, content in (("a", b"\x01\x02"), ("b", b"\x03\x04\x05")):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "song.mp3").write_bytes(content)
+    cache = tmp_path / ".pcm"
+
+    first, _ = decode_audio(tmp_path / "a" / "song.mp3", cache, [(11025, 1)])
+    second, _ = decode_audio(tmp_path / "b" / "song.mp3", cache, [(11025, 1)])
+    assert first[(11025, 1)].mono().tolist() == [1, 2]
+    assert second[(11025, 1)].mono().tolist() == [3, 4, 5]
+
+    again, _ = decode_audio(tmp_path / "a" / "song.mp3", cache, [(11025, 1)])
+    assert again[(11025, 1)].path == first[(11025, 1)].path
+    assert len(fake_ffmpeg) == 2
+    assert not list(cache.glob("*.part"))
+
+
+def test_write_buffer_leaves_no_temporary_files(tmp_path):
+    pcm = write_buffer(tmp_path / "vocals.f32", np.ones((4, 2)), 44100)
+    assert open_buffer(pcm.path).frames == 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["vocals.f32", "vocals.f32.json"]
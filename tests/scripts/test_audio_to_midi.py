@@ -0,0 +1,11 @@
+import pytest
+
+from audio_to_midi import plan_resources
+
+CPU = {"device": "cpu"}
+
+
+@pytest.mark.parametrize("value, expected", [("4", 4), ("0", 1), ("-2", 1), ("", 1), ("two", 1), ("1.5", 1)])
+def test_concurrent_jobs_env_is_parsed_defensively(monkeypatch, value, expected):
+    monkeypatch.setenv("MUSICIFY_CONCURRENT_JOBS", value)
+    assert plan_resources(CPU)["concurrent_jobs"] == expected
@@ -0,0 +1,72 @@
+import pytest
+
+from checkpoint import StepManifest
+
+
+@pytest.fixture
+def song(tmp_path):
+    path = tmp_path / "song.mp3"
+    path.write_bytes(b"original audio")
+    return path
+
+
+def _separated(tmp_path, song):
+    vocals = tmp_path / "vocals.wav"
+    vocals.write_bytes(b"vocals")
+    manifest = StepManifest(tmp_path / "manifest.json", song)
+    manifest.record("separate", {"model": "htdemucs"}, {"vocals": vocals})
+    return vocals
+
+
+def test_completed_step_survives_reload(tmp_path, song):
+    vocals = _separated(tmp_path, song)
+    manifest = StepManifest(tmp_path / "manifest.json", song)
+    assert manifest.completed("separate", {"model": "htdemucs"}) == {"vocals": str(vocals)}
+    assert manifest.stale_reason is None
+
+
+def test_changed_params_invalidate_step(tmp_path, song):
+    _separated(tmp_path, song)
+    manifest = StepManifest(tmp_path / "manifest.json", song)
+    assert manifest.completed("separate", {"model": "htdemucs_ft"}) is None
+
+
+@pytest.mark.parametrize("damage", [
+    lambda path: path.unlink(),
+    lambda path: path.write_bytes(b"voc"),     # 被截断
+    lambda path: path.write_bytes(b"VOCALS"),  # 大小相同、内容被改动
+])
+def test_missing_or_modified_output_invalidates_step(tmp_path, song, damage):
+    damage(_separated(tmp_path, song))
+    manifest = StepManifest(tmp_path / "manifest.json", song)
+    assert manifest.completed("separate", {"model": "htdemucs"}) is None
+
+
+def test_changed_input_invalidates_all_steps(tmp_path, song):
+    _separated(tmp_path, song)
+    song.write_bytes(b"another song")
+    manifest = StepManifest(tmp_path / "manifest.json", song)
+    assert manifest.stale_reason == "输入文件已变化"
+    assert manifest.completed("separate", {"model": "htdemucs"}) is None
+
+
+def test_downstream_params_follow_upstream_output(tmp_path, song):
+    vocals = _separated(tmp_path, song)
+    manifest = StepManifest(tmp_path / "manifest.json", song)
+    midi = tmp_path / "song.mid"
+    midi.write_bytes(b"midi")
+    params = {"transcriber": "yin", "vocals_sha256": manifest.output_digest("separate", "vocals")}
+    manifest.record("transcribe", params, {"midi": midi})
+
+    # 重新分离得到不同的人声：转写步骤的参数随之变化而失效
+    vocals.write_bytes(b"new vocals")
+    manifest.record("separate", {"model": "htdemucs"}, {"vocals": vocals})
+    params["vocals_sha256"] = manifest.output_digest("separate", "vocals")
+    assert manifest.completed("transcribe", params) is None
+
+
+def test_invalidate_is_persisted(tmp_path, song):
+    _separated(tmp_path, song)
+    StepManifest(tmp_path / "manifest.json", song).invalidate("separate")
+    manifest = StepManifest(tmp_path / "manifest.json", song)
+    assert manifest.completed("separate", {"model": "htdemucs"}) is None
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from feature_store import FeatureStore, ragged_row
+
+
+def _result(name, contour, tracks, selected):
+    return {
+        "status": "success",
+        "file_info": {"midi_path": f"{name}.mid"},
+        "melody_features": {
+            "total_notes": len(contour) + 1, "note_range": [60, 72], "duration_beats": 8.0,
+            "rhythm_complexity": 0.5, "syncopation_level": 0.1, "stepwise_ratio": 0.6, "leap_ratio": 0.2,
+            "key_signature": "C", "scale_notes": ["C", "D", "E", "G", "A"],
+            "rhythm_patterns": {"quarter": 1.0}, "interval_distribution": {"step": 1.0},
+            "mode_analysis": {"pentatonic": 1.0}, "contour_vector": contour,
+            "phrase_structure": [[0, len(contour)]],
+        },
+        "vocal_track_analysis": {
+            "selected_track": {"track_index": selected},
+            "all_candidates": [
+                {"track_index": i, "track_name": f"{name}-{i}", "note_count": 10, "note_range": [60, 72],
+                 "confidence_score": 0.5, "reasons": ["旋律"]}
+                for i in tracks
+            ],
+        },
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FeatureStore(tmp_path / "store")
+    store.append([_result("a", [1, -1], [0, 1], 1), _result("b", [0, 0, 1], [0], 0)])
+    store.append([{"status": "error"}])
+    store.append([_result("long-name-c", [-1], [2, 3, 4], 3)])
+    return store
+
+
+def test_read_concatenates_segments_with_global_rows(store):
+    assert len(store.segments()) == 2
+    assert store.row_counts() == {"songs": 3, "candidates": 6}
+
+    songs = store.read("songs", ["midi_path", "total_notes", "contour_vector"])
+    assert songs["midi_path"].tolist() == ["a.mid", "b.mid", "long-name-c.mid"]
+    assert songs["total_notes"].tolist() == [3, 4, 2]
+    rows = [ragged_row(songs["contour_vector.values"], songs["contour_vector.offsets"], i).tolist()
+            for i in range(3)]
+    assert rows == [[1, -1], [0, 0, 1], [-1]]
+
+    candidates = store.read("candidates", ["song_row", "track_index", "selected"])
+    assert candidates["song_row"].tolist() == [0, 0, 1, 2, 2, 2]
+    assert candidates["track_index"].tolist() == [0, 1, 0, 2, 3, 4]
+    assert candidates["selected"].tolist() == [False, True, True, False, True, False]
+
+
+def test_single_segment_read_is_memory_mapped(tmp_path):
+    store = FeatureStore(tmp_path / "store")
+    store.append([_result("a", [1], [0], 0)])
+    assert isinstance(store.read("songs", ["total_notes"])["total_notes"], np.memmap)
+
+
+def test_unfinished_segments_are_ignored(store):
+    (store.root / ".tmp-partial" / "songs").mkdir(parents=True)
+    assert len(store.segments()) == 2
+    with pytest.raises(KeyError):
+        store.read("songs", ["missing_column"])
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from checkpoint import params_key
+from fingerprint import FINGERPRINT_LAYOUT, FingerprintIndex, compute_fingerprint
+
+SR = FINGERPRINT_LAYOUT[0]
+
+
+def _song(seed, seconds, note_seconds=0.2):
+    """随机和弦序列：每个音符由三个衰减的正弦分量组成"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(note_seconds * SR)) / SR
+    envelope = np.exp(-t / (note_seconds / 3))
+    notes = []
+    for _ in range(int(seconds / note_seconds)):
+        freqs = 110 * 2 ** (rng.integers(0, 48, 3) / 12)
+        notes.append(envelope * sum(np.sin(2 * np.pi * f * t) for f in freqs) / 3)
+    return np.concatenate(notes).astype(np.float32)
+
+
+def _reencode(samples, seed=1):
+    # 模拟有损重编码：增益变化加宽带噪声
+    noise = np.random.default_rng(seed).normal(0, 0.02, len(samples))
+    return (0.8 * samples + noise).astype(np.float32)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FingerprintIndex(tmp_path / "fingerprints.db")
+    vocals = tmp_path / "vocals.wav"
+    vocals.write_bytes(b"")
+    index.add(compute_fingerprint(_song(0, 30)), tmp_path / "a.mp3", vocals)
+    return index
+
+
+def test_reencoded_copy_is_reused(index):
+    match = index.match(compute_fingerprint(_reencode(_song(0, 30))))
+    assert match is not None and match["reusable"]
+
+
+def test_song_sharing_only_the_intro_is_rejected(index):
+    # 前 20% 相同、其余不同：偏移直方图有明显峰值，但远低于同一首歌的比例
+    near_miss = np.concatenate([_song(0, 30)[:6 * SR], _song(7, 30)[6 * SR:]])
+    assert index.match(compute_fingerprint(near_miss), reusable_only=False) is None
+
+
+def test_shortened_copy_is_not_reusable(index):
+    clipped = compute_fingerprint(_song(0, 30)[:27 * SR])
+    assert index.match(clipped) is None
+    match = index.match(clipped, reusable_only=False)
+    assert match is not None and match["offset_seconds"] == 0 and not match["reusable"]
+
+
+def test_midi_is_recorded_with_transcription_params(index, tmp_path):
+    track_id = index.list_tracks()[0]["id"]
+    index.set_midi(track_id, tmp_path / "a.mid", {"transcriber": "yin", "vad": False})
+
+    match = index.match(compute_fingerprint(_song(0, 30)))
+    assert match["transcriber"] == "yin"
+    assert match["transcribe_params"] == params_key({"vad": False, "transcriber": "yin"})
+    assert match["transcribe_params"] != params_key({"vad": True, "transcriber": "yin"})
@@ -0,0 +1,113 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import job_queue
+from job_queue import (CANCELLED, FAILED, MAX_ATTEMPTS, QUEUED, RUNNING, STALE_SECONDS,
+                       JobQueue, _job_command, _pid_alive, run_worker)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.db")
+
+
+def _set(queue, job_id, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with queue._connect() as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def test_claim_takes_oldest_job_first(queue, tmp_path):
+    ids = [queue.submit(tmp_path / f"{name}.mp3")["id"] for name in "abc"]
+    claimed = [queue.claim(max_jobs=3, pid=os.getpid())["id"] for _ in ids]
+    assert claimed == ids
+    assert queue.claim(max_jobs=3, pid=os.getpid()) is None
+
+
+def test_claim_respects_per_host_limit(queue, tmp_path):
+    for name in "abc":
+        queue.submit(tmp_path / f"{name}.mp3")
+    # 另一台机器上的运行中任务不占本机限额
+    other = JobQueue(queue.db_path)
+    other.host = "other-host"
+    assert other.claim(max_jobs=1, pid=1) is not None
+
+    assert queue.claim(max_jobs=1, pid=os.getpid()) is not None
+    assert queue.claim(max_jobs=1, pid=os.getpid()) is None
+    assert queue.running_count(queue.host) == 1 and queue.running_count() == 2
+
+
+def test_recover_stale_requeues_fails_or_cancels(queue, tmp_path):
+    dead_pid = _exited_pid()
+    jobs = {name: queue.submit(tmp_path / f"{name}.mp3")["id"] for name in ("retry", "exhausted", "cancelled", "alive")}
+    for job_id in jobs.values():
+        queue.claim(max_jobs=10, pid=dead_pid)
+    _set(queue, jobs["exhausted"], attempts=MAX_ATTEMPTS)
+    _set(queue, jobs["cancelled"], cancel_requested=1)
+    _set(queue, jobs["alive"], pid=os.getpid())
+
+    remote = queue.submit(tmp_path / "remote.mp3")["id"]
+    _set(queue, remote, status=RUNNING, host="other-host", heartbeat=time.time() - STALE_SECONDS - 1)
+
+    assert sorted(queue.recover_stale()) == sorted([jobs["retry"], jobs["exhausted"], jobs["cancelled"], remote])
+    assert queue.get(jobs["retry"])["status"] == QUEUED
+    assert queue.get(jobs["exhausted"])["status"] == FAILED
+    assert queue.get(jobs["cancelled"])["status"] == CANCELLED
+    assert queue.get(jobs["alive"])["status"] == RUNNING
+    assert queue.get(remote)["status"] == QUEUED
+
+
+def test_job_command_forwards_all_options():
+    job = {"input_file": "/music/song.mp3", "output_dir": None, "options": {
+        "transcriber": "yin", "analyze": True, "lyrics": "/music/song.txt", "no_midi": True,
+        "no_dedup": True, "no_vad": True, "no_resume": False, "memory_budget": None}}
+    cmd = _job_command(job)
+    assert cmd[2:] == ["/music/song.mp3", "--transcriber", "yin", "--analyze", "--no-midi",
+                       "--no-dedup", "--no-vad", "--lyrics", "/music/song.txt"]
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="需要进程组")
+def test_cancel_kills_the_whole_process_group(queue, tmp_path, monkeypatch):
+    pid_file = tmp_path / "grandchild.pid"
+    script = ("import subprocess, sys, time\n"
+              "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+              f"open({str(pid_file)!r}, 'w').write(str(child.pid))\n"
+              "time.sleep(60)\n")
+    monkeypatch.setattr(job_queue, "_job_command", lambda job: [sys.executable, "-c", script])
+    job_id = queue.submit(tmp_path / "slow.mp3")["id"]
+
+    worker = threading.Thread(target=run_worker, args=(queue, 1, 0.05, True))
+    worker.start()
+    deadline = time.time() + 20
+    while not (pid_file.exists() and pid_file.read_text()) and time.time() < deadline:
+        time.sleep(0.05)
+    grandchild = int(pid_file.read_text())
+
+    queue.cancel(job_id)
+    worker.join(20)
+    assert not worker.is_alive()
+    assert queue.get(job_id)["status"] == CANCELLED
+    deadline = time.time() + 5
+    while _pid_alive(grandchild) and not _is_zombie(grandchild) and time.time() < deadline:
+        time.sleep(0.05)
+    assert not _pid_alive(grandchild) or _is_zombie(grandchild)
+
+
+def _exited_pid():
+    import subprocess
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def _is_zombie(pid):
+    # 孙进程的父进程已被终止，回收前可能短暂处于僵尸状态
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] == "Z"
+    except OSError:
+        return False
@@ -0,0 +1,41 @@
+import json
+
+from lyrics_analyzer import analyze_lyrics_text, load_rhyme_table
+
+
+def test_bundled_table_keeps_rhyming_endings_together():
+    result = analyze_lyrics_text(
+        "[主歌]\n回到故乡\n走向远方\n岁月悠长\n不停回望\n"
+        "[副歌]\n一场梦\n在风中\n我的家\n一朵花\n"
+    )
+    assert [section["rhyme_scheme"] for section in result["sections"]] == ["AAAA", "AABB"]
+
+
+def test_groups_sharing_a_character_are_merged(tmp_path):
+    path = tmp_path / "rhymes.json"
+    path.write_text(json.dumps({"common_rhymes": {"主题": [
+        {"group": "ang", "words": ["乡", "长"]},
+        {"group": "iang", "words": ["长", "光"]},
+        {"group": "ai", "words": ["爱"]},
+    ]}}), encoding="utf-8")
+    table = load_rhyme_table(str(path))
+
+    assert table.groups == ["ang", "ai"]
+    assert {table.lookup(char) for char in "乡长光"} == {"ang"}
+    # 回退的拼音韵母映射到同一组名空间
+    assert table.group_for_final("uang") == "ang"
+    assert table.group_for_final("in") == table.group_for_final("en")
+
+
+def test_group_labels_are_normalized_to_rhyme_classes(tmp_path):
+    path = tmp_path / "rhymes.json"
+    path.write_text(json.dumps({"common_rhymes": {"主题": [
+        {"group": "eng", "words": ["风"]},
+        {"group": "ing", "words": ["情"]},
+        {"group": "ong", "words": ["中"]},
+    ]}}), encoding="utf-8")
+    table = load_rhyme_table(str(path))
+
+    assert table.groups == ["eng"]
+    assert {table.lookup(char) for char in "风情中"} == {"eng"}
+    assert table.aliases["ing"] == table.aliases["ong"] == "eng"
@@ -0,0 +1,35 @@
+import numpy as np
+
+import melody_structure
+from melody_structure import analyze_melody_structure
+
+
+def _notes(pitches):
+    return [{"pitch": int(p), "start_time": i * 480, "duration": 480} for i, p in enumerate(pitches)]
+
+
+def test_lcp_intervals_track_occurrence_bounds():
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        tokens = rng.integers(0, rng.integers(1, 4), rng.integers(2, 60))
+        sa = melody_structure.suffix_array(tokens)
+        lcp = melody_structure.lcp_array(tokens, sa)
+        for length, left, right, low, high in melody_structure._lcp_intervals(sa, lcp, 1):
+            members = sa[left:right + 1]
+            assert (low, high) == (members.min(), members.max())
+            assert all((tokens[p:p + length] == tokens[members[0]:members[0] + length]).all() for p in members)
+
+
+def test_highly_repetitive_melody_keeps_longest_section():
+    result = analyze_melody_structure(_notes([60] * 3000), 480)
+    assert [(s["length_notes"], s["count"]) for s in result["repeated_sections"]] == [(1500, 2)]
+
+
+def test_motif_nested_in_longer_repeat_is_reported():
+    rng = np.random.default_rng(0)
+    motif = [60, 62, 64, 62]
+    phrase = list(rng.integers(40, 50, 10)) + motif + list(rng.integers(80, 90, 10))
+    melody = phrase + list(rng.integers(50, 60, 6)) + phrase + motif + list(rng.integers(90, 100, 6)) + motif
+
+    motifs = analyze_melody_structure(_notes(melody), 480)["motifs"]
+    assert any(m["intervals"] == [2, 2, -2] and m["count"] == 4 for m in motifs)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from melody_windows import windowed_features
+from midi_analyzer import ProfessionalMidiAnalyzer
+
+TPB = 480
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return ProfessionalMidiAnalyzer()
+
+
+def _melody(seed, count=200):
+    rng = np.random.default_rng(seed)
+    durations = (rng.choice([0.25, 0.33, 0.5, 0.75, 1.0, 1.5, 2.0, 4.0], count) * TPB).astype(int)
+    gaps = (rng.choice([0, 0, 0.5], count) * TPB).astype(int)
+    onsets = np.concatenate([[0], np.cumsum(durations + gaps)[:-1]])
+    pitches = 60 + np.cumsum(rng.choice([-12, -5, -3, -2, -1, 0, 1, 2, 3, 5, 12], count)) % 24
+    return [{"pitch": int(p), "start_time": int(s), "duration": int(d)}
+            for p, s, d in zip(pitches, onsets, durations)]
+
+
+def _window(series, index):
+    return {
+        "key_signature": series["key_signature"][index],
+        "pentatonic_ratio": series["pentatonic_ratio"][index],
+        "note_range": series["note_range"][index],
+        "rhythm_patterns": {name: values[index] for name, values in series["rhythm_patterns"].items()},
+        "rhythm_complexity": series["rhythm_complexity"][index],
+        "syncopation_level": series["syncopation_level"][index],
+        "interval_distribution": {name: values[index] for name, values in series["interval_distribution"].items()},
+        "stepwise_ratio": series["stepwise_ratio"][index],
+        "leap_ratio": series["leap_ratio"][index],
+    }
+
+
+def _whole_song(analyzer, notes):
+    """整曲分析器的结果，按窗口输出的格式取值"""
+    features = analyzer._extract_melody_features(notes, TPB)
+    return {
+        "key_signature": features.key_signature,
+        "pentatonic_ratio": round(features.mode_analysis["pentatonic"], 4),
+        "note_range": list(features.note_range),
+        "rhythm_patterns": {name: round(value, 4) for name, value in features.rhythm_patterns.items()},
+        "rhythm_complexity": features.rhythm_complexity,
+        "syncopation_level": round(features.syncopation_level, 4),
+        "interval_distribution": {name: round(value, 4) for name, value in features.interval_distribution.items()},
+        "stepwise_ratio": round(features.stepwise_ratio, 4),
+        "leap_ratio": round(features.leap_ratio, 4),
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_window_covering_song_matches_whole_song_analysis(analyzer, seed):
+    notes = _melody(seed)
+    series = windowed_features(notes, TPB, analyzer.pentatonic_scales, window_beats=10_000)
+    assert series["window_count"] == 1
+    assert _window(series, 0) == _whole_song(analyzer, notes)
+
+
+def test_each_window_matches_analysis_of_its_notes(analyzer):
+    notes = _melody(7)
+    series = windowed_features(notes, TPB, analyzer.pentatonic_scales, window_beats=16, hop_beats=4)
+    assert series["window_count"] > 10
+
+    for index, start in enumerate(series["start_beat"]):
+        inside = [n for n in notes if start * TPB <= n["start_time"] < (start + 16) * TPB]
+        assert series["note_count"][index] == len(inside)
+        if len(inside) >= 2:
+            assert _window(series, index) == _whole_song(analyzer, inside)
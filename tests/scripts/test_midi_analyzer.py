@@ -0,0 +1,38 @@
+import mido
+import numpy as np
+import pytest
+
+from midi_analyzer import ProfessionalMidiAnalyzer
+
+
+@pytest.fixture
+def many_tracks(tmp_path):
+    rng = np.random.default_rng(0)
+    midi = mido.MidiFile(ticks_per_beat=480)
+    for index in range(12):
+        track = mido.MidiTrack()
+        track.append(mido.MetaMessage("track_name", name=f"track {index}"))
+        # 各音轨音域和音符数不同，得分各不相同；第 5 轨为空
+        for pitch in ([] if index == 5 else 30 + 5 * index + rng.integers(0, 12, 20 + 7 * index)):
+            track.append(mido.Message("note_on", note=int(pitch), velocity=80, time=0))
+            track.append(mido.Message("note_off", note=int(pitch), velocity=0, time=int(rng.choice([240, 480]))))
+        midi.tracks.append(track)
+    path = tmp_path / "many.mid"
+    midi.save(str(path))
+    return str(path)
+
+
+def test_parallel_track_scoring_matches_serial(many_tracks):
+    midi_file = mido.MidiFile(many_tracks)
+    serial = ProfessionalMidiAnalyzer(workers=1)._identify_vocal_tracks(midi_file, None)
+    parallel = ProfessionalMidiAnalyzer(workers=3, parallel_track_threshold=4)._identify_vocal_tracks(midi_file, None)
+
+    assert len(serial) == 11
+    assert parallel == serial
+
+
+def test_parallel_analysis_result_matches_serial(many_tracks):
+    serial = ProfessionalMidiAnalyzer(workers=1).analyze_midi_file(many_tracks)
+    parallel = ProfessionalMidiAnalyzer(workers=3, parallel_track_threshold=4).analyze_midi_file(many_tracks)
+    assert serial["status"] == "success"
+    assert parallel == serial
@@ -0,0 +1,36 @@
+import mido
+import numpy as np
+
+from midi_writer import encode_midi, encode_midi_batch, write_midi
+
+
+def _note_events(midi):
+    return [(msg.type, msg.note) for track in midi.tracks for msg in track
+            if msg.type in ("note_on", "note_off")]
+
+
+def test_empty_note_list_round_trips(tmp_path):
+    path = write_midi(tmp_path / "empty.mid", [], [], [])
+    midi = mido.MidiFile(path)
+
+    assert midi.type == 1
+    assert len(midi.tracks) == 2
+    assert _note_events(midi) == []
+    assert midi.tracks[1][-1].type == "end_of_track"
+
+
+def test_empty_batch_and_empty_variant():
+    assert encode_midi_batch([]) == []
+
+    empty, melody = encode_midi_batch([
+        {"pitch": [], "start": [], "duration": []},
+        {"pitch": [60, 62], "start": [0, 1], "duration": [1, 1]},
+    ])
+    assert empty == encode_midi([], [], [])
+    assert melody == encode_midi([60, 62], [0, 1], [1, 1])
+
+
+def test_notes_round_trip(tmp_path):
+    path = write_midi(tmp_path / "melody.mid", np.array([60, 64, 67]), [0, 1, 2], [1, 1, 2])
+    events = _note_events(mido.MidiFile(path))
+    assert [note for kind, note in events if kind == "note_on"] == [60, 64, 67]
@@ -0,0 +1,16 @@
+import numpy as np
+
+from pitch_tracker import PitchTrack, segment_notes
+
+
+def test_velocity_ignores_frames_between_notes():
+    # 两个音符之间是响亮的无声帧（气声、串音），不应计入前一个音符的力度
+    voiced = np.r_[np.ones(20), np.zeros(20), np.ones(20)].astype(bool)
+    f0 = np.where(voiced, 220.0, 0.0).astype(np.float32)
+    rms = np.where(voiced, 0.1, 1.0).astype(np.float32)
+    track = PitchTrack(times=np.arange(60) * 0.01, f0=f0, voiced=voiced,
+                       voiced_prob=voiced.astype(np.float32), rms=rms, hop_seconds=0.01)
+
+    notes = segment_notes(track)
+    assert len(notes) == 2
+    assert notes.velocity.tolist() == [80, 80]
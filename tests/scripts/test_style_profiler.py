@@ -0,0 +1,77 @@
+import mido
+import numpy as np
+import pytest
+
+from midi_writer import write_midi
+from style_profiler import StyleAccumulator, accumulate_files
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = np.random.default_rng(0)
+    folder = tmp_path / "corpus"
+    folder.mkdir()
+    for i in range(6):
+        n = 40
+        write_midi(str(folder / f"s{i}.mid"), rng.integers(60, 76, n),
+                   np.cumsum(rng.choice([0.5, 1.0], n)), np.full(n, 0.5))
+    return folder
+
+
+def _same(a, b):
+    return a.file_count == b.file_count and all(np.array_equal(a.arrays[k], b.arrays[k]) for k in a.arrays)
+
+
+def test_resume_continues_from_shard_cursor(corpus, tmp_path, monkeypatch):
+    state_path = str(tmp_path / "state.npz")
+    full = accumulate_files([str(corpus)])
+
+    # 第 4 个文件处理时中断，checkpoint 中保留前 2 个文件的统计
+    original = StyleAccumulator.add_notes
+    calls = []
+
+    def interrupted(self, notes, ticks_per_beat):
+        calls.append(1)
+        if len(calls) == 4:
+            raise KeyboardInterrupt
+        original(self, notes, ticks_per_beat)
+
+    monkeypatch.setattr(StyleAccumulator, "add_notes", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        accumulate_files([str(corpus)], checkpoint=state_path, checkpoint_every=2)
+    monkeypatch.setattr(StyleAccumulator, "add_notes", original)
+
+    partial = StyleAccumulator.load(state_path)
+    assert partial.file_count == 2 and partial.shards == {(0, 1): 2}
+    resumed = accumulate_files([str(corpus)], partial, checkpoint=state_path)
+    assert _same(full, resumed)
+
+    again = accumulate_files([str(corpus)], StyleAccumulator.load(state_path))
+    assert _same(full, again)
+
+
+def test_checkpoint_counts_files_without_melody(corpus, tmp_path, monkeypatch):
+    # 没有音符的 MIDI 没有候选音轨，同样计入 checkpoint 间隔
+    empty = mido.MidiFile()
+    empty.tracks.append(mido.MidiTrack())
+    empty.save(str(corpus / "empty.mid"))
+    saves = []
+    monkeypatch.setattr(StyleAccumulator, "save", lambda self, path: saves.append(self.shards[(0, 1)]))
+
+    state = accumulate_files([str(corpus)], checkpoint=str(tmp_path / "state.npz"), checkpoint_every=2)
+    assert state.failed_count == 1
+    assert saves == [2, 4, 6, 7]
+
+
+def test_merge_rejects_overlapping_states(corpus):
+    shards = [accumulate_files([str(corpus)], shard=i, shard_count=2) for i in range(2)]
+    merged = StyleAccumulator().merge(shards[0]).merge(shards[1])
+    assert _same(accumulate_files([str(corpus)]), merged)
+
+    with pytest.raises(ValueError):
+        merged.merge(shards[0])
+    # 0/4 的文件都属于 0/2
+    with pytest.raises(ValueError):
+        StyleAccumulator().merge(shards[0]).merge(accumulate_files([str(corpus)], shard=0, shard_count=4))
+    with pytest.raises(ValueError):
+        accumulate_files([str(corpus)], shards[1], shard=1, shard_count=1)
@@ -0,0 +1,53 @@
+import numpy as np
+
+import audio_to_midi
+from pitch_tracker import NoteEvents
+from voice_activity import VoicedRegions, detect_voiced_regions, transcribe_regions
+
+
+def _tone(seconds, sr, freq=220.0):
+    t = np.arange(int(seconds * sr)) / sr
+    return (0.5 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def test_regions_cover_sung_parts_only():
+    sr = 11025
+    samples = np.concatenate([np.zeros(2 * sr, np.float32), _tone(3, sr),
+                              np.zeros(3 * sr, np.float32), _tone(2, sr), np.zeros(sr, np.float32)])
+    regions = detect_voiced_regions(samples, sr)
+
+    # 区段覆盖演唱部分，两端只多出边缘扩展和一帧长度
+    assert len(regions) == 2
+    assert np.all((regions.start <= [2.0, 8.0]) & (regions.start >= [1.5, 7.5]))
+    assert np.all((regions.end >= [5.0, 10.0]) & (regions.end <= [5.5, 10.5]))
+
+
+def test_region_notes_are_shifted_to_song_time():
+    sr = 100
+    samples = np.zeros(20 * sr, np.float32)
+    regions = VoicedRegions(start=np.array([2.0, 10.5]), end=np.array([4.0, 12.0]), duration=20.0)
+    seen = []
+
+    def transcribe(segment, rate):
+        # 每个区段在其相对时间 0.5 秒处产生一个音符
+        seen.append(len(segment))
+        return NoteEvents(start=np.array([0.5]), end=np.array([1.0]),
+                          pitch=np.array([60 + len(seen)]), velocity=np.array([90]))
+
+    notes = transcribe_regions(samples, sr, regions, transcribe, max_workers=1)
+
+    assert sorted(seen) == [150, 200]
+    assert notes.start.tolist() == [2.5, 11.0]
+    assert notes.end.tolist() == [3.0, 11.5]
+
+
+def test_worker_start_failure_is_returned_as_error(monkeypatch):
+    class BrokenContext:
+        def Pool(self, processes):
+            raise ValueError("cannot find context for 'fork'")
+
+    monkeypatch.setattr("multiprocessing.get_context", lambda method=None: BrokenContext())
+    notes, regions, error = audio_to_midi._transcribe_in_worker("vocals.wav", "basic_pitch", True, 1, 10)
+
+    assert notes is None and regions is None
+    assert "fork" in error